@@ -3,7 +3,8 @@ import string
 import emoji
 import nltk
 import os
-from typing import List
+import threading
+from typing import Iterator, List
 
 # --- Configuration et Téléchargement des Ressources NLTK ---
 # Définir un chemin pour les données NLTK.
@@ -108,3 +109,151 @@ class TextPipeline:
             # Relance l'exception pour permettre une gestion d'erreur supérieure
             raise
 
+
+# --- Moteur de nettoyage rapide ---
+
+def _clean_block(text: str):
+    """Nettoie un bloc dans un processus du pool (voir FastTextPipeline.process_parallel)."""
+    tokens = FastTextPipeline.shared()._clean_tokens(text)
+    return bool(tokens), " ".join(tokens)
+
+
+class FastTextPipeline:
+    """
+    Même sortie que TextPipeline(TextCleaner()).process, en une fraction du temps :
+      - minuscules, puis ponctuation ASCII et chiffres supprimés en une passe : str.translate
+        sur le texte ASCII, une regex précompilée (chiffres Unicode inclus) sinon ;
+      - tokenisation NLTK reproduite par des regex précompilées : une fois la ponctuation ASCII
+        retirée, word_tokenize ne fait plus que séparer les guillemets/tirets Unicode
+        et quelques contractions (« cannot » -> « can not ») avant un split sur les espaces ;
+      - filtrage des stop words sur un set ; suppression des emojis uniquement sur les tokens
+        non ASCII (mémoïsée), aucun emoji ne contenant d'espace.
+    Construit une fois par processus (shared()). Si la version de NLTK ne donne plus le même
+    résultat sur l'échantillon de contrôle, process délègue au pipeline NLTK d'origine.
+    """
+
+    # Ponctuation ASCII et chiffres Unicode (\d), supprimés d'un coup sur le texte non ASCII
+    DELETED = re.compile("[" + re.escape(string.punctuation) + r"\d]+")
+    # Caractères isolés par NLTKWordTokenizer qui survivent à la suppression de la ponctuation ASCII
+    UNICODE_SPLIT = re.compile("[«“‘„»”’‒-―]")
+    # Contractions sans apostrophe découpées par NLTK (MacIntyreContractions.CONTRACTIONS2)
+    CONTRACTIONS = [
+        (keyword, re.compile(pattern))
+        for keyword, pattern in (
+            ("cannot", r"(?i)\b(can)(?#X)(not)\b"),
+            ("gimme", r"(?i)\b(gim)(?#X)(me)\b"),
+            ("gonna", r"(?i)\b(gon)(?#X)(na)\b"),
+            ("gotta", r"(?i)\b(got)(?#X)(ta)\b"),
+            ("lemme", r"(?i)\b(lem)(?#X)(me)\b"),
+            ("wanna", r"(?i)\b(wan)(?#X)(na)(?=\s)"),
+        )
+    ]
+    WHITESPACE = re.compile(r"\s")
+    SELF_CHECK_SAMPLE = ("Le « cours » d'Algorithmique 2024 — TD n°3 : « Cannot » wanna gonna… "
+                         "L’étudiant(e) doit rendre 12 exercices 😊 avant le 15/06 ! Les données‑test ✅.")
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cleaner: TextCleaner = None):
+        self.cleaner = cleaner or TextCleaner()
+        self.stop_words = frozenset(self.cleaner.stop_words)
+        self.ascii_delete_table = str.maketrans("", "", string.punctuation + string.digits)
+        self._emoji_free = {}
+        self.reference = TextPipeline(self.cleaner)
+        self.uses_fallback = " ".join(self._clean_tokens(self.SELF_CHECK_SAMPLE)).strip() != \
+            self.reference.process(self.SELF_CHECK_SAMPLE)
+        if self.uses_fallback:
+            print("FastTextPipeline : résultat différent du pipeline NLTK, utilisation du pipeline NLTK.")
+
+    @classmethod
+    def shared(cls):
+        """Instance unique par processus (stop words et tables construits une seule fois)."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _without_emojis(self, token: str) -> str:
+        cleaned = self._emoji_free.get(token)
+        if cleaned is None:
+            cleaned = self.cleaner.remove_emojis(token)
+            if len(self._emoji_free) < 100000:
+                self._emoji_free[token] = cleaned
+        return cleaned
+
+    def _clean_tokens(self, text: str) -> List[str]:
+        """Tokens nettoyés (un token réduit à un emoji devient une chaîne vide, comme dans le pipeline NLTK)."""
+        text = text.lower()
+        if text.isascii():
+            text = text.translate(self.ascii_delete_table)
+        else:
+            text = self.UNICODE_SPLIT.sub(r" \g<0> ", self.DELETED.sub("", text))
+        padded = None
+        for keyword, pattern in self.CONTRACTIONS:
+            if keyword in text:
+                padded = pattern.sub(r" \1 \2 ", padded or " " + text + " ")
+        tokens = (padded or text).split()
+        stop_words = self.stop_words
+        return [
+            token if token.isascii() else self._without_emojis(token)
+            for token in tokens if token not in stop_words
+        ]
+
+    def process(self, text: str) -> str:
+        """Applique le nettoyage (même résultat que TextPipeline.process)."""
+        if self.uses_fallback:
+            return self.reference.process(text)
+        try:
+            return " ".join(self._clean_tokens(text)).strip()
+        except Exception as e:
+            print(f"Erreur dans le pipeline de nettoyage : {str(e)}")
+            raise
+
+    def process_stream(self, segments) -> Iterator[str]:
+        """
+        Nettoyage en flux de segments coupés sur un espace (aucun token à cheval sur deux segments).
+        La concaténation des morceaux produits est process("".join(segments)) : un token réduit à
+        une chaîne vide (emoji) garde son espace dans le texte complet, on reporte donc au segment
+        suivant les tokens vides de fin de segment au lieu de les perdre au strip.
+        """
+        if self.uses_fallback:
+            # Le pipeline NLTK ne donne pas ses tokens : nettoyage du texte complet
+            yield self.process("".join(segments))
+            return
+        started = False
+        pending = 0  # tokens vides depuis le dernier token non vide
+        for segment in segments:
+            tokens = self._clean_tokens(segment)
+            first = next((i for i, token in enumerate(tokens) if token), None)
+            if first is None:
+                pending += len(tokens)
+                continue
+            last = len(tokens) - 1 - next(i for i, token in enumerate(reversed(tokens)) if token)
+            separator = " " * (pending + first + 1) if started else ""
+            yield separator + " ".join(tokens[first:last + 1])
+            started = True
+            pending = len(tokens) - 1 - last
+
+    @staticmethod
+    def split_blocks(text: str, block_chars: int) -> List[str]:
+        """Découpe text en blocs d'environ block_chars caractères, coupés sur un espace."""
+        blocks, start = [], 0
+        while start < len(text):
+            end = start + block_chars
+            if end < len(text):
+                match = FastTextPipeline.WHITESPACE.search(text, end)
+                end = match.end() if match else len(text)
+            blocks.append(text[start:end])
+            start = end
+        return blocks
+
+    def process_parallel(self, text: str, executor=None, block_chars: int = 1 << 20) -> str:
+        """
+        Nettoyage par blocs, en parallèle dans `executor` (ProcessPoolExecutor) s'il est fourni.
+        Les blocs sont coupés sur un espace, aucun token n'est donc coupé : même résultat que process.
+        """
+        if self.uses_fallback or executor is None or len(text) <= block_chars:
+            return self.process(text)
+        cleaned_blocks = executor.map(_clean_block, self.split_blocks(text, block_chars))
+        return " ".join(block for has_tokens, block in cleaned_blocks if has_tokens).strip()
@@ -0,0 +1,288 @@
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+
+class ChunkDedupIndex:
+    """
+    Index de déduplication des chunks entre documents.
+
+    - Doublons exacts : SHA-1 du texte du chunk (espaces normalisés).
+    - Quasi-doublons : signature MinHash (num_perm permutations) des 3-grammes de mots,
+      indexée par LSH en `bands` bandes ; un candidat est confirmé si la similarité de
+      Jaccard estimée (part des minima égaux) atteint `threshold`.
+
+    Seul un doublon exact réutilise l'ID Faiss (et donc le texte) du chunk existant. Un
+    quasi-doublon reste un nouveau chunk, avec son propre texte et son propre ID : seul
+    son vecteur est recopié depuis le chunk existant, sans encodage.
+
+    La déduplication est limitée au locataire (departement_id, filiere_id) : un vecteur
+    réutilisé appartient déjà à la partition du locataire (ShardedIndex, ChunkStore).
+
+    Les empreintes sont persistées dans la table `chunk_fingerprints` (une ligne par ID Faiss,
+    écrite dans la même transaction que document_metadata) et chargées en mémoire au premier
+    usage ; à la création de la table, elles sont calculées pour les chunks déjà indexés.
+    Les empreintes dépendent uniquement du texte (CRC32 et permutations à graine fixe) :
+    elles restent valides d'un processus à l'autre.
+    """
+
+    TABLE = "chunk_fingerprints"
+    SHINGLE_SIZE = 3
+
+    def __init__(self, db_path, num_perm=128, bands=16, threshold=0.85, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands.")
+        self.db_path = db_path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # Hachage universel multiply-shift : h(x) = (a * x + b) >> 32 sur 64 bits (a impair)
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._tenants = {}     # (departement_id, filiere_id) -> (empreintes exactes, buckets LSH)
+        self._signatures = {}  # ID Faiss -> signature MinHash
+        self._keys = {}        # ID Faiss -> (locataire, empreinte exacte)
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # --- Empreintes ---
+
+    @staticmethod
+    def chunk_hash(text):
+        return hashlib.sha1(" ".join(text.split()).encode('utf-8')).hexdigest()
+
+    def signature(self, text):
+        """Signature MinHash (uint32, num_perm valeurs), ou None si le chunk a moins de 3 mots."""
+        words = text.split()
+        if len(words) < self.SHINGLE_SIZE:
+            return None
+        shingles = np.fromiter(
+            {zlib.crc32(" ".join(words[i:i + self.SHINGLE_SIZE]).encode('utf-8'))
+             for i in range(len(words) - self.SHINGLE_SIZE + 1)},
+            dtype=np.uint64
+        )
+        with np.errstate(over='ignore'):
+            hashed = (self._a[:, np.newaxis] * shingles[np.newaxis, :] + self._b[:, np.newaxis]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [band.tobytes() for band in signature.reshape(self.bands, self.rows)]
+
+    def similarity(self, signature_a, signature_b):
+        """Similarité de Jaccard estimée entre deux signatures."""
+        return float(np.mean(signature_a == signature_b))
+
+    # --- Chargement ---
+
+    def ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.TABLE,))
+                exists = cursor.fetchone() is not None
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                    "faiss_id INTEGER PRIMARY KEY, departement_id INTEGER, filiere_id INTEGER, "
+                    "chunk_hash TEXT NOT NULL, signature BLOB)"
+                )
+                if not exists:
+                    # Première utilisation : empreintes des chunks déjà indexés (un texte par ID Faiss)
+                    rows = cursor.execute(
+                        "SELECT chunk_index, MIN(departement_id), MIN(filiere_id), MIN(chunk_text) "
+                        "FROM document_metadata GROUP BY chunk_index"
+                    ).fetchall()
+                    print(f"Calcul des empreintes de déduplication pour {len(rows)} chunks existants...")
+                    cursor.executemany(
+                        f"INSERT OR REPLACE INTO {self.TABLE} "
+                        "(faiss_id, departement_id, filiere_id, chunk_hash, signature) VALUES (?, ?, ?, ?, ?)",
+                        [(int(faiss_id), departement_id, filiere_id) + self.fingerprint(text)
+                         for faiss_id, departement_id, filiere_id, text in rows if text]
+                    )
+                conn.commit()
+                for faiss_id, departement_id, filiere_id, chunk_hash, blob in cursor.execute(
+                        f"SELECT faiss_id, departement_id, filiere_id, chunk_hash, signature FROM {self.TABLE} "
+                        "ORDER BY faiss_id"):
+                    signature = np.frombuffer(blob, dtype=np.uint32) if blob else None
+                    self._remember((departement_id, filiere_id), faiss_id, chunk_hash, signature)
+            finally:
+                conn.close()
+            self._loaded = True
+
+    def fingerprint(self, text):
+        """(chunk_hash, signature sérialisée) d'un chunk, tels que stockés dans la table."""
+        signature = self.signature(text)
+        return self.chunk_hash(text), signature.tobytes() if signature is not None else None
+
+    def _tenant(self, tenant):
+        if tenant not in self._tenants:
+            self._tenants[tenant] = ({}, [{} for _ in range(self.bands)])
+        return self._tenants[tenant]
+
+    def _remember(self, tenant, faiss_id, chunk_hash, signature):
+        exact, buckets = self._tenant(tenant)
+        exact.setdefault(chunk_hash, faiss_id)
+        self._keys[faiss_id] = (tenant, chunk_hash)
+        if signature is not None:
+            self._signatures[faiss_id] = signature
+            for band, key in enumerate(self._band_keys(signature)):
+                buckets[band].setdefault(key, []).append(faiss_id)
+
+    def _near(self, signature, buckets, signatures):
+        """Premier candidat LSH dont la similarité estimée atteint le seuil, ou None."""
+        seen = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            for candidate in buckets[band].get(key, ()):
+                if candidate in seen or candidate not in signatures:  # absent : chunk supprimé
+                    continue
+                seen.add(candidate)
+                if self.similarity(signature, signatures[candidate]) >= self.threshold:
+                    return candidate
+        return None
+
+    # --- Ingestion ---
+
+    def plan(self, documents, departement_id=None, filiere_id=None, use_near_duplicates=True):
+        """
+        Prépare l'ingestion d'un lot pour un locataire : pour chaque document (dict avec "chunks"), ajoute
+          - "reuse" : np.array int64, un élément par chunk : ID Faiss d'un doublon exact déjà indexé (>= 0),
+            -1 pour un nouveau chunk, ou -(p + 2) s'il est identique au p-ième nouveau chunk du lot ;
+          - "new_chunks" : textes des nouveaux chunks (un ID Faiss chacun), dans l'ordre ;
+          - "vector_sources" : np.array int64, un élément par nouveau chunk : ID Faiss du quasi-doublon
+            dont le vecteur est recopié (>= 0), -(p + 2) pour le vecteur du p-ième nouveau chunk du lot,
+            ou -1 si le chunk doit être encodé ;
+          - "to_encode" : textes des nouveaux chunks à encoder (vector_sources == -1), dans l'ordre ;
+          - "fingerprints" : (chunk_hash, signature) de chaque nouveau chunk.
+        Retourne le nombre de chunks (doublons exacts réutilisés, quasi-doublons au vecteur recopié).
+        """
+        self.ensure_loaded()
+        pending_exact, pending_signatures = {}, {}
+        pending_buckets = [{} for _ in range(self.bands)]
+        exact_count = near_count = 0
+        position = 0
+        with self._lock:
+            exact, buckets = self._tenant((departement_id, filiere_id))
+            for document in documents:
+                reuse = np.full(len(document["chunks"]), -1, dtype='int64')
+                sources = []
+                document["new_chunks"], document["to_encode"], document["fingerprints"] = [], [], []
+                for i, chunk in enumerate(document["chunks"]):
+                    chunk_hash = self.chunk_hash(chunk)
+                    if chunk_hash in exact:
+                        reuse[i] = exact[chunk_hash]
+                        exact_count += 1
+                        continue
+                    if chunk_hash in pending_exact:
+                        reuse[i] = -(pending_exact[chunk_hash] + 2)
+                        exact_count += 1
+                        continue
+                    signature = self.signature(chunk)
+                    source = -1
+                    if use_near_duplicates and signature is not None:
+                        match = self._near(signature, buckets, self._signatures)
+                        if match is None:
+                            match = self._near(signature, pending_buckets, pending_signatures)
+                            match = None if match is None else -(match + 2)
+                        if match is not None:
+                            source = match
+                            near_count += 1
+                    # Nouveau chunk : visible par les chunks suivants du lot
+                    pending_exact[chunk_hash] = position
+                    if signature is not None:
+                        pending_signatures[position] = signature
+                        for band, key in enumerate(self._band_keys(signature)):
+                            pending_buckets[band].setdefault(key, []).append(position)
+                    document["new_chunks"].append(chunk)
+                    document["fingerprints"].append((chunk_hash, signature))
+                    if source == -1:
+                        document["to_encode"].append(chunk)
+                    sources.append(source)
+                    position += 1
+                document["reuse"] = reuse
+                document["vector_sources"] = np.array(sources, dtype='int64')
+        return exact_count, near_count
+
+    def insert(self, conn, faiss_ids, fingerprints, departement_id=None, filiere_id=None):
+        """Persiste les empreintes des nouveaux chunks (dans la transaction de `conn`)."""
+        self.ensure_loaded()
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {self.TABLE} "
+            "(faiss_id, departement_id, filiere_id, chunk_hash, signature) VALUES (?, ?, ?, ?, ?)",
+            [(int(faiss_id), departement_id, filiere_id, chunk_hash,
+              signature.tobytes() if signature is not None else None)
+             for faiss_id, (chunk_hash, signature) in zip(faiss_ids, fingerprints)]
+        )
+
+    def add(self, faiss_ids, fingerprints, departement_id=None, filiere_id=None):
+        """Enregistre en mémoire les empreintes persistées par insert, une fois la transaction validée."""
+        with self._lock:
+            for faiss_id, (chunk_hash, signature) in zip(faiss_ids, fingerprints):
+                self._remember((departement_id, filiere_id), int(faiss_id), chunk_hash, signature)
+
+    def delete(self, conn, faiss_ids):
+        """Supprime les empreintes de chunks supprimés (dans la transaction de `conn`)."""
+        self.ensure_loaded()
+        conn.executemany(f"DELETE FROM {self.TABLE} WHERE faiss_id = ?", [(int(faiss_id),) for faiss_id in faiss_ids])
+
+    def forget(self, faiss_ids):
+        """Retire de la mémoire les chunks supprimés par delete, une fois la transaction validée."""
+        with self._lock:
+            for faiss_id in faiss_ids:
+                faiss_id = int(faiss_id)
+                self._signatures.pop(faiss_id, None)
+                key = self._keys.pop(faiss_id, None)
+                if key is not None:
+                    exact, _ = self._tenant(key[0])
+                    if exact.get(key[1]) == faiss_id:
+                        del exact[key[1]]
+
+    def remap(self, conn, live_ids):
+        """
+        Renumérote les empreintes après compaction (dans la transaction de `conn`) :
+        live_ids[i] (trié) devient i. Appeler reset une fois la transaction validée.
+        """
+        self.ensure_loaded()
+        live_ids = np.asarray(live_ids, dtype='int64')
+        rows = conn.execute(
+            f"SELECT faiss_id, departement_id, filiere_id, chunk_hash, signature FROM {self.TABLE}"
+        ).fetchall()
+        positions = np.searchsorted(live_ids, [row[0] for row in rows]).tolist()
+        conn.execute(f"DELETE FROM {self.TABLE}")
+        conn.executemany(
+            f"INSERT INTO {self.TABLE} (faiss_id, departement_id, filiere_id, chunk_hash, signature) VALUES (?, ?, ?, ?, ?)",
+            [(position,) + tuple(row[1:]) for row, position in zip(rows, positions)
+             if position < len(live_ids) and live_ids[position] == row[0]]
+        )
+
+    def reset(self):
+        """Oublie les empreintes en mémoire (rechargées depuis SQLite au prochain usage)."""
+        with self._lock:
+            self._tenants, self._signatures, self._keys = {}, {}, {}
+            self._loaded = False
+
+    def clear(self):
+        """Supprime toutes les empreintes (réinitialisation de la base vectorielle)."""
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+                conn.commit()
+            finally:
+                conn.close()
+            self.reset()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks": sum(len(exact) for exact, _ in self._tenants.values()),
+                "signatures": len(self._signatures),
+                "tenants": len(self._tenants),
+                "loaded": self._loaded,
+            }
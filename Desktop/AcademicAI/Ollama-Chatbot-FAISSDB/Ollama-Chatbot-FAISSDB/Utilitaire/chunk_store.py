@@ -0,0 +1,269 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+
+class ChunkStore:
+    """
+    Stockage colonnaire des métadonnées de chunks, adressé directement par ID Faiss.
+
+    L'ID Faiss global d'un chunk est sa position dans le store : l'accès au texte
+    ou aux filtres d'un résultat de recherche est en O(1), sans parcourir de liste
+    de dictionnaires. Les textes sont concaténés (UTF-8) dans un seul buffer,
+    indexé par une table d'offsets.
+
+    Sur disque (`save_dir` / `open_dir`), chaque colonne est un fichier .npy et
+    les textes un fichier binaire brut : ils sont projetés en mémoire (mmap),
+    l'ouverture est en temps constant et les pages sont partagées entre workers
+    par le cache de l'OS. Le premier ajout recopie les colonnes en mémoire.
+    """
+
+    INT_COLUMNS = ("departement_id", "filiere_id", "module_id", "activite_id", "profile_id", "user_id")
+    MISSING = -1  # Représentation de None dans les colonnes entières
+    CURRENT_FILE = "CURRENT"  # Nom de la génération valide dans le répertoire du store
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._columns = {name: np.empty(capacity, dtype='int64') for name in self.INT_COLUMNS}
+        self._document_ids = np.empty(capacity, dtype='int32')
+        self._text_offsets = np.zeros(capacity + 1, dtype='int64')
+        self._text_buffer = bytearray()
+        self.documents = []        # document_id -> (file_hash, original_filename)
+        self._document_lookup = {}  # file_hash -> document_id
+
+    def __len__(self):
+        return self._size
+
+    # --- Écriture ---
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = self._document_ids.shape[0]
+        # Store projeté en mémoire (lecture seule) : copie avant la première écriture, même
+        # vide (une affectation, même de zéro élément, échoue sur une colonne projetée).
+        mapped = not self._document_ids.flags.writeable
+        if mapped:
+            self._text_buffer = bytearray(self._text_buffer)
+        elif needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1)
+        for name, column in self._columns.items():
+            grown = np.empty(new_capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+        grown_documents = np.empty(new_capacity, dtype='int32')
+        grown_documents[:self._size] = self._document_ids[:self._size]
+        self._document_ids = grown_documents
+        grown_offsets = np.zeros(new_capacity + 1, dtype='int64')
+        grown_offsets[:self._size + 1] = self._text_offsets[:self._size + 1]
+        self._text_offsets = grown_offsets
+
+    def _document_id(self, file_hash, original_filename):
+        document_id = self._document_lookup.get(file_hash)
+        if document_id is None:
+            document_id = len(self.documents)
+            self.documents.append((file_hash, original_filename))
+            self._document_lookup[file_hash] = document_id
+        return document_id
+
+    def append_chunks(self, file_hash, original_filename, chunk_texts, **filters):
+        """
+        Ajoute les chunks d'un document. Retourne l'ID Faiss du premier chunk
+        (les suivants sont consécutifs), qui doit correspondre à index.ntotal avant l'ajout.
+        """
+        start = self._size
+        count = len(chunk_texts)
+        self._reserve(count)
+        for name in self.INT_COLUMNS:
+            value = filters.get(name)
+            self._columns[name][start:start + count] = self.MISSING if value is None else value
+        self._document_ids[start:start + count] = self._document_id(file_hash, original_filename)
+        offset = int(self._text_offsets[start])
+        for i, text in enumerate(chunk_texts):
+            encoded = text.encode('utf-8')
+            self._text_buffer += encoded
+            offset += len(encoded)
+            self._text_offsets[start + i + 1] = offset
+        self._size += count
+        return start
+
+    # --- Lecture ---
+    def get_text(self, faiss_id):
+        if not 0 <= faiss_id < self._size:
+            return None
+        begin, end = self._text_offsets[faiss_id], self._text_offsets[faiss_id + 1]
+        return bytes(self._text_buffer[begin:end]).decode('utf-8')
+
+    def _value(self, name, faiss_id):
+        value = int(self._columns[name][faiss_id])
+        return None if value == self.MISSING else value
+
+    def get_record(self, faiss_id):
+        """Retourne les métadonnées d'un chunk sous forme de dictionnaire (format historique)."""
+        if not 0 <= faiss_id < self._size:
+            return None
+        file_hash, original_filename = self.documents[self._document_ids[faiss_id]]
+        record = {
+            "file_hash": file_hash,
+            "original_filename": original_filename,
+            "faiss_index": faiss_id,
+            "chunk_text": self.get_text(faiss_id),
+        }
+        for name in self.INT_COLUMNS:
+            record[name] = self._value(name, faiss_id)
+        return record
+
+    def __iter__(self):
+        for faiss_id in range(self._size):
+            yield self.get_record(faiss_id)
+
+    def column(self, name):
+        """Vue en lecture seule d'une colonne entière (None codé par ChunkStore.MISSING)."""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def ids_for_tenant(self, departement_id, filiere_id):
+        """ID Faiss des chunks dont la clé (departement_id, filiere_id) correspond exactement."""
+        departements = self._columns["departement_id"][:self._size]
+        filieres = self._columns["filiere_id"][:self._size]
+        return np.nonzero(
+            (departements == (self.MISSING if departement_id is None else departement_id))
+            & (filieres == (self.MISSING if filiere_id is None else filiere_id))
+        )[0].astype('int64')
+
+    def tenant_keys(self):
+        """Clé (departement_id, filiere_id) de chaque chunk, dans l'ordre des ID Faiss."""
+        return [
+            (self._value("departement_id", i), self._value("filiere_id", i))
+            for i in range(self._size)
+        ]
+
+    def subset(self, faiss_ids):
+        """
+        Nouveau store ne contenant que les chunks `faiss_ids` (triés), renumérotés 0..n-1
+        (compaction après suppression de documents). Les documents sans chunk sont retirés.
+        """
+        faiss_ids = np.asarray(faiss_ids, dtype='int64')
+        count = faiss_ids.shape[0]
+        store = ChunkStore(capacity=max(count, 1024))
+        for name in self.INT_COLUMNS:
+            store._columns[name][:count] = self._columns[name][faiss_ids]
+        used, document_ids = np.unique(self._document_ids[faiss_ids], return_inverse=True)
+        store._document_ids[:count] = document_ids
+        store.documents = [self.documents[document_id] for document_id in used.tolist()]
+        store._document_lookup = {file_hash: i for i, (file_hash, _) in enumerate(store.documents)}
+        begins, ends = self._text_offsets[faiss_ids], self._text_offsets[faiss_ids + 1]
+        store._text_offsets[1:count + 1] = np.cumsum(ends - begins)
+        buffer = memoryview(self._text_buffer)
+        store._text_buffer = bytearray(b"".join(buffer[begin:end] for begin, end in zip(begins.tolist(), ends.tolist())))
+        store._size = count
+        return store
+
+    # --- Persistance / migration ---
+    def to_state(self):
+        return {
+            "size": self._size,
+            "columns": {name: column[:self._size].copy() for name, column in self._columns.items()},
+            "document_ids": self._document_ids[:self._size].copy(),
+            "text_offsets": self._text_offsets[:self._size + 1].copy(),
+            "text_buffer": bytes(self._text_buffer),
+            "documents": list(self.documents),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        store = cls(capacity=max(state["size"], 1024))
+        size = state["size"]
+        store._size = size
+        for name in cls.INT_COLUMNS:
+            store._columns[name][:size] = state["columns"][name]
+        store._document_ids[:size] = state["document_ids"]
+        store._text_offsets[:size + 1] = state["text_offsets"]
+        store._text_buffer = bytearray(state["text_buffer"])
+        store.documents = list(state["documents"])
+        store._document_lookup = {file_hash: i for i, (file_hash, _) in enumerate(store.documents)}
+        return store
+
+    def save_dir(self, directory):
+        """
+        Écrit le store dans une nouvelle génération du répertoire, puis bascule
+        le fichier CURRENT de façon atomique. Les anciennes générations sont
+        supprimées (les workers qui les projettent encore gardent leurs pages).
+        """
+        os.makedirs(directory, exist_ok=True)
+        current = self._current_generation(directory)
+        number = int(current.split("-")[1]) + 1 if current else 0
+        generation = f"gen-{number:08d}"
+        path = os.path.join(directory, generation)
+        os.makedirs(path, exist_ok=True)
+        for name in self.INT_COLUMNS:
+            np.save(os.path.join(path, f"{name}.npy"), self._columns[name][:self._size])
+        np.save(os.path.join(path, "document_ids.npy"), self._document_ids[:self._size])
+        np.save(os.path.join(path, "text_offsets.npy"), self._text_offsets[:self._size + 1])
+        with open(os.path.join(path, "texts.bin"), 'wb') as f:
+            f.write(memoryview(self._text_buffer)[:int(self._text_offsets[self._size])])
+            f.flush()
+            os.fsync(f.fileno())
+        with open(os.path.join(path, "documents.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.documents, f, ensure_ascii=False)
+
+        tmp_current = os.path.join(directory, self.CURRENT_FILE + ".tmp")
+        with open(tmp_current, 'w') as f:
+            f.write(generation)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, os.path.join(directory, self.CURRENT_FILE))
+        for entry in os.listdir(directory):
+            if entry.startswith("gen-") and entry != generation:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+    @classmethod
+    def _current_generation(cls, directory):
+        current_path = os.path.join(directory, cls.CURRENT_FILE)
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path) as f:
+            return f.read().strip() or None
+
+    @classmethod
+    def exists_dir(cls, directory):
+        return cls._current_generation(directory) is not None
+
+    @classmethod
+    def open_dir(cls, directory, mmap=True):
+        """Ouvre un store écrit par `save_dir` ; avec mmap=True, rien n'est lu avant le premier accès."""
+        path = os.path.join(directory, cls._current_generation(directory))
+        mmap_mode = 'r' if mmap else None
+        store = cls(capacity=0)
+        store._document_ids = np.load(os.path.join(path, "document_ids.npy"), mmap_mode=mmap_mode)
+        store._size = int(store._document_ids.shape[0])
+        for name in cls.INT_COLUMNS:
+            store._columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        store._text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode=mmap_mode)
+        texts_path = os.path.join(path, "texts.bin")
+        if mmap and os.path.getsize(texts_path) > 0:
+            store._text_buffer = np.memmap(texts_path, dtype='uint8', mode='r')
+        else:
+            with open(texts_path, 'rb') as f:
+                store._text_buffer = bytearray(f.read())
+        with open(os.path.join(path, "documents.json"), encoding='utf-8') as f:
+            store.documents = [tuple(document) for document in json.load(f)]
+        store._document_lookup = {file_hash: i for i, (file_hash, _) in enumerate(store.documents)}
+        return store
+
+    @classmethod
+    def from_records(cls, records):
+        """Migration depuis l'ancien format (liste de dictionnaires avec 'faiss_index')."""
+        store = cls(capacity=max(len(records), 1024))
+        for record in sorted(records, key=lambda record: record["faiss_index"]):
+            if record["faiss_index"] != len(store):
+                raise ValueError(
+                    f"Métadonnées non contiguës : faiss_index {record['faiss_index']} attendu {len(store)}"
+                )
+            store.append_chunks(
+                record.get("file_hash"), record.get("original_filename"), [record.get("chunk_text", "")],
+                **{name: record.get(name) for name in cls.INT_COLUMNS}
+            )
+        return store
@@ -0,0 +1,198 @@
+import re
+import math
+import hashlib
+import threading
+
+
+class TokenCounter:
+    """
+    Compte les tokens avec le tokenizer du modèle d'embedding (transformers.AutoTokenizer),
+    chargé au premier appel et partagé par processus. Si le tokenizer n'est pas disponible
+    (transformers absent, modèle hors ligne), une estimation WordPiece est utilisée :
+    un token par mot ou signe, plus un par tranche de 8 caractères au-delà du premier.
+    """
+
+    WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._tokenizer = None
+        self.approximate = None  # None : pas encore chargé
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, model_name):
+        with cls._shared_lock:
+            if model_name not in cls._shared:
+                cls._shared[model_name] = cls(model_name)
+            return cls._shared[model_name]
+
+    def _load(self):
+        with self._lock:
+            if self.approximate is None:
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                    self.approximate = False
+                except Exception as e:
+                    print(f"Tokenizer {self.model_name} indisponible ({e}) : nombre de tokens estimé.")
+                    self.approximate = True
+
+    def count(self, texts):
+        """Nombre de tokens (sans tokens spéciaux) de chaque texte."""
+        if not texts:
+            return []
+        self._load()
+        if not self.approximate:
+            encoded = self._tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+            return [len(ids) for ids in encoded]
+        return [
+            sum(1 + (len(piece) - 1) // 8 for piece in self.WORD_PATTERN.findall(text))
+            for text in texts
+        ]
+
+
+class StructureChunker:
+    """
+    Regroupe des phrases nettoyées en chunks d'au plus max_tokens tokens (tokenizer du modèle).
+
+    Les blocs (paragraphe, diapositive, page) sont ajoutés un par un avec add_block : un
+    chunk ne coupe jamais une phrase, et un nouveau bloc commence un nouveau chunk dès que
+    le chunk en cours atteint min_tokens (les blocs courts, titres par exemple, sont fusionnés
+    avec la suite). Une phrase plus longue que max_tokens est découpée en parts égales de mots.
+    overlap_tokens > 0 reprend en tête du chunk suivant les dernières phrases du précédent.
+
+    Si drop_duplicates est actif, les chunks identiques ou quasi identiques (Jaccard des
+    3-grammes de mots >= near_duplicate_threshold) à un chunk déjà produit pour le même
+    document sont supprimés.
+    """
+
+    SHINGLE_SIZE = 3
+    PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+    # Fin de phrase, fin de ligne après « : » ou « ; », ou ligne suivante commençant par une puce / un numéro.
+    # Les autres sauts de ligne (retours à la ligne des PDF) ne coupent pas la phrase.
+    SENTENCE_BREAK = re.compile(
+        r"(?<=[.!?…])\s+|(?<=[:;])[ \t]*\n\s*|\s*\n(?=[ \t]*(?:[-–•*▪●◦]|\d+[.)][ \t]))"
+    )
+
+    @classmethod
+    def split_structure(cls, segment):
+        """Découpe un segment brut (page, paragraphe, diapositive) en blocs (paragraphes) de phrases."""
+        blocks = []
+        for paragraph in cls.PARAGRAPH_BREAK.split(segment):
+            sentences = [sentence.strip() for sentence in cls.SENTENCE_BREAK.split(paragraph)]
+            sentences = [sentence for sentence in sentences if sentence]
+            if sentences:
+                blocks.append(sentences)
+        return blocks
+
+    def __init__(self, count_tokens, max_tokens=192, min_tokens=48, overlap_tokens=0,
+                 drop_duplicates=True, near_duplicate_threshold=0.9):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+        self.drop_duplicates = drop_duplicates
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._sentences = []  # [(phrase, tokens)] du chunk en cours
+        self._tokens = 0
+        self._has_new_text = False  # le chunk contient autre chose que le recouvrement
+        self._exact = set()
+        self._shingle_sets = []
+        self._shingle_index = {}
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def add_block(self, sentences):
+        """Ajoute les phrases nettoyées d'un bloc ; retourne les chunks terminés."""
+        sentences = [sentence for sentence in sentences if sentence]
+        if not sentences:
+            return []
+        chunks = []
+        if self._tokens >= self.min_tokens:
+            self._flush(chunks)
+        for sentence, tokens in zip(sentences, self.count_tokens(sentences)):
+            if tokens > self.max_tokens:
+                self._flush(chunks)
+                self._sentences, self._tokens = [], 0
+                for piece in self._split_long(sentence, tokens):
+                    self._emit(piece, chunks)
+                continue
+            if self._tokens + tokens > self.max_tokens:
+                self._flush(chunks)
+                # Le recouvrement ne doit pas faire déborder le chunk suivant
+                while self._sentences and self._tokens + tokens > self.max_tokens:
+                    self._tokens -= self._sentences.pop(0)[1]
+            self._sentences.append((sentence, tokens))
+            self._tokens += tokens
+            self._has_new_text = True
+        return chunks
+
+    def close(self):
+        """Retourne le dernier chunk."""
+        chunks = []
+        self._flush(chunks)
+        self._sentences, self._tokens = [], 0
+        return chunks
+
+    def _split_long(self, sentence, tokens):
+        words = sentence.split()
+        parts = math.ceil(tokens / self.max_tokens)
+        size = math.ceil(len(words) / parts)
+        return [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+    def _flush(self, chunks):
+        if not self._has_new_text:
+            return
+        self._emit(" ".join(sentence for sentence, _ in self._sentences), chunks)
+        self._has_new_text = False
+        # Recouvrement : dernières phrases dont le total tient dans overlap_tokens
+        kept, kept_tokens = [], 0
+        for sentence, tokens in reversed(self._sentences):
+            if kept_tokens + tokens > self.overlap_tokens:
+                break
+            kept.insert(0, (sentence, tokens))
+            kept_tokens += tokens
+        self._sentences, self._tokens = kept, kept_tokens
+
+    def _emit(self, chunk, chunks):
+        if not self.drop_duplicates:
+            chunks.append(chunk)
+            return
+        digest = hashlib.sha1(chunk.encode('utf-8')).digest()
+        if digest in self._exact:
+            self.exact_duplicates += 1
+            return
+        self._exact.add(digest)
+        shingles = self.shingles(chunk)
+        if shingles and self._is_near_duplicate(shingles):
+            self.near_duplicates += 1
+            return
+        position = len(self._shingle_sets)
+        self._shingle_sets.append(shingles)
+        for shingle in shingles:
+            self._shingle_index.setdefault(shingle, []).append(position)
+        chunks.append(chunk)
+
+    @classmethod
+    def shingles(cls, text):
+        words = text.split()
+        if len(words) < cls.SHINGLE_SIZE:
+            return frozenset()
+        return frozenset(
+            hash(tuple(words[i:i + cls.SHINGLE_SIZE])) for i in range(len(words) - cls.SHINGLE_SIZE + 1)
+        )
+
+    def _is_near_duplicate(self, shingles):
+        shared = {}
+        for shingle in shingles:
+            for position in self._shingle_index.get(shingle, ()):
+                shared[position] = shared.get(position, 0) + 1
+        for position, intersection in shared.items():
+            union = len(shingles) + len(self._shingle_sets[position]) - intersection
+            if intersection / union >= self.near_duplicate_threshold:
+                return True
+        return False
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU borné des embeddings de requêtes, partagé par toutes les requêtes d'un worker.
+
+    La clé est le texte normalisé (minuscules, espaces fusionnés) : BAAI/bge-base-en-v1.5
+    utilise un tokenizer uncased qui découpe sur les espaces, l'embedding est donc
+    identique pour toutes les variantes d'une même question.
+    Optionnellement adossé à une base SQLite locale (`disk_path`) qui survit aux redémarrages.
+    """
+
+    def __init__(self, model_name, max_entries=2048, disk_path=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "PRIMARY KEY (model, query))"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split()).lower()
+
+    def _remember(self, key, embedding):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        row = self._conn.execute(
+            "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?", (self.model_name, key)
+        ).fetchone()
+        return np.frombuffer(row[0], dtype='float32') if row else None
+
+    def _write_disk(self, key, embedding):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO query_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+            (self.model_name, key, embedding.tobytes())
+        )
+        self._conn.commit()
+
+    def get_or_compute(self, text, encode):
+        """
+        Retourne l'embedding de `text` ; `encode(texte_normalisé)` n'est appelé qu'en cas de défaut de cache.
+        Les tableaux retournés sont partagés et en lecture seule.
+        """
+        key = self.normalize(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            if self._conn is not None:
+                embedding = self._read_disk(key)
+                if embedding is not None:
+                    self.disk_hits += 1
+                    self._remember(key, embedding)
+                    return embedding
+            self.misses += 1
+
+        # Encodage hors verrou : les autres requêtes ne sont pas bloquées pendant le calcul.
+        embedding = np.array(encode(key), dtype='float32').reshape(-1)
+        embedding.setflags(write=False)
+        with self._lock:
+            self._remember(key, embedding)
+            if self._conn is not None:
+                self._write_disk(key, embedding)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM query_embeddings WHERE model = ?", (self.model_name,))
+                self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+                "entries": len(self._entries),
+            }
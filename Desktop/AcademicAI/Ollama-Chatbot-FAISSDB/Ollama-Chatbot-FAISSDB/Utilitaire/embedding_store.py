@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    Cache persistant des embeddings de chunks, indexé par (modèle, SHA-1 du texte du chunk).
+
+    Un répertoire par modèle d'embedding :
+      - vectors.bin : matrice brute (float32 ou float16), une ligne par chunk, projetée en mémoire ;
+      - keys.bin    : SHA-1 (20 octets) du texte de chaque ligne, dans le même ordre ;
+      - meta.json   : modèle, dimension et type des vecteurs.
+    Les deux fichiers sont en ajout seul : une ligne incomplète (crash pendant l'écriture)
+    est tronquée au chargement. L'index clé -> ligne est reconstruit en mémoire à l'ouverture.
+    Les vecteurs sont toujours retournés en float32.
+    """
+
+    KEY_SIZE = 20
+    VECTORS_FILE = "vectors.bin"
+    KEYS_FILE = "keys.bin"
+    META_FILE = "meta.json"
+
+    def __init__(self, root_dir, model_name, dimension, dtype='float32'):
+        if np.dtype(dtype) not in (np.dtype('float32'), np.dtype('float16')):
+            raise ValueError("dtype doit être float32 ou float16.")
+        self.model_name = model_name
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.directory = os.path.join(root_dir, re.sub(r"[^\w.-]+", "_", model_name))
+        self._rows = {}       # SHA-1 -> ligne
+        self._count = 0
+        self._matrix = None   # projection mémoire de vectors.bin (recréée après un ajout)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {"model": self.model_name, "dimension": self.dimension, "dtype": self.dtype.name}
+        meta_path = self._path(self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f"Cache d'embeddings {self.directory} incompatible : {stored} au lieu de {meta}.")
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+        row_size = self.dimension * self.dtype.itemsize
+        vectors_path, keys_path = self._path(self.VECTORS_FILE), self._path(self.KEYS_FILE)
+        vector_bytes = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        key_bytes = os.path.getsize(keys_path) if os.path.exists(keys_path) else 0
+        count = min(vector_bytes // row_size, key_bytes // self.KEY_SIZE)
+        # Ligne incomplète ou clé sans vecteur : écriture interrompue, tronquée
+        for path, size in ((vectors_path, count * row_size), (keys_path, count * self.KEY_SIZE)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                print(f"Cache d'embeddings : {path} tronqué à {count} lignes complètes.")
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        if count:
+            with open(keys_path, 'rb') as f:
+                keys = f.read()
+            self._rows = {keys[i * self.KEY_SIZE:(i + 1) * self.KEY_SIZE]: i for i in range(count)}
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _vectors(self):
+        if self._matrix is None or self._matrix.shape[0] != self._count:
+            self._matrix = np.memmap(
+                self._path(self.VECTORS_FILE), dtype=self.dtype, mode='r', shape=(self._count, self.dimension)
+            ) if self._count else np.empty((0, self.dimension), dtype=self.dtype)
+        return self._matrix
+
+    def get_many(self, texts):
+        """
+        Retourne (vecteurs float32 de shape (len(texts), dimension), masque des textes trouvés).
+        Les lignes non trouvées sont à zéro.
+        """
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        with self._lock:
+            rows = [self._rows.get(self.key(text), -1) for text in texts]
+            rows = np.array(rows, dtype='int64')
+            found = rows >= 0
+            if found.any():
+                vectors[found] = self._vectors()[rows[found]]
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(texts) - hits
+        return vectors, found
+
+    def put_many(self, texts, vectors):
+        """Ajoute les vecteurs des textes absents du cache (ajout puis fsync). Retourne le nombre ajouté."""
+        vectors = np.asarray(vectors, dtype='float32')
+        with self._lock:
+            keys, rows, pending = [], [], set()
+            for i, text in enumerate(texts):
+                key = self.key(text)
+                if key in self._rows or key in pending:
+                    continue
+                pending.add(key)
+                keys.append(key)
+                rows.append(i)
+            if not keys:
+                return 0
+            # Vecteurs d'abord : une clé n'est jamais lue sans sa ligne complète.
+            # Chaque fichier est d'abord ramené à self._count lignes (reste d'un ajout interrompu).
+            row_size = self.dimension * self.dtype.itemsize
+            for name, payload, size in (
+                    (self.VECTORS_FILE, vectors[rows].astype(self.dtype).tobytes(), self._count * row_size),
+                    (self.KEYS_FILE, b"".join(keys), self._count * self.KEY_SIZE)):
+                with open(self._path(name), 'ab') as f:
+                    f.truncate(size)
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+            for key in keys:
+                self._rows[key] = self._count
+                self._count += 1
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "dtype": self.dtype.name,
+                "entries": self._count,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
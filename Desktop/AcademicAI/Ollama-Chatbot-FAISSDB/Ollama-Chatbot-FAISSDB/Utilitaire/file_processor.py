@@ -1,64 +1,204 @@
 # Dans FileProcessor
 import os
+import codecs
 import hashlib
 import json
-import PyPDF2
 from docx import Document
 import io # Nécessaire pour lire depuis des bytes
 from pptx import Presentation
 
-from Utilitaire.EDA_Cleaner import TextPipeline, TextCleaner # Assurez-vous que c'est le bon import
+from Utilitaire.EDA_Cleaner import FastTextPipeline # Même sortie que TextPipeline(TextCleaner()), construit une fois par processus
+from Utilitaire.pdf_extraction import iter_pdf_pages
+from Utilitaire.chunker import StructureChunker, TokenCounter
+
+class AlreadyProcessedError(ValueError):
+    """Documents déjà indexés (hash connu), par exemple par une ingestion concurrente."""
+
+    def __init__(self, file_hashes):
+        self.file_hashes = list(file_hashes)
+        super().__init__(f"Document(s) déjà traité(s) : {', '.join(self.file_hashes)}")
+
+
+class StrippedContentHash:
+    """
+    SHA-256 incrémental de la concaténation des segments, espaces de début et de fin exclus :
+    même résultat que sha256("".join(segments).strip()), sans construire la chaîne complète.
+    """
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self._pending = ""  # espaces en fin de flux, écrits seulement si du texte suit
+        self.empty = True
+
+    def update(self, segment):
+        if self.empty:
+            segment = segment.lstrip()
+            if not segment:
+                return
+            self.empty = False
+        body = segment.rstrip()
+        if body:
+            self._sha.update((self._pending + body).encode('utf-8'))
+            self._pending = segment[len(body):]
+        else:
+            self._pending += segment
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+
+class StreamingChunker:
+    """
+    Découpage incrémental en fenêtres de chunk_size caractères (pas de chunk_size - chunk_overlap).
+    Produit exactement les chunks de FileProcessor.split_into_chunks sur le texte concaténé,
+    en ne gardant en mémoire que la fenêtre en cours.
+    """
+
+    def __init__(self, chunk_size, chunk_overlap):
+        self.chunk_size = chunk_size
+        self.step = chunk_size - chunk_overlap
+        self._buffer = ""
+        self._buffer_start = 0  # position absolue de _buffer[0]
+        self._next_start = 0    # position absolue du prochain chunk
+
+    def feed(self, text):
+        """Ajoute du texte ; retourne la liste des chunks complets."""
+        self._buffer += text
+        chunks = []
+        buffer_end = self._buffer_start + len(self._buffer)
+        while self._next_start + self.chunk_size <= buffer_end:
+            offset = self._next_start - self._buffer_start
+            chunk = self._buffer[offset:offset + self.chunk_size].strip()
+            if chunk: chunks.append(chunk)
+            self._next_start += self.step
+        # Oublier le texte déjà entièrement découpé
+        drop = min(self._next_start - self._buffer_start, len(self._buffer))
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+        return chunks
+
+    def close(self):
+        """Retourne les derniers chunks (fenêtres incomplètes en fin de texte)."""
+        chunks = []
+        buffer_end = self._buffer_start + len(self._buffer)
+        while self._next_start < buffer_end:
+            offset = self._next_start - self._buffer_start
+            chunk = self._buffer[offset:offset + self.chunk_size].strip()
+            if chunk: chunks.append(chunk)
+            self._next_start += self.step
+        self._buffer = ""
+        self._buffer_start = self._next_start
+        return chunks
+
 
 class FileProcessor:
-    def __init__(self, chunk_size=384, chunk_overlap=96):
+    # Taille des blocs décodés pour les fichiers texte (coupés sur un saut de ligne)
+    TEXT_BLOCK_SIZE = 1 << 16
+
+    CHUNKING_STRATEGIES = ("characters", "structure")
+
+    def __init__(self, chunk_size=384, chunk_overlap=96, pdf_workers=None, pdf_parallel_min_pages=64,
+                 pdf_pages_per_task=16, chunking="characters", tokenizer_name='BAAI/bge-base-en-v1.5',
+                 max_tokens=192, min_tokens=48, overlap_tokens=0, drop_duplicate_chunks=True,
+                 near_duplicate_threshold=0.9):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.processed_hashes = set()
+        # Découpage : « characters » (fenêtres de chunk_size caractères, historique) ou
+        # « structure » (phrases/paragraphes/diapositives, limite en tokens du modèle d'embedding)
+        if chunking not in self.CHUNKING_STRATEGIES:
+            raise ValueError(f"Stratégie de découpage inconnue : {chunking} (attendu : {self.CHUNKING_STRATEGIES})")
+        self.chunking = chunking
+        self.tokenizer_name = tokenizer_name
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+        self.drop_duplicate_chunks = drop_duplicate_chunks
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.last_chunking_stats = None
+        # Extraction PDF parallèle par plages de pages (1 = toujours en série)
+        self.pdf_workers = pdf_workers or os.cpu_count() or 1
+        self.pdf_parallel_min_pages = pdf_parallel_min_pages
+        self.pdf_pages_per_task = pdf_pages_per_task
+
+    def config(self):
+        """Paramètres du constructeur, pour recréer un FileProcessor équivalent dans un autre processus."""
+        return {
+            "chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap,
+            "pdf_workers": self.pdf_workers, "pdf_parallel_min_pages": self.pdf_parallel_min_pages,
+            "pdf_pages_per_task": self.pdf_pages_per_task, "chunking": self.chunking,
+            "tokenizer_name": self.tokenizer_name, "max_tokens": self.max_tokens, "min_tokens": self.min_tokens,
+            "overlap_tokens": self.overlap_tokens, "drop_duplicate_chunks": self.drop_duplicate_chunks,
+            "near_duplicate_threshold": self.near_duplicate_threshold,
+        }
 
     def calculate_hash(self, content_string): # Prend une string
         return hashlib.sha256(content_string.encode('utf-8')).hexdigest()
 
-    def read_content_from_bytes(self, base_filename, file_content_bytes):
+    def iter_content_from_bytes(self, base_filename, file_content_bytes):
         """
-        Convertit le contenu d'un fichier (en bytes) en string selon son type (déduit de base_filename).
+        Génère le texte d'un fichier (en bytes) segment par segment : page PDF, paragraphe DOCX,
+        forme PPTX, bloc de lignes TXT. La concaténation des segments, sans espaces de début/fin,
+        est le texte retourné par read_content_from_bytes.
         """
         file_extension = os.path.splitext(base_filename)[1].lower()
-        content_str = ""
 
         try:
             if file_extension == '.txt':
-                content_str = file_content_bytes.decode('utf-8') # Suppose UTF-8
+                # Décodage incrémental (suppose UTF-8) ; chaque segment finit sur un saut de ligne
+                # pour qu'aucun mot ne soit coupé entre deux segments.
+                decoder = codecs.getincrementaldecoder('utf-8')()
+                view = memoryview(file_content_bytes)
+                carry = ""
+                for offset in range(0, len(view), self.TEXT_BLOCK_SIZE):
+                    carry += decoder.decode(view[offset:offset + self.TEXT_BLOCK_SIZE])
+                    cut = carry.rfind("\n") + 1
+                    if cut:
+                        yield carry[:cut]
+                        carry = carry[cut:]
+                carry += decoder.decode(b"", final=True)
+                if carry:
+                    yield carry
             elif file_extension == '.pdf':
-                pdf_stream = io.BytesIO(file_content_bytes)
-                pdf_reader = PyPDF2.PdfReader(pdf_stream)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
+                for page_text in self.iter_pdf_pages(file_content_bytes):
                     if page_text: # S'assurer que du texte a été extrait
-                        content_str += page_text + "\n"
+                        yield page_text + "\n"
             elif file_extension == '.docx':
                 docx_stream = io.BytesIO(file_content_bytes)
                 doc = Document(docx_stream)
                 for para in doc.paragraphs:
-                    content_str += para.text + "\n"
+                    yield para.text + "\n"
             elif file_extension == '.json':
                 json_string = file_content_bytes.decode('utf-8')
                 data = json.loads(json_string)
-                content_str = json.dumps(data, ensure_ascii=False) # Pour le traitement ultérieur
+                yield json.dumps(data, ensure_ascii=False) # Pour le traitement ultérieur
             elif file_extension == '.pptx':
                 pptx_stream = io.BytesIO(file_content_bytes)
                 prs = Presentation(pptx_stream)
                 for slide in prs.slides:
                     for shape in slide.shapes:
                         if hasattr(shape, "text"):
-                            content_str += shape.text + "\n"
+                            yield shape.text + "\n"
             else:
                 raise ValueError(f"Type de fichier non pris en charge : {file_extension} pour {base_filename}")
-
-            return content_str.strip()
         except Exception as e:
             # traceback.print_exc() # Pour débogage
             raise Exception(f"Erreur lors de la lecture du contenu des bytes pour {base_filename} (type: {file_extension}) : {str(e)}")
 
+    def iter_pdf_pages(self, file_content_bytes):
+        """
+        Génère le texte de chaque page d'un PDF, dans l'ordre (voir pdf_extraction.iter_pdf_pages) :
+        extraction parallèle par plages de pages au-delà de pdf_parallel_min_pages pages.
+        """
+        return iter_pdf_pages(file_content_bytes, self.pdf_workers, self.pdf_parallel_min_pages, self.pdf_pages_per_task)
+
+    def read_content_from_bytes(self, base_filename, file_content_bytes):
+        """
+        Convertit le contenu d'un fichier (en bytes) en string selon son type (déduit de base_filename).
+        """
+        return "".join(self.iter_content_from_bytes(base_filename, file_content_bytes)).strip()
+
     def split_into_chunks(self, text):
         # ... (votre logique existante, inchangée) ...
         if not text: return []
@@ -72,43 +212,87 @@ class FileProcessor:
             start += self.chunk_size - self.chunk_overlap
         return chunks
 
+    def extract_chunks(self, base_filename, file_content_bytes):
+        """
+        Lit, nettoie et découpe le contenu d'un fichier (en bytes), sans effet de bord.
+        Retourne (chunks, file_hash) ; chunks vaut None si aucun contenu n'a pu être extrait.
+        Utilisable dans un processus séparé (pipeline d'ingestion par lot).
+
+        Traitement en flux : chaque segment est haché, nettoyé puis envoyé au découpage dès
+        sa lecture ; ni le texte brut ni le texte nettoyé complets ne sont construits.
+        Le hash est celui du texte brut complet (sans espaces de début/fin), comme avant.
+        """
+        content_hash = StrippedContentHash()
+        pipeline = FastTextPipeline.shared()
+        if self.chunking == "structure":
+            return self._extract_structured_chunks(base_filename, file_content_bytes, content_hash, pipeline)
+        chunker = StreamingChunker(self.chunk_size, self.chunk_overlap)
+        chunks = []
+
+        def hashed_segments():
+            for segment in self.iter_content_from_bytes(base_filename, file_content_bytes):
+                content_hash.update(segment)
+                yield segment
+
+        # Nettoyage segment par segment (les mots ne chevauchent jamais deux segments) : même texte
+        # nettoyé que sur le contenu complet, bords de segment compris (voir process_stream).
+        for cleaned in pipeline.process_stream(hashed_segments()):
+            chunks.extend(chunker.feed(cleaned))
+        chunks.extend(chunker.close())
+        self.last_chunking_stats = {"chunks": len(chunks)}
+        return self._chunking_result(base_filename, chunks, content_hash)
+
+    def _extract_structured_chunks(self, base_filename, file_content_bytes, content_hash, pipeline):
+        """
+        Découpage « structure » : les phrases de chaque paragraphe / diapositive / page sont
+        nettoyées séparément puis regroupées par StructureChunker jusqu'à max_tokens tokens
+        du modèle d'embedding ; les chunks en double dans le document sont supprimés.
+        """
+        chunker = StructureChunker(
+            TokenCounter.shared(self.tokenizer_name).count, self.max_tokens, self.min_tokens,
+            self.overlap_tokens, self.drop_duplicate_chunks, self.near_duplicate_threshold
+        )
+        chunks = []
+        for segment in self.iter_content_from_bytes(base_filename, file_content_bytes):
+            content_hash.update(segment)
+            for sentences in StructureChunker.split_structure(segment):
+                chunks.extend(chunker.add_block([pipeline.process(sentence) for sentence in sentences]))
+        chunks.extend(chunker.close())
+        self.last_chunking_stats = {
+            "chunks": len(chunks),
+            "exact_duplicates": chunker.exact_duplicates,
+            "near_duplicates": chunker.near_duplicates,
+        }
+        return self._chunking_result(base_filename, chunks, content_hash)
+
+    def _chunking_result(self, base_filename, chunks, content_hash):
+        if content_hash.empty:
+            print(f"Aucun contenu textuel extrait de {base_filename}.")
+            return None, None # Pas de contenu à traiter
+
+        file_hash = content_hash.hexdigest()
+        if not chunks:
+            print(f"Aucun chunk généré pour {base_filename} après nettoyage et division.")
+            return None, file_hash
+        return chunks, file_hash
+
     def process_file(self, base_filename, file_content_bytes): # Modifié ici
         """
         Traite le contenu d'un fichier (en bytes) : lit, calcule hash, vérifie, nettoie, et retourne chunks.
         """
         try:
-            # Étape 1: Lire le contenu des bytes en une chaîne de caractères
-            content_string = self.read_content_from_bytes(base_filename, file_content_bytes)
+            # Lecture, hash, nettoyage et découpage en flux (mémoire bornée par la taille des segments)
+            chunks, file_hash = self.extract_chunks(base_filename, file_content_bytes)
 
-            if not content_string:
-                print(f"Aucun contenu textuel extrait de {base_filename}.")
+            if file_hash is None:
                 return None, None # Pas de contenu à traiter
 
-            # Étape 2: Calculer le hash du contenu textuel
-            file_hash = self.calculate_hash(content_string)
-
             if file_hash in self.processed_hashes:
                 print(f"Le fichier {base_filename} (hash: {file_hash}) a déjà été traité.")
                 return None, file_hash # Retourner None pour les chunks, mais le hash pour info
 
-            # Étape 3: Nettoyage du texte (votre pipeline EDA)
-            # Assurez-vous que TextCleaner et TextPipeline sont correctement importés et fonctionnent
-            # from Utilitaire.EDA_Cleaner import TextPipeline, TextCleaner # Exemple d'import
-            cleaner = TextCleaner()
-            pipeline = TextPipeline(cleaner)
-            cleaned_content = pipeline.process(content_string) # pipeline.process prend une string
-
-            if not cleaned_content:
-                print(f"Contenu vide après nettoyage pour {base_filename}.")
-                return None, file_hash # Retourner le hash pour marquer comme traité, mais pas de chunks
-
-            # Étape 4: Diviser en chunks
-            chunks = self.split_into_chunks(cleaned_content)
-
             if not chunks:
-                print(f"Aucun chunk généré pour {base_filename} après nettoyage et division.")
-                # Décider si on ajoute le hash aux processed_hashes même si pas de chunks
-                # Pour l'instant, on ne l'ajoute que si des chunks sont générés et traités
+                # On n'ajoute le hash aux processed_hashes que si des chunks sont générés et traités
                 return None, file_hash
 
             # Si tout s'est bien passé et que des chunks ont été générés :
@@ -120,4 +304,4 @@ class FileProcessor:
             import traceback
             traceback.print_exc()
             # Il est important de propager l'erreur pour qu'elle soit gérée plus haut
-            raise # ou return None, None si vous voulez gérer l'erreur ici et ne pas bloquer
\ No newline at end of file
+            raise # ou return None, None si vous voulez gérer l'erreur ici et ne pas bloquer
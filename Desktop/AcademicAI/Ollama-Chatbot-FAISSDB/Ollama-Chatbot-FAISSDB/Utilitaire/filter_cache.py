@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+
+class AllowedIdsCache:
+    """
+    Cache mémoire des ID Faiss autorisés par (departement_id, filiere_id).
+
+    Les IDs sont stockés sous forme de tableaux NumPy int64 triés et uniques.
+    Le cache est chargé une seule fois depuis SQLite, mis à jour de façon
+    incrémentale à l'ingestion et à la suppression de documents, et invalidé lors
+    de la réinitialisation FAISS ou de la renumérotation des IDs (compaction) :
+    la résolution d'un filtre ne touche plus le disque.
+    """
+
+    EMPTY = np.empty(0, dtype='int64')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._by_pair = None  # (departement_id, filiere_id) -> np.ndarray trié
+        self._resolved = {}   # filtre demandé -> np.ndarray (mémoïsation)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read(conn):
+        """IDs par (departement_id, filiere_id) lus sur `conn` (y compris sa transaction en cours)."""
+        groups = {}
+        for departement_id, filiere_id, chunk_index in conn.execute(
+            "SELECT departement_id, filiere_id, chunk_index FROM document_metadata"
+        ):
+            groups.setdefault((departement_id, filiere_id), []).append(chunk_index)
+        return {key: np.unique(np.array(ids, dtype='int64')) for key, ids in groups.items()}
+
+    def _load(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_document_metadata_filters "
+                "ON document_metadata (departement_id, filiere_id)"
+            )
+            conn.commit()
+            by_pair = self.read(conn)
+        finally:
+            conn.close()
+        self._by_pair = by_pair
+        self._resolved = {}
+
+    @staticmethod
+    def _freeze(array):
+        array.setflags(write=False)
+        return array
+
+    def get(self, departement_id=None, filiere_id=None):
+        """Retourne les IDs autorisés pour le filtre, même sémantique que la requête SQL d'origine."""
+        key = (departement_id, filiere_id)
+        with self._lock:
+            if self._by_pair is None:
+                self._load()
+            resolved = self._resolved.get(key)
+            if resolved is not None:
+                return resolved
+            if departement_id is not None and filiere_id is not None:
+                resolved = self._by_pair.get(key, self.EMPTY)
+            else:
+                parts = [
+                    ids for (dep, fil), ids in self._by_pair.items()
+                    if (departement_id is None or dep == departement_id)
+                    and (filiere_id is None or fil == filiere_id)
+                ]
+                resolved = np.unique(np.concatenate(parts)) if parts else self.EMPTY
+            self._resolved[key] = self._freeze(resolved)
+            return resolved
+
+    def add(self, chunk_indices, departement_id=None, filiere_id=None):
+        """Enregistre de nouveaux chunks ingérés pour (departement_id, filiere_id)."""
+        with self._lock:
+            if self._by_pair is None:
+                return  # Le prochain chargement lira les nouvelles lignes depuis SQLite.
+            key = (departement_id, filiere_id)
+            new_ids = np.asarray(chunk_indices, dtype='int64')
+            self._by_pair[key] = np.union1d(self._by_pair.get(key, self.EMPTY), new_ids)
+            self._resolved = {}
+
+    def remove(self, chunk_indices, departement_id=None, filiere_id=None):
+        """Retire des chunks supprimés (plus référencés par aucun document) de (departement_id, filiere_id)."""
+        with self._lock:
+            if self._by_pair is None:
+                return
+            key = (departement_id, filiere_id)
+            if key in self._by_pair:
+                self._by_pair[key] = np.setdiff1d(self._by_pair[key], np.asarray(chunk_indices, dtype='int64'))
+            self._resolved = {}
+
+    def replace(self, by_pair):
+        """Installe des IDs préparés à l'avance (lus par `read`), par exemple après une renumérotation."""
+        with self._lock:
+            self._by_pair = by_pair
+            self._resolved = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._by_pair = None
+            self._resolved = {}
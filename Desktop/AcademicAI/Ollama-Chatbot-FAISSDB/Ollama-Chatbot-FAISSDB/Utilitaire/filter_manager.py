@@ -1,7 +1,10 @@
 import sqlite3
 import hashlib
+from contextlib import contextmanager
+import numpy as np
 from typing import Optional, Dict, Any, List
 import api.models as models
+from Utilitaire.filter_cache import AllowedIdsCache
 # from api.models.exceptions import UserNotFoundError, DuplicateUserError, ChatHistoryEntry
 
 class UserNotFoundError(Exception):
@@ -15,6 +18,9 @@ from datetime import date, timedelta
 # Database path
 db_path = "./bdd/chatbot_metadata.db"
 
+# Cache mémoire des ID Faiss autorisés (évite une requête SQLite par tour de chat)
+allowed_ids_cache = AllowedIdsCache(db_path)
+
 class FilterManager:
 
     def __init__(self, db_path: str):
@@ -259,51 +265,236 @@ class FilterManager:
         conn.commit()
         conn.close()
 
+    @staticmethod
+    @contextmanager
+    def metadata_transaction():
+        """
+        Ouvre une transaction SQLite (mode WAL) pour écrire les métadonnées d'un document.
+        Commit à la sortie du bloc, rollback si une exception est levée à l'intérieur.
+        """
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN")
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def insert_metadata_sqlite_bulk(conn, base_filename, file_hash, chunk_indices, chunk_texts, departement_id, filiere_id, module_id, activite_id, profile_id, user_id):
+        """Insère tous les chunks d'un document en un seul executemany (dans la transaction de `conn`)."""
+        conn.executemany("""
+            INSERT INTO document_metadata (base_filename, file_hash, chunk_index, chunk_text, departement_id, filiere_id, module_id, activite_id, profile_id, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (base_filename, file_hash, int(chunk_index), chunk_text, departement_id, filiere_id, module_id, activite_id, profile_id, user_id)
+            for chunk_index, chunk_text in zip(chunk_indices, chunk_texts)
+        ])
+
 
     @staticmethod
     def get_allowed_indices(departement_id=None, filiere_id=None):
         """
-        Retourne un ensemble d'ID Faiss (chunk_index globaux stockés dans la DB)
-        autorisés en fonction des filtres académiques.
+        Retourne les ID Faiss (chunk_index globaux stockés dans la DB) autorisés
+        en fonction des filtres académiques, sous forme de np.ndarray int64 trié.
+        Les IDs sont servis depuis le cache mémoire, chargé une seule fois depuis SQLite.
         """
-        # print(">>> Filtres reçus dans get_allowed_indices :")
-        # print(f"  departement_id={departement_id}")
-        # print(f"  filiere_id={filiere_id}")
-        # print(f"  module_id={module_id}")
-        # print(f"  activite_id={activite_id}")
-        # print(f"  profile_id={profile_id}")
-        # print(f"  user_id={user_id}")
-
-        conn = sqlite3.connect(db_path) # Assurez-vous que db_path est défini
-        cursor = conn.cursor()
+        return allowed_ids_cache.get(departement_id, filiere_id)
+
+    @staticmethod
+    def register_allowed_indices(chunk_indices, departement_id=None, filiere_id=None):
+        """Met à jour le cache des IDs autorisés après l'ingestion de nouveaux chunks."""
+        allowed_ids_cache.add(chunk_indices, departement_id, filiere_id)
+
+    @staticmethod
+    def invalidate_allowed_indices():
+        """Invalide le cache des IDs autorisés (il sera rechargé depuis SQLite au prochain accès)."""
+        allowed_ids_cache.invalidate()
 
-        # Construire la requête SQL de base
-        query_parts = ["SELECT chunk_index FROM document_metadata WHERE 1=1"]
-        params = []
+    @staticmethod
+    def read_allowed_indices(conn):
+        """IDs autorisés tels que les voit `conn` (transaction non validée comprise), sans toucher au cache."""
+        return AllowedIdsCache.read(conn)
 
-        # Ajouter des conditions pour chaque filtre s'il est fourni
-        if departement_id is not None:
-            query_parts.append("AND departement_id = ?")
-            params.append(departement_id)
-        if filiere_id is not None:
-            query_parts.append("AND filiere_id = ?")
-            params.append(filiere_id)
-       
+    @staticmethod
+    def replace_allowed_indices(by_pair):
+        """Remplace le cache des IDs autorisés par des IDs lus avec read_allowed_indices."""
+        allowed_ids_cache.replace(by_pair)
 
-        final_query = " ".join(query_parts)
-        # print(f"Executing SQL: {final_query} with params: {params}")
+    # --- Suppression de documents (tombstones) ---
 
-        cursor.execute(final_query, tuple(params))
+    @staticmethod
+    def _ensure_deletion_tables(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS deleted_chunks (faiss_id INTEGER PRIMARY KEY)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS deleted_documents (file_hash TEXT PRIMARY KEY, base_filename TEXT, "
+            "date_Suppression TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
 
-        # chunk_index dans la base de données EST maintenant l'ID global Faiss.
-        # Nous récupérons donc directement ces IDs.
-        allowed_faiss_ids = set(row[0] for row in cursor.fetchall())
+    @staticmethod
+    def get_document_summary(file_hash):
+        """Nom, locataire et nombre de chunks d'un document ingéré, ou None s'il est inconnu."""
+        conn = sqlite3.connect(db_path)
+        try:
+            row = conn.execute(
+                "SELECT MIN(base_filename), MIN(departement_id), MIN(filiere_id), COUNT(*) "
+                "FROM document_metadata WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or row[3] == 0:
+            return None
+        return {"file_hash": file_hash, "base_filename": row[0], "departement_id": row[1],
+                "filiere_id": row[2], "chunks": row[3]}
 
-        conn.close()
+    @staticmethod
+    def delete_document_metadata(conn, file_hash):
+        """
+        Supprime les lignes d'un document (dans la transaction de `conn`) et enregistre comme
+        tombstones les ID Faiss qui ne sont plus référencés par aucun document ; un ID partagé
+        avec un autre document (chunk dédupliqué) reste vivant.
+        Retourne {"base_filename", "chunks", "orphaned": {(departement_id, filiere_id): np.ndarray}},
+        ou None si le document est inconnu.
+        """
+        rows = conn.execute(
+            "SELECT base_filename, chunk_index, departement_id, filiere_id FROM document_metadata WHERE file_hash = ?",
+            (file_hash,)
+        ).fetchall()
+        if not rows:
+            return None
+        FilterManager._ensure_deletion_tables(conn)
+        conn.execute("DELETE FROM document_metadata WHERE file_hash = ?", (file_hash,))
+        candidates = sorted({row[1] for row in rows})
+        still_used = set()
+        for start in range(0, len(candidates), 500):
+            batch = candidates[start:start + 500]
+            still_used.update(chunk_index for (chunk_index,) in conn.execute(
+                f"SELECT DISTINCT chunk_index FROM document_metadata WHERE chunk_index IN ({','.join('?' * len(batch))})",
+                batch
+            ))
+        orphaned = {}
+        for _, chunk_index, departement_id, filiere_id in rows:
+            if chunk_index not in still_used:
+                orphaned.setdefault((departement_id, filiere_id), set()).add(chunk_index)
+        conn.executemany(
+            "INSERT OR IGNORE INTO deleted_chunks (faiss_id) VALUES (?)",
+            [(int(chunk_index),) for ids in orphaned.values() for chunk_index in ids]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO deleted_documents (file_hash, base_filename) VALUES (?, ?)", (file_hash, rows[0][0])
+        )
+        return {
+            "base_filename": rows[0][0],
+            "chunks": len(rows),
+            "orphaned": {key: np.array(sorted(ids), dtype='int64') for key, ids in orphaned.items()},
+        }
+
+    @staticmethod
+    def load_deletions():
+        """
+        Retourne (tombstones, hashes) : ID Faiss supprimés en attente de compaction (np.ndarray trié)
+        et hashes des documents supprimés qui n'ont pas été ré-ingérés depuis.
+        """
+        conn = sqlite3.connect(db_path)
+        try:
+            FilterManager._ensure_deletion_tables(conn)
+            conn.commit()
+            tombstones = np.array(
+                [faiss_id for (faiss_id,) in conn.execute("SELECT faiss_id FROM deleted_chunks ORDER BY faiss_id")],
+                dtype='int64'
+            )
+            hashes = {file_hash for (file_hash,) in conn.execute(
+                "SELECT file_hash FROM deleted_documents "
+                "WHERE file_hash NOT IN (SELECT file_hash FROM document_metadata WHERE file_hash IS NOT NULL)"
+            )}
+        finally:
+            conn.close()
+        return tombstones, hashes
+
+    @staticmethod
+    def get_last_committed_id():
+        """Plus grand ID Faiss présent dans SQLite (document_metadata ou tombstones), -1 si aucun."""
+        conn = sqlite3.connect(db_path)
+        try:
+            FilterManager._ensure_deletion_tables(conn)
+            conn.commit()
+            (last_id,) = conn.execute(
+                "SELECT MAX(faiss_id) FROM (SELECT MAX(chunk_index) AS faiss_id FROM document_metadata "
+                "UNION ALL SELECT MAX(faiss_id) FROM deleted_chunks)"
+            ).fetchone()
+        finally:
+            conn.close()
+        return -1 if last_id is None else int(last_id)
+
+    @staticmethod
+    def get_committed_hashes(file_hashes):
+        """Parmi `file_hashes`, ceux des documents présents dans document_metadata (commit validé)."""
+        file_hashes = list(file_hashes)
+        if not file_hashes:
+            return set()
+        conn = sqlite3.connect(db_path)
+        try:
+            placeholders = ",".join("?" * len(file_hashes))
+            return {file_hash for (file_hash,) in conn.execute(
+                f"SELECT DISTINCT file_hash FROM document_metadata WHERE file_hash IN ({placeholders})", file_hashes
+            )}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_ingested_hashes():
+        """Hashes de tous les documents présents dans document_metadata."""
+        conn = sqlite3.connect(db_path)
+        try:
+            return {file_hash for (file_hash,) in conn.execute(
+                "SELECT DISTINCT file_hash FROM document_metadata WHERE file_hash IS NOT NULL"
+            )}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def remap_chunk_indices(conn, live_ids):
+        """
+        Renumérote les chunk_index après compaction (dans la transaction de `conn`) :
+        live_ids[i] (trié) devient i. Les tombstones sont effacés.
+        """
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS faiss_id_remap (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+        conn.execute("DELETE FROM faiss_id_remap")
+        conn.executemany(
+            "INSERT INTO faiss_id_remap (old_id, new_id) VALUES (?, ?)",
+            zip(np.asarray(live_ids).tolist(), range(len(live_ids)))
+        )
+        conn.execute(
+            "UPDATE document_metadata SET chunk_index = "
+            "(SELECT new_id FROM faiss_id_remap WHERE old_id = document_metadata.chunk_index) "
+            "WHERE chunk_index IN (SELECT old_id FROM faiss_id_remap)"
+        )
+        conn.execute("DROP TABLE faiss_id_remap")
+        FilterManager._ensure_deletion_tables(conn)
+        conn.execute("DELETE FROM deleted_chunks")
+
+    @staticmethod
+    def clear_deletions():
+        """Vide les tables de suppression (réinitialisation de la base vectorielle)."""
+        conn = sqlite3.connect(db_path)
+        try:
+            FilterManager._ensure_deletion_tables(conn)
+            conn.execute("DELETE FROM deleted_chunks")
+            conn.execute("DELETE FROM deleted_documents")
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def remove_allowed_indices(chunk_indices, departement_id=None, filiere_id=None):
+        """Met à jour le cache des IDs autorisés après la suppression d'un document."""
+        allowed_ids_cache.remove(chunk_indices, departement_id, filiere_id)
 
-        # print(f"Allowed FAISS IDs from DB: {allowed_faiss_ids}")
-        return allowed_faiss_ids
-    
     def get_documents_ingested(self):
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
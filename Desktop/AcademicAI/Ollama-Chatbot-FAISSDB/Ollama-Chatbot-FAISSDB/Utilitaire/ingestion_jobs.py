@@ -0,0 +1,271 @@
+import os
+import json
+import shutil
+import sqlite3
+import threading
+import traceback
+
+from Utilitaire.ingestion_pipeline import IngestionCancelled
+
+
+class IngestionJobQueue:
+    """
+    File persistante de jobs d'ingestion (table `ingestion_jobs` de la base SQLite).
+
+    Les fichiers soumis sont écrits sur disque (`payload_dir/<job_id>/`) et le job est
+    enregistré à l'état « queued ». Un thread worker unique draine la file dans l'ordre
+    de soumission et exécute chaque job avec IngestionPipeline (extraction dans un pool
+    de processus, embedding batché, commit unique) : la boucle d'événements de l'API
+    n'est jamais bloquée. L'étape et la progression sont mises à jour dans la table.
+    Au démarrage, les jobs laissés dans un état intermédiaire par un arrêt du serveur sont repris :
+    un job « running » est remis en file (les fichiers déjà indexés sont ignorés grâce à leur hash),
+    ou annulé si son annulation avait été demandée ; un job « pending » (fichiers pas entièrement
+    écrits) passe à « failed ».
+
+    États : pending -> queued -> running -> succeeded | failed | cancelled.
+    """
+
+    TABLE = "ingestion_jobs"
+    FINAL_STATES = ("succeeded", "failed", "cancelled")
+
+    def __init__(self, db_path, pipeline, payload_dir='./bdd/ingestion_jobs', poll_interval=2.0):
+        self.db_path = db_path
+        self.pipeline = pipeline
+        self.payload_dir = payload_dir
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._ensure_table()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _ensure_table(self):
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "status TEXT NOT NULL DEFAULT 'queued', "
+                "stage TEXT, progress REAL NOT NULL DEFAULT 0, "
+                "files TEXT NOT NULL, filters TEXT NOT NULL, "
+                "result TEXT, error TEXT, "
+                "cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "user_id INTEGER, "
+                "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+                "started_at TIMESTAMP, finished_at TIMESTAMP)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_status ON {self.TABLE} (status, id)")
+            conn.commit()
+        finally:
+            conn.close()
+        self._recover_stale_jobs()
+
+    def _recover_stale_jobs(self):
+        """
+        Reprend les jobs interrompus par un arrêt du serveur : « running » remis en file (ou annulé
+        si l'annulation était demandée), « pending » en échec car ses fichiers sont incomplets.
+        """
+        conn = self._connect()
+        try:
+            closed = [row[0] for row in conn.execute(
+                f"SELECT id FROM {self.TABLE} WHERE status = 'pending' "
+                "OR (status = 'running' AND cancel_requested = 1)"
+            )]
+            conn.execute(
+                f"UPDATE {self.TABLE} SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP "
+                "WHERE status = 'running' AND cancel_requested = 1"
+            )
+            conn.execute(
+                f"UPDATE {self.TABLE} SET status = 'failed', finished_at = CURRENT_TIMESTAMP, "
+                "error = 'Fichiers du job incomplets (serveur arrêté pendant la soumission).' "
+                "WHERE status = 'pending'"
+            )
+            requeued = conn.execute(
+                f"UPDATE {self.TABLE} SET status = 'queued', stage = NULL, progress = 0 WHERE status = 'running'"
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        for job_id in closed:
+            self._remove_payload(job_id)
+        if closed or requeued:
+            print(f"Jobs d'ingestion interrompus : {requeued} remis en file, {len(closed)} clôturés.")
+
+    # --- API ---
+
+    def submit(self, files, filters):
+        """
+        Enregistre un job pour `files` (liste de (nom de fichier, bytes), .zip acceptés) et retourne son ID.
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"INSERT INTO {self.TABLE} (status, files, filters, user_id) VALUES ('pending', ?, ?, ?)",
+                (json.dumps([name for name, _ in files], ensure_ascii=False), json.dumps(filters), filters.get("user_id"))
+            )
+            job_id = cursor.lastrowid
+            conn.commit()
+            # Fichiers écrits avant le passage à « queued » : le worker ne voit jamais un job incomplet
+            try:
+                job_dir = self._job_dir(job_id)
+                os.makedirs(job_dir, exist_ok=True)
+                for position, (name, content) in enumerate(files):
+                    with open(os.path.join(job_dir, f"{position:04d}"), 'wb') as f:
+                        f.write(content)
+            except Exception as e:
+                conn.execute(
+                    f"UPDATE {self.TABLE} SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP "
+                    "WHERE id = ?", (str(e), job_id)
+                )
+                conn.commit()
+                self._remove_payload(job_id)
+                raise
+            conn.execute(f"UPDATE {self.TABLE} SET status = 'queued' WHERE id = ?", (job_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Retourne l'état du job (dict) ou None s'il n'existe pas."""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(f"SELECT * FROM {self.TABLE} WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, status=None, limit=50):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM {self.TABLE} WHERE (? IS NULL OR status = ?) ORDER BY id DESC LIMIT ?",
+                (status, status, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        Annule un job en file immédiatement ; un job en cours s'arrête au prochain point
+        d'annulation (avant le commit). Retourne le nouvel état, ou None si le job n'existe pas.
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"UPDATE {self.TABLE} SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND status IN ('pending', 'queued')", (job_id,)
+            )
+            conn.execute(f"UPDATE {self.TABLE} SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        job = self.get(job_id)
+        if job and job["status"] == "cancelled":
+            self._remove_payload(job_id)
+        return job["status"] if job else None
+
+    # --- Worker ---
+
+    def start(self):
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self._run, name="ingestion-jobs", daemon=True)
+                self._worker.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            job_id = self._claim_next()
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job_id)
+
+    def _claim_next(self):
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT id FROM {self.TABLE} WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            cursor = conn.execute(
+                f"UPDATE {self.TABLE} SET status = 'running', stage = 'extraction', progress = 0, "
+                "started_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'", (row[0],)
+            )
+            conn.commit()
+            return row[0] if cursor.rowcount == 1 else None
+        finally:
+            conn.close()
+
+    def _execute(self, job_id):
+        conn = self._connect()
+        try:
+            files_json, filters_json = conn.execute(
+                f"SELECT files, filters FROM {self.TABLE} WHERE id = ?", (job_id,)
+            ).fetchone()
+
+            def progress(stage, fraction):
+                conn.execute(
+                    f"UPDATE {self.TABLE} SET stage = ?, progress = ? WHERE id = ?",
+                    (stage, round(fraction, 4), job_id)
+                )
+                conn.commit()
+
+            def should_cancel():
+                row = conn.execute(f"SELECT cancel_requested FROM {self.TABLE} WHERE id = ?", (job_id,)).fetchone()
+                return bool(row and row[0])
+
+            try:
+                job_dir = self._job_dir(job_id)
+                files = []
+                for position, name in enumerate(json.loads(files_json)):
+                    with open(os.path.join(job_dir, f"{position:04d}"), 'rb') as f:
+                        files.append((name, f.read()))
+                report = self.pipeline.run(files, json.loads(filters_json), progress, should_cancel)
+                status, result, error = "succeeded", json.dumps(report, ensure_ascii=False), None
+            except IngestionCancelled:
+                status, result, error = "cancelled", None, None
+            except Exception as e:
+                traceback.print_exc()
+                status, result, error = "failed", None, str(e)
+            conn.execute(
+                f"UPDATE {self.TABLE} SET status = ?, result = ?, error = ?, "
+                "progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END, "
+                "finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, result, error, status, job_id)
+            )
+            conn.commit()
+            print(f"Job d'ingestion {job_id} terminé : {status}.")
+        finally:
+            conn.close()
+        self._remove_payload(job_id)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.payload_dir, str(job_id))
+
+    def _remove_payload(self, job_id):
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    @staticmethod
+    def _row_to_dict(row):
+        job = dict(row)
+        job["files"] = json.loads(job["files"])
+        job["filters"] = json.loads(job["filters"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
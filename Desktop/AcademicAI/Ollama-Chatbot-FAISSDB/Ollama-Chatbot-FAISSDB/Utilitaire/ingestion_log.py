@@ -0,0 +1,139 @@
+import os
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+
+class IngestionLog:
+    """
+    Journal append-only des ingestions (write-ahead log).
+
+    Chaque ingestion ajoute une trame : les vecteurs ajoutés à l'index et les
+    métadonnées des chunks. La trame est écrite puis synchronisée sur disque
+    (fsync) : le coût par ingestion ne dépend plus de la taille du corpus.
+    Au redémarrage, les trames sont rejouées sur le dernier snapshot ; une trame
+    incomplète (crash pendant l'écriture) est détectée par son CRC et ignorée.
+
+    Format d'une trame : MAGIC (4 octets) | longueur (uint64) | crc32 (uint32) | payload (pickle).
+    """
+
+    MAGIC = b"RAGL"
+    HEADER = struct.Struct("<4sQI")
+
+    def __init__(self, path):
+        self.path = path
+        self.vector_count = 0  # vecteurs présents dans le journal depuis le dernier snapshot
+        self.valid_length = 0  # fin de la dernière trame complète lue
+        self.torn_tail = False  # une trame incomplète a été rencontrée à la dernière lecture
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def size_bytes(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def append(self, record, vectors):
+        """
+        Ajoute une trame et la synchronise sur disque.
+        Retourne la position du journal avant l'écriture (pour `truncate`).
+        """
+        payload = pickle.dumps(
+            {"record": record, "vectors": np.ascontiguousarray(vectors, dtype='float32')},
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+        header = self.HEADER.pack(self.MAGIC, len(payload), zlib.crc32(payload))
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(header + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.vector_count += len(vectors)
+        return offset
+
+    def truncate(self, offset):
+        """Ramène le journal à `offset` octets (annulation de la dernière trame)."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+b") as f:
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+        self.vector_count = sum(len(vectors) for _, vectors in self.read())
+
+    def reset(self):
+        """Vide le journal (après l'écriture d'un snapshot complet)."""
+        with open(self.path, "wb") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.vector_count = 0
+
+    def read(self):
+        """
+        Itère sur les trames complètes (record, vectors).
+        S'arrête à la première trame tronquée ou corrompue.
+        """
+        self.valid_length = 0
+        self.torn_tail = False
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return
+                magic, length, crc = self.HEADER.unpack(header)
+                if magic != self.MAGIC:
+                    print(f"Journal {self.path} : trame invalide ignorée (en-tête corrompu).")
+                    self.torn_tail = True
+                    return
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    print(f"Journal {self.path} : trame incomplète ignorée (écriture interrompue).")
+                    self.torn_tail = True
+                    return
+                self.valid_length = f.tell()
+                frame = pickle.loads(payload)
+                yield frame["record"], frame["vectors"]
+
+    def replay_into(self, index, chunk_store, processed_hashes, on_vectors_added=None, last_committed_id=None):
+        """
+        Rejoue le journal sur un état chargé depuis le snapshot.
+        Les trames déjà présentes dans l'index ou le ChunkStore sont ignorées (rejeu idempotent).
+        on_vectors_added(record, vectors) est appelé pour chaque trame réellement ajoutée à l'index.
+        last_committed_id : plus grand ID Faiss validé dans SQLite. Une trame qui commence au-delà
+        a été écrite par un commit interrompu avant la validation SQLite : elle et les suivantes
+        (même transaction) sont retirées du journal.
+        Retourne le nombre de vecteurs rejoués dans l'index.
+        """
+        replayed = 0
+        self.vector_count = 0
+        frame_start = 0
+        uncommitted_from = None
+        for record, vectors in self.read():
+            start_index = record["start_index"]
+            if last_committed_id is not None and start_index > last_committed_id:
+                print(f"Journal {self.path} : trame à l'ID {start_index} ({record['original_filename']}) "
+                      f"absente de SQLite (commit interrompu), ignorée.")
+                uncommitted_from = frame_start
+                break
+            frame_start = self.valid_length
+            self.vector_count += len(vectors)
+            if start_index > index.ntotal or start_index > len(chunk_store):
+                print(f"Journal {self.path} : trame à l'ID {start_index} non contiguë, rejeu interrompu.")
+                break
+            if start_index == index.ntotal:
+                index.add(vectors)
+                replayed += len(vectors)
+                if on_vectors_added is not None:
+                    on_vectors_added(record, vectors)
+            if start_index == len(chunk_store):
+                chunk_store.append_chunks(
+                    record["file_hash"], record["original_filename"], record["chunks"], **record["filters"]
+                )
+            processed_hashes.add(record["file_hash"])
+        if uncommitted_from is not None:
+            self.truncate(uncommitted_from)
+        elif self.torn_tail:
+            # Supprimer la trame incomplète pour que les prochains ajouts restent lisibles.
+            self.truncate(self.valid_length)
+        return replayed
@@ -0,0 +1,220 @@
+import io
+import os
+import time
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from Utilitaire.file_processor import FileProcessor, AlreadyProcessedError
+
+
+SUPPORTED_EXTENSIONS = {'.txt', '.pdf', '.docx', '.json', '.pptx'}
+
+# FileProcessor propre à chaque processus du pool (créé au premier document traité)
+_worker_processor = None
+
+
+class IngestionCancelled(Exception):
+    """Levée quand l'annulation d'un lot est demandée avant son commit."""
+
+
+def _extract_document(job, processor=None):
+    """
+    Étape CPU exécutée dans un processus du pool : lecture, nettoyage et découpage d'un fichier.
+    job: (base_filename, file_content_bytes, config) où config vient de FileProcessor.config()
+    processor: FileProcessor à utiliser hors du pool (par défaut, celui du processus worker).
+    Retourne (base_filename, chunks, file_hash, erreur).
+    """
+    global _worker_processor
+    base_filename, file_content_bytes, config = job
+    if processor is None:
+        # Le lot est déjà parallélisé par fichier : pas de second pool pour les pages PDF
+        config = dict(config, pdf_workers=1)
+        if _worker_processor is None or _worker_processor.config() != config:
+            _worker_processor = FileProcessor(**config)
+        processor = _worker_processor
+    try:
+        chunks, file_hash = processor.extract_chunks(base_filename, file_content_bytes)
+        return base_filename, chunks, file_hash, None
+    except Exception as e:
+        return base_filename, None, None, str(e)
+
+
+class IngestionPipeline:
+    """
+    Ingestion par lot de plusieurs fichiers (ou d'archives zip) en trois étapes :
+      1. extraction + nettoyage + découpage dans un pool de processus (un fichier par tâche) ;
+      2. un seul passage d'embedding, batché, sur les chunks de tous les fichiers ;
+      3. un seul commit Faiss + SQLite via RAGChatbot.commit_documents.
+    Les fichiers déjà indexés (même hash) ou en double dans le lot sont ignorés.
+    """
+
+    def __init__(self, chatbot, max_workers=None):
+        self.chatbot = chatbot
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # « spawn » : pas de fork d'un processus qui a déjà chargé le modèle et ses threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    @staticmethod
+    def expand_uploads(files):
+        """
+        Déplie les archives zip : retourne une liste (base_filename, bytes) et la liste des fichiers ignorés.
+        files: liste de (nom de fichier, bytes)
+        """
+        documents, skipped = [], []
+        for filename, content in files:
+            extension = os.path.splitext(filename)[1].lower()
+            if extension == '.zip':
+                try:
+                    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                        for info in archive.infolist():
+                            name = info.filename
+                            if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.'):
+                                continue
+                            if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                                skipped.append({"file": f"{filename}/{name}", "reason": "type non pris en charge"})
+                                continue
+                            documents.append((os.path.basename(name), archive.read(info)))
+                except zipfile.BadZipFile as e:
+                    skipped.append({"file": filename, "reason": f"archive invalide : {e}"})
+            elif extension in SUPPORTED_EXTENSIONS:
+                documents.append((filename, content))
+            else:
+                skipped.append({"file": filename, "reason": "type non pris en charge"})
+        return documents, skipped
+
+    def extract(self, documents, on_document=None):
+        """
+        Étape 1 : retourne [(base_filename, chunks, file_hash, erreur)] dans l'ordre des documents.
+        on_document(traités, total) est appelé à chaque fichier terminé.
+        """
+        processor = self.chatbot.file_processor
+        config = processor.config()
+        jobs = [(name, content, config) for name, content in documents]
+        results = [None] * len(jobs)
+        if len(jobs) <= 1 or self.max_workers <= 1:
+            # Un seul fichier : traité dans ce processus (les grands PDF restent parallélisés par pages)
+            for i, job in enumerate(jobs):
+                results[i] = _extract_document(job, processor)
+                if on_document is not None:
+                    on_document(i + 1, len(jobs))
+            return results
+        executor = self._get_executor()
+        futures = {executor.submit(_extract_document, job): i for i, job in enumerate(jobs)}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if on_document is not None:
+                    on_document(done, len(jobs))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return results
+
+    def run(self, files, filters, progress=None, should_cancel=None):
+        """
+        Ingère un lot de fichiers avec les mêmes filtres (département, filière, ...).
+        files: liste de (nom de fichier, bytes) ; les .zip sont dépliés.
+        progress(étape, fraction) : suivi optionnel (étapes « extraction », « embedding », « commit ») ;
+        should_cancel() : si elle retourne True avant le commit, IngestionCancelled est levée
+        et rien n'est indexé.
+        Retourne un rapport : fichiers indexés, ignorés, en erreur, chunks dédupliqués et durée de chaque étape.
+        """
+        def checkpoint(stage, done, total):
+            if should_cancel is not None and should_cancel():
+                raise IngestionCancelled()
+            if progress is not None:
+                progress(stage, done / total if total else 1.0)
+
+        report = {"indexed": [], "skipped": [], "errors": [], "deduplicated": {"exact": 0, "near": 0}, "timings": {}}
+        documents, report["skipped"] = self.expand_uploads(files)
+        if not documents:
+            return report
+
+        start = time.perf_counter()
+        extracted = self.extract(documents, lambda done, total: checkpoint("extraction", done, total))
+        report["timings"]["extraction_s"] = round(time.perf_counter() - start, 3)
+
+        processed_hashes = self.chatbot.file_processor.processed_hashes
+        ready, batch_hashes = [], set()
+        for base_filename, chunks, file_hash, error in extracted:
+            if error:
+                report["errors"].append({"file": base_filename, "error": error})
+            elif not chunks:
+                report["skipped"].append({"file": base_filename, "reason": "aucun contenu exploitable"})
+            elif file_hash in processed_hashes or file_hash in batch_hashes:
+                report["skipped"].append({"file": base_filename, "reason": "déjà traité", "file_hash": file_hash})
+            else:
+                batch_hashes.add(file_hash)
+                ready.append({"base_filename": base_filename, "file_hash": file_hash, "chunks": chunks})
+        if not ready:
+            return report
+
+        # Étapes 2 et 3, reprises sans les documents validés entre-temps par une ingestion concurrente
+        vectors = np.empty((0, self.chatbot.dimension), dtype='float32')
+        rows = {}  # texte du chunk -> ligne de `vectors` (jamais ré-encodé à la reprise)
+        report["timings"]["embedding_s"] = report["timings"]["commit_s"] = 0.0
+        while ready:
+            # Étape 2 : un seul passage d'embedding sur les chunks du lot absents de l'index (hors quasi-doublons)
+            start = time.perf_counter()
+            exact, near = self.chatbot.plan_deduplication(ready, filters.get("departement_id"), filters.get("filiere_id"))
+            report["deduplicated"] = {"exact": exact, "near": near}
+            all_chunks = list(dict.fromkeys(
+                chunk for document in ready for chunk in document["to_encode"] if chunk not in rows
+            ))
+            embeddings = self.chatbot.embed_chunks(
+                all_chunks, lambda done, total: checkpoint("embedding", done, total)
+            )
+            if embeddings.shape[0] != len(all_chunks):
+                raise ValueError("Échec de la génération d'embeddings pour le lot.")
+            rows.update((chunk, len(vectors) + i) for i, chunk in enumerate(all_chunks))
+            vectors = np.vstack([vectors, embeddings])
+            for document in ready:
+                document["embeddings"] = vectors[[rows[chunk] for chunk in document["to_encode"]]]
+            report["timings"]["embedding_s"] = round(report["timings"]["embedding_s"] + time.perf_counter() - start, 3)
+
+            # Étape 3 : un seul commit Faiss + SQLite
+            checkpoint("commit", 0, 1)  # Dernier point d'annulation
+            start = time.perf_counter()
+            try:
+                self.chatbot.commit_documents(ready, filters)
+                break
+            except AlreadyProcessedError as e:
+                committed = set(e.file_hashes)
+                report["skipped"].extend(
+                    {"file": document["base_filename"], "reason": "déjà traité", "file_hash": document["file_hash"]}
+                    for document in ready if document["file_hash"] in committed
+                )
+                ready = [document for document in ready if document["file_hash"] not in committed]
+            finally:
+                report["timings"]["commit_s"] = round(report["timings"]["commit_s"] + time.perf_counter() - start, 3)
+        if not ready:
+            return report
+
+        report["indexed"] = [
+            {"file": document["base_filename"], "file_hash": document["file_hash"], "chunks": len(document["chunks"])}
+            for document in ready
+        ]
+        print(f"Lot ingéré : {len(ready)} fichiers, {len(rows)} chunks encodés. "
+              f"L'index Faiss contient maintenant {self.chatbot.index.ntotal} vecteurs.")
+        return report
@@ -0,0 +1,130 @@
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+
+class LexicalIndex:
+    """
+    Index lexical BM25 sur document_metadata.chunk_text (SQLite FTS5).
+
+    La table FTS5 est à contenu externe : elle ne duplique pas les textes et des
+    triggers la maintiennent dans la même transaction que les insertions de
+    FilterManager.insert_metadata_sqlite_bulk (ingestion incrémentale, rollback inclus).
+    Les recherches appliquent les mêmes filtres département/filière que
+    FilterManager.get_allowed_indices et retournent des ID Faiss globaux (chunk_index).
+
+    chunk_text est le texte nettoyé à l'ingestion (minuscules, sans ponctuation, chiffres ni
+    stop words) : `normalize` applique le même nettoyage à la requête, sans quoi un terme
+    comme « INF301 » ne correspondrait jamais au token indexé « inf ».
+    """
+
+    TABLE = "document_metadata_fts"
+    TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+    MAX_QUERY_TERMS = 32
+
+    def __init__(self, db_path, normalize=None):
+        self.db_path = db_path
+        self.normalize = normalize
+        self.available = None  # None : pas encore vérifié ; False : FTS5 indisponible
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def ensure(self):
+        """Crée la table FTS5 et ses triggers si besoin, puis l'alimente avec les chunks existants."""
+        with self._init_lock:
+            if self.available is not None:
+                return self.available
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.TABLE,))
+                exists = cursor.fetchone() is not None
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+                    "chunk_text, content='document_metadata', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {self.TABLE}_ai AFTER INSERT ON document_metadata BEGIN "
+                    f"INSERT INTO {self.TABLE}(rowid, chunk_text) VALUES (new.id, new.chunk_text); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {self.TABLE}_ad AFTER DELETE ON document_metadata BEGIN "
+                    f"INSERT INTO {self.TABLE}({self.TABLE}, rowid, chunk_text) VALUES ('delete', old.id, old.chunk_text); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {self.TABLE}_au AFTER UPDATE OF chunk_text ON document_metadata BEGIN "
+                    f"INSERT INTO {self.TABLE}({self.TABLE}, rowid, chunk_text) VALUES ('delete', old.id, old.chunk_text); "
+                    f"INSERT INTO {self.TABLE}(rowid, chunk_text) VALUES (new.id, new.chunk_text); END"
+                )
+                if not exists:
+                    print("Construction de l'index lexical FTS5 sur les chunks existants...")
+                    cursor.execute(f"INSERT INTO {self.TABLE}({self.TABLE}) VALUES ('rebuild')")
+                conn.commit()
+                self.available = True
+            except sqlite3.OperationalError as e:
+                print(f"Index lexical indisponible (FTS5 non supporté ?) : {e}")
+                self.available = False
+            finally:
+                conn.close()
+            return self.available
+
+    @classmethod
+    def build_match_query(cls, user_query):
+        """Requête FTS5 « terme1 OR terme2 ... » ; chaque terme est échappé entre guillemets."""
+        terms = []
+        for token in cls.TOKEN_PATTERN.findall(user_query.lower()):
+            if token not in terms:
+                terms.append(token)
+        return " OR ".join(f'"{term}"' for term in terms[:cls.MAX_QUERY_TERMS])
+
+    def search(self, user_query, departement_id=None, filiere_id=None, k=20):
+        """
+        Retourne (ids Faiss, scores BM25) des k meilleurs chunks, meilleur d'abord.
+        Le score BM25 de SQLite est négatif (plus petit = meilleur) ; il est retourné changé de signe.
+        """
+        empty = (np.empty(0, dtype='int64'), np.empty(0, dtype='float32'))
+        if not self.ensure():
+            return empty
+        match_query = self.build_match_query(self.normalize(user_query) if self.normalize else user_query)
+        if not match_query:
+            return empty
+        rows = self._connection().execute(
+            f"SELECT d.chunk_index, bm25({self.TABLE}) AS score "
+            f"FROM {self.TABLE} JOIN document_metadata d ON d.id = {self.TABLE}.rowid "
+            f"WHERE {self.TABLE} MATCH ? "
+            "AND (? IS NULL OR d.departement_id = ?) AND (? IS NULL OR d.filiere_id = ?) "
+            "ORDER BY score LIMIT ?",
+            (match_query, departement_id, departement_id, filiere_id, filiere_id, k)
+        ).fetchall()
+        if not rows:
+            return empty
+        # Plusieurs lignes peuvent partager un ID Faiss (chunks dédupliqués) : garder la meilleure
+        best = {}
+        for chunk_index, score in rows:
+            best.setdefault(chunk_index, score)
+        ids, scores = zip(*best.items())
+        return np.array(ids, dtype='int64'), -np.array(scores, dtype='float32')
+
+    @staticmethod
+    def reciprocal_rank_fusion(rankings, k=60, weights=None):
+        """
+        Fusion RRF de plusieurs listes d'IDs classées : score(id) = somme des w / (k + rang).
+        Retourne les IDs fusionnés, meilleur d'abord (à égalité, ordre de première apparition).
+        """
+        weights = weights or [1.0] * len(rankings)
+        fused = {}
+        for ranking, weight in zip(rankings, weights):
+            for rank, faiss_id in enumerate(np.asarray(ranking).tolist(), 1):
+                fused[faiss_id] = fused.get(faiss_id, 0.0) + weight / (k + rank)
+        ordered = sorted(fused, key=lambda faiss_id: -fused[faiss_id])
+        return np.array(ordered, dtype='int64')
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class MMR:
+    """
+    Maximal Marginal Relevance vectorisé.
+
+    La matrice de similarité candidat-candidat est calculée une seule fois ; à chaque
+    étape, un vecteur « similarité max avec la sélection » est mis à jour en une
+    opération NumPy au lieu d'une boucle Python sur les paires. Même sélection que
+    l'implémentation d'origine de RAGChatbot.mmr (premier indice en cas d'égalité).
+    """
+
+    @staticmethod
+    def select(query_embedding, candidate_embeddings, k=3, lambda_param=0.5):
+        """
+        query_embedding: np.array de shape (dim,)
+        candidate_embeddings: np.array de shape (n, dim)
+        Retourne la liste des indices sélectionnés, dans l'ordre de sélection.
+        """
+        candidates = np.asarray(candidate_embeddings, dtype='float32')
+        if candidates.ndim != 2 or candidates.shape[0] == 0:
+            return []
+        query = np.asarray(query_embedding, dtype='float32').reshape(-1)
+        n = candidates.shape[0]
+        relevance = candidates @ query
+        pairwise = candidates @ candidates.T
+        available = np.ones(n, dtype=bool)
+        selected = [int(np.argmax(relevance))]  # Premier choix : pertinence seule
+        available[selected[0]] = False
+        max_similarity = pairwise[selected[0]].copy()
+        for _ in range(min(k, n) - 1):
+            scores = lambda_param * relevance - (1 - lambda_param) * max_similarity
+            scores[~available] = -np.inf
+            idx = int(np.argmax(scores))
+            selected.append(idx)
+            available[idx] = False
+            np.maximum(max_similarity, pairwise[idx], out=max_similarity)
+        return selected
+
+    @staticmethod
+    def select_batch(query_embeddings, candidate_embeddings, k=3, lambda_param=0.5, candidate_counts=None):
+        """
+        MMR pour plusieurs requêtes à la fois.
+        query_embeddings: (b, dim)
+        candidate_embeddings: (b, n, dim), ou liste de b tableaux (n_i, dim) de tailles différentes
+        candidate_counts: nombre de candidats valides par requête si candidate_embeddings est complété (padding)
+        Retourne une liste de b listes d'indices.
+        """
+        queries = np.asarray(query_embeddings, dtype='float32')
+        if isinstance(candidate_embeddings, (list, tuple)):
+            candidate_counts = np.array([len(c) for c in candidate_embeddings], dtype='int64')
+            width = int(candidate_counts.max()) if len(candidate_counts) else 0
+            candidates = np.zeros((len(candidate_embeddings), width, queries.shape[1]), dtype='float32')
+            for i, c in enumerate(candidate_embeddings):
+                if len(c):
+                    candidates[i, :len(c)] = c
+        else:
+            candidates = np.asarray(candidate_embeddings, dtype='float32')
+        batch, width = candidates.shape[0], candidates.shape[1]
+        if candidate_counts is None:
+            candidate_counts = np.full(batch, width, dtype='int64')
+        if batch == 0 or width == 0:
+            return [[] for _ in range(batch)]
+
+        relevance = np.matmul(candidates, queries[:, :, np.newaxis])[:, :, 0]  # (b, n)
+        pairwise = np.matmul(candidates, candidates.transpose(0, 2, 1))  # (b, n, n)
+        available = np.arange(width)[np.newaxis, :] < np.asarray(candidate_counts)[:, np.newaxis]
+        max_similarity = np.full((batch, width), -np.inf, dtype='float32')
+        rows = np.arange(batch)
+        steps = min(k, int(np.max(candidate_counts)))
+        selections = [[] for _ in range(batch)]
+
+        for step in range(steps):
+            active = available.any(axis=1)
+            if not active.any():
+                break
+            if step == 0:
+                scores = relevance.copy()  # Premier choix : pertinence seule
+            else:
+                scores = lambda_param * relevance - (1 - lambda_param) * max_similarity
+            scores[~available] = -np.inf
+            chosen = np.argmax(scores, axis=1)
+            for b in np.nonzero(active)[0]:
+                selections[b].append(int(chosen[b]))
+            available[rows[active], chosen[active]] = False
+            # Similarité max avec la sélection, mise à jour avec la ligne du candidat choisi
+            max_similarity = np.maximum(max_similarity, pairwise[rows, chosen])
+        return selections
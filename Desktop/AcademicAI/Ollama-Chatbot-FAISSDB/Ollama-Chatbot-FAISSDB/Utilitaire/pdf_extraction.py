@@ -0,0 +1,90 @@
+import io
+import os
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+# Module volontairement léger (PyPDF2 seul) : c'est lui que les processus du pool importent.
+
+_pdf_executors = {}  # nombre de workers -> pool de processus
+_pdf_executor_lock = threading.Lock()
+# Lecteur du PDF en cours, gardé par chaque worker entre deux plages du même fichier
+_worker_reader = (None, None)
+
+
+def _extract_pdf_page_range(job):
+    """
+    Exécuté dans un processus du pool : texte des pages [start, end) du fichier pdf_path.
+    Retourne la liste des textes de page (chaîne vide si aucun texte extrait).
+    """
+    global _worker_reader
+    pdf_path, start, end = job
+    if _worker_reader[0] != pdf_path:
+        _worker_reader = (pdf_path, PyPDF2.PdfReader(pdf_path))
+    pdf_reader = _worker_reader[1]
+    return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _get_pdf_executor(max_workers):
+    """
+    Pool de processus partagé pour l'extraction PDF, créé au premier usage.
+    Un pool par nombre de workers : un appel avec une autre taille n'arrête jamais
+    un pool dont les plages sont en cours d'extraction.
+    """
+    with _pdf_executor_lock:
+        executor = _pdf_executors.get(max_workers)
+        if executor is None:
+            # « spawn » : pas de fork d'un processus qui a déjà chargé le modèle et ses threads
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            _pdf_executors[max_workers] = executor
+        return executor
+
+
+def iter_pdf_pages(file_content_bytes, workers=1, parallel_min_pages=64, pages_per_task=16):
+    """
+    Génère le texte de chaque page d'un PDF, dans l'ordre.
+    À partir de parallel_min_pages pages, les plages de pages_per_task pages sont extraites
+    en parallèle dans un pool de `workers` processus (au plus 2 plages en cours par worker,
+    ce qui borne la mémoire) ; en dessous, ou avec un seul worker, extraction en série.
+    """
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content_bytes))
+    page_count = len(pdf_reader.pages)
+    if workers <= 1 or page_count < parallel_min_pages:
+        for page in pdf_reader.pages:
+            yield page.extract_text()
+        return
+
+    # Les workers relisent le PDF depuis un fichier temporaire plutôt que de recevoir les bytes à chaque plage
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(file_content_bytes)
+        pdf_path = f.name
+    pending = deque()
+    try:
+        executor = _get_pdf_executor(workers)
+        ranges = iter(range(0, page_count, pages_per_task))
+
+        def submit_next():
+            start = next(ranges, None)
+            if start is not None:
+                pending.append(executor.submit(
+                    _extract_pdf_page_range, (pdf_path, start, min(start + pages_per_task, page_count))
+                ))
+            return start is not None
+
+        while len(pending) < 2 * workers and submit_next():
+            pass
+        while pending:
+            page_texts = pending.popleft().result()
+            submit_next()
+            yield from page_texts
+    finally:
+        for future in pending:
+            future.cancel()
+        for future in pending:
+            if not future.cancelled():
+                future.exception()  # Attendre la fin de la plage avant de supprimer le fichier
+        os.remove(pdf_path)
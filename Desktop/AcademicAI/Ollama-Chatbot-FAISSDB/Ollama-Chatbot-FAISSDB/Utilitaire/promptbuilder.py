@@ -9,6 +9,15 @@ class PromptBuilder:
         ]
         return any(keyword.lower() in user_query.lower() for keyword in qcm_keywords)
 
+    @staticmethod
+    def get_prompt_type(user_query: str) -> str:
+        """Type de prompt utilisé pour la question : 'qcm', 'summary' ou 'standard'."""
+        if PromptBuilder.is_qcm_request(user_query):
+            return "qcm"
+        if "résumé" in user_query.lower() or "synthèse" in user_query.lower():
+            return "summary"
+        return "standard"
+
     @staticmethod
     def build_standard_prompt(context_text, user_query):
         return (
@@ -0,0 +1,74 @@
+import time
+import threading
+
+import numpy as np
+
+
+class CrossEncoderReranker:
+    """
+    Reranking des candidats Faiss par un petit cross-encoder (CPU).
+
+    Le pool de candidats (déjà trié par similarité dense) est scoré en une seule
+    passe batchée. Un budget de latence limite le nombre de candidats reclassés :
+    le coût par paire (question, chunk) est mesuré à chaque appel (moyenne glissante)
+    et seuls les premiers candidats qui tiennent dans le budget sont envoyés au modèle.
+    Le modèle est chargé au premier appel.
+    """
+
+    # Multilingue (corpus en français), 12 couches MiniLM : quelques ms par paire sur CPU.
+    DEFAULT_MODEL = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'
+
+    def __init__(self, model_name=DEFAULT_MODEL, latency_budget_ms=150.0, max_candidates=50,
+                 min_candidates=5, max_length=384, smoothing=0.2):
+        self.model_name = model_name
+        self.latency_budget_ms = latency_budget_ms
+        self.max_candidates = max_candidates
+        self.min_candidates = min_candidates
+        self.max_length = max_length
+        self.smoothing = smoothing
+        self.ms_per_pair = None  # estimé après le premier appel
+        self.last_latency_ms = None
+        self.last_reranked = 0
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                print(f"Chargement du cross-encoder {self.model_name}...")
+                self._model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+            return self._model
+
+    def budgeted_size(self, n_candidates):
+        """Nombre de candidats reclassables dans le budget de latence."""
+        limit = min(n_candidates, self.max_candidates)
+        if self.ms_per_pair is None or self.latency_budget_ms is None:
+            return limit
+        affordable = int(self.latency_budget_ms // max(self.ms_per_pair, 1e-3))
+        return max(min(limit, affordable), min(self.min_candidates, limit))
+
+    def rerank(self, query, texts, top_k):
+        """
+        Reclasse `texts` (triés par score dense) pour `query`.
+        Retourne (indices dans texts, scores du cross-encoder), les top_k meilleurs d'abord.
+        Les candidats hors budget ne sont pas reclassés et ne sont pas retournés.
+        """
+        n = self.budgeted_size(len(texts))
+        if n == 0:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='float32')
+        model = self._get_model()
+        start = time.perf_counter()
+        scores = np.asarray(
+            model.predict([(query, text) for text in texts[:n]], batch_size=n, show_progress_bar=False),
+            dtype='float32'
+        ).reshape(-1)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        per_pair = elapsed_ms / n
+        self.ms_per_pair = per_pair if self.ms_per_pair is None else (
+            (1 - self.smoothing) * self.ms_per_pair + self.smoothing * per_pair
+        )
+        self.last_latency_ms = elapsed_ms
+        self.last_reranked = n
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return order, scores[order]
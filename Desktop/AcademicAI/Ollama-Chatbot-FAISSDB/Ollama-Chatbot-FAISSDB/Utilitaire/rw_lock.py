@@ -0,0 +1,60 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Verrou lecteurs / rédacteur pour l'état de recherche (index Faiss, ChunkStore, partitions, tombstones).
+
+    Plusieurs recherches s'exécutent en parallèle (`read`) ; un ajout à l'index HNSW ou la publication
+    d'un nouvel état (`write`) attend la fin des recherches en cours et s'exécute seul. Un rédacteur
+    en attente est prioritaire sur les nouveaux lecteurs (pas de famine des ingestions).
+    Le rédacteur peut ré-entrer dans `write` ou `read` ; un lecteur ne doit pas ré-entrer dans `read`.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        if self._writer == threading.get_ident():
+            yield  # lecture imbriquée dans une écriture du même thread
+            return
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer, self._writer_depth = me, 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if self._writer_depth == 0:
+                    self._writer = None
+                    self._condition.notify_all()
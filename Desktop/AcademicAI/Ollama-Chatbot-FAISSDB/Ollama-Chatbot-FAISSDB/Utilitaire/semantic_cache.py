@@ -0,0 +1,140 @@
+import time
+import threading
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache sémantique des réponses du LLM.
+
+    Une entrée associe (embedding de la question, departement_id, filiere_id, type de prompt)
+    à une réponse. Une question est servie depuis le cache si sa similarité cosinus
+    avec une question déjà posée pour le même locataire et le même type de prompt
+    dépasse `threshold`. Les embeddings sont normalisés : la similarité est un produit scalaire.
+
+    Éviction : expiration après `ttl_seconds`, puis LRU au-delà de `max_entries_per_key`
+    entrées par clé. Les clés concernées sont invalidées à chaque ingestion pour le locataire ;
+    `generation(departement_id, filiere_id)` permet d'écarter une réponse générée avant une
+    invalidation qui concerne ce locataire (les invalidations des autres locataires sont sans effet).
+    """
+
+    def __init__(self, threshold=0.95, ttl_seconds=3600, max_entries_per_key=512):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_key = max_entries_per_key
+        self._buckets = {}  # (departement_id, filiere_id, prompt_type) -> dict de colonnes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._invalidations = {}  # (departement_id, filiere_id) invalidé -> nombre d'invalidations
+        self._epoch = 0           # incrémenté à chaque vidage complet
+
+    @staticmethod
+    def _covers(departement_id, filiere_id, invalidated):
+        """Une entrée du locataire (departement_id, filiere_id) dépend-elle des documents de `invalidated` ?"""
+        return ((departement_id is None or departement_id == invalidated[0])
+                and (filiere_id is None or filiere_id == invalidated[1]))
+
+    def _generation(self, departement_id, filiere_id):
+        return self._epoch, sum(
+            count for invalidated, count in self._invalidations.items()
+            if self._covers(departement_id, filiere_id, invalidated)
+        )
+
+    def generation(self, departement_id, filiere_id):
+        """Jeton à lire avant la génération d'une réponse, puis à repasser à store."""
+        with self._lock:
+            return self._generation(departement_id, filiere_id)
+
+    @staticmethod
+    def _new_bucket(dimension):
+        return {
+            "embeddings": np.empty((0, dimension), dtype='float32'),
+            "answers": [],
+            "created": np.empty(0, dtype='float64'),
+            "last_used": np.empty(0, dtype='float64'),
+        }
+
+    @staticmethod
+    def _keep(bucket, mask):
+        bucket["embeddings"] = bucket["embeddings"][mask]
+        bucket["answers"] = [answer for answer, keep in zip(bucket["answers"], mask) if keep]
+        bucket["created"] = bucket["created"][mask]
+        bucket["last_used"] = bucket["last_used"][mask]
+
+    def _purge_expired(self, bucket, now):
+        if self.ttl_seconds is None or len(bucket["answers"]) == 0:
+            return
+        alive = (now - bucket["created"]) < self.ttl_seconds
+        if not alive.all():
+            self._keep(bucket, alive)
+
+    def lookup(self, query_embedding, departement_id, filiere_id, prompt_type):
+        """Retourne la réponse en cache la plus proche au-delà du seuil, sinon None."""
+        key = (departement_id, filiere_id, prompt_type)
+        query = np.asarray(query_embedding, dtype='float32').reshape(-1)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                self._purge_expired(bucket, now)
+            if bucket is None or len(bucket["answers"]) == 0:
+                self.misses += 1
+                return None
+            similarities = bucket["embeddings"] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            bucket["last_used"][best] = now
+            self.hits += 1
+            return bucket["answers"][best]
+
+    def store(self, query_embedding, departement_id, filiere_id, prompt_type, answer, generation=None):
+        """
+        Enregistre une réponse. Si `generation` (lue avant la génération) ne correspond plus,
+        une ingestion a eu lieu entre-temps pour ce locataire et la réponse n'est pas mise en cache.
+        """
+        key = (departement_id, filiere_id, prompt_type)
+        query = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self._generation(departement_id, filiere_id):
+                return
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = self._new_bucket(query.shape[1])
+            self._purge_expired(bucket, now)
+            if len(bucket["answers"]) >= self.max_entries_per_key:
+                # LRU : retirer l'entrée utilisée le moins récemment
+                mask = np.ones(len(bucket["answers"]), dtype=bool)
+                mask[int(np.argmin(bucket["last_used"]))] = False
+                self._keep(bucket, mask)
+            bucket["embeddings"] = np.vstack([bucket["embeddings"], query])
+            bucket["answers"].append(answer)
+            bucket["created"] = np.append(bucket["created"], now)
+            bucket["last_used"] = np.append(bucket["last_used"], now)
+
+    def invalidate_tenant(self, departement_id, filiere_id):
+        """
+        Invalide les réponses dont le contexte peut inclure des documents du locataire
+        (departement_id, filiere_id) : même sémantique de filtre que FilterManager.get_allowed_indices,
+        un filtre à None couvre toutes les valeurs.
+        """
+        invalidated = (departement_id, filiere_id)
+        with self._lock:
+            self._invalidations[invalidated] = self._invalidations.get(invalidated, 0) + 1
+            for key in list(self._buckets):
+                if self._covers(key[0], key[1], invalidated):
+                    del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = sum(len(bucket["answers"]) for bucket in self._buckets.values())
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "keys": len(self._buckets)}
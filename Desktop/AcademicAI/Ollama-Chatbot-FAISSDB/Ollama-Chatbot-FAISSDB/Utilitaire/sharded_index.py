@@ -0,0 +1,228 @@
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+
+class ShardedIndex:
+    """
+    Index Faiss partitionné par (departement_id, filiere_id).
+
+    Chaque partition est un IndexIDMap2(IndexHNSWFlat) qui conserve les ID Faiss
+    globaux (ceux stockés dans document_metadata.chunk_index) : les résultats
+    sont donc directement comparables à ceux de l'index principal.
+    Les partitions sont chargées à la demande et évincées selon une politique LRU.
+    """
+
+    SHARD_FILE_PATTERN = re.compile(r"^shard_(none|-?\d+)_(none|-?\d+)\.faiss$")
+
+    def __init__(self, shard_dir, dimension, m=32, ef_search=100, ef_construction=80, max_loaded_shards=16):
+        self.shard_dir = shard_dir
+        self.dimension = dimension
+        self.m = m
+        self.ef_search = ef_search
+        self.ef_construction = ef_construction
+        self.max_loaded_shards = max_loaded_shards
+        self._shards = OrderedDict()  # clé -> index chargé (ordre LRU)
+        self._dirty = set()
+        self._keys = None  # clés de toutes les partitions, lues une fois sur disque puis tenues à jour
+        self._lock = threading.RLock()
+        self._get_index = None
+        self._get_tenant_ids = None
+
+    def set_source(self, get_index, get_tenant_ids):
+        """
+        Déclare l'index principal comme source de vérité : une partition chargée
+        qui n'a pas été sauvegardée après les derniers ajouts (crash) est rattrapée
+        à partir des vecteurs de l'index principal.
+        get_tenant_ids(key) retourne les ID Faiss globaux du locataire.
+        """
+        self._get_index = get_index
+        self._get_tenant_ids = get_tenant_ids
+
+    # --- Clés et fichiers ---
+    @staticmethod
+    def shard_key(departement_id, filiere_id):
+        return (
+            int(departement_id) if departement_id is not None else None,
+            int(filiere_id) if filiere_id is not None else None,
+        )
+
+    def shard_path(self, key):
+        departement_id, filiere_id = key
+        dep = "none" if departement_id is None else str(departement_id)
+        fil = "none" if filiere_id is None else str(filiere_id)
+        return os.path.join(self.shard_dir, f"shard_{dep}_{fil}.faiss")
+
+    def known_keys(self):
+        """Clés de toutes les partitions existantes (sur disque ou en mémoire)."""
+        with self._lock:
+            if self._keys is None:
+                # Seul accès au répertoire : ensuite, création, remplacement et suppression tiennent l'ensemble à jour
+                self._keys = set(self._shards.keys())
+                if os.path.isdir(self.shard_dir):
+                    for filename in os.listdir(self.shard_dir):
+                        match = self.SHARD_FILE_PATTERN.match(filename)
+                        if match:
+                            self._keys.add(tuple(None if part == "none" else int(part) for part in match.groups()))
+            return set(self._keys)
+
+    def keys_matching(self, departement_id=None, filiere_id=None):
+        """Partitions correspondant au filtre (même sémantique que FilterManager.get_allowed_indices)."""
+        return sorted(
+            (key for key in self.known_keys()
+             if (departement_id is None or key[0] == departement_id)
+             and (filiere_id is None or key[1] == filiere_id)),
+            key=lambda key: tuple(-1 if part is None else part for part in key)
+        )
+
+    # --- Chargement / éviction ---
+    def _new_shard(self):
+        hnsw = faiss.IndexHNSWFlat(self.dimension, self.m, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efSearch = self.ef_search
+        hnsw.hnsw.efConstruction = self.ef_construction
+        return faiss.IndexIDMap2(hnsw)
+
+    def get_shard(self, key, create=False):
+        with self._lock:
+            if key in self._shards:
+                self._shards.move_to_end(key)
+                return self._shards[key]
+            path = self.shard_path(key)
+            if os.path.exists(path):
+                shard = faiss.read_index(path)
+                faiss.downcast_index(shard.index).hnsw.efSearch = self.ef_search
+            elif create:
+                shard = self._new_shard()
+            else:
+                return None
+            self._shards[key] = shard
+            if self._keys is not None:
+                self._keys.add(key)
+            self._catch_up(key, shard)
+            self._evict_if_needed()
+            return shard
+
+    def _catch_up(self, key, shard):
+        if self._get_index is None:
+            return
+        ids = np.asarray(self._get_tenant_ids(key), dtype='int64')
+        high_water = faiss.vector_to_array(shard.id_map).max() if shard.ntotal > 0 else -1
+        missing = ids[ids > high_water]
+        if missing.size > 0:
+            print(f"Partition {key} : rattrapage de {missing.size} vecteurs depuis l'index principal.")
+            shard.add_with_ids(self._get_index().reconstruct_batch(missing), missing)
+            self._dirty.add(key)
+
+    def _evict_if_needed(self):
+        while len(self._shards) > self.max_loaded_shards:
+            key, _ = next(iter(self._shards.items()))
+            if key in self._dirty:
+                self.save_shard(key)
+            del self._shards[key]
+
+    def save_shard(self, key):
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is None:
+                return
+            os.makedirs(self.shard_dir, exist_ok=True)
+            faiss.write_index(shard, self.shard_path(key))
+            self._dirty.discard(key)
+
+    def save_dirty(self):
+        with self._lock:
+            for key in list(self._dirty):
+                self.save_shard(key)
+
+    # --- Écriture / recherche ---
+    def add(self, key, vectors, ids):
+        """Ajoute des vecteurs (avec leurs ID Faiss globaux) à la partition `key`."""
+        with self._lock:
+            shard = self.get_shard(key, create=True)
+            ids = np.asarray(ids, dtype='int64')
+            # Une partition créée ou rechargée ici a déjà rattrapé ces IDs depuis l'index principal
+            high_water = faiss.vector_to_array(shard.id_map).max() if shard.ntotal > 0 else -1
+            fresh = ids > high_water
+            if not fresh.any():
+                return
+            shard.add_with_ids(np.ascontiguousarray(np.asarray(vectors)[fresh], dtype='float32'), ids[fresh])
+            self._dirty.add(key)
+
+    def search(self, query, k, departement_id=None, filiere_id=None):
+        """
+        Recherche dans les seules partitions du locataire et fusionne les top-k.
+        Retourne (scores, ids globaux) triés par score décroissant.
+        """
+        query = np.ascontiguousarray(query, dtype='float32').reshape(1, -1)
+        all_scores, all_ids = [], []
+        with self._lock:
+            for key in self.keys_matching(departement_id, filiere_id):
+                shard = self.get_shard(key)
+                if shard is None or shard.ntotal == 0:
+                    continue
+                distances, ids = shard.search(query, min(k, shard.ntotal))
+                valid = ids[0] >= 0
+                all_scores.append(distances[0][valid])
+                all_ids.append(ids[0][valid])
+        if not all_ids:
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+        scores = np.concatenate(all_scores)
+        ids = np.concatenate(all_ids)
+        if k < scores.shape[0]:
+            # Sélection partielle : seuls les k meilleurs sont triés, même pour un grand pool.
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top], ids[top]
+
+    def rebuild(self, index, tenant_keys):
+        """
+        Reconstruit toutes les partitions à partir de l'index principal.
+        tenant_keys: liste de clés (departement_id, filiere_id), une par ID Faiss global.
+        """
+        with self._lock:
+            self.reset()
+            groups = {}
+            for faiss_id, key in enumerate(tenant_keys):
+                groups.setdefault(key, []).append(faiss_id)
+            for key, ids in groups.items():
+                ids = np.array(ids, dtype='int64')
+                self.add(key, index.reconstruct_batch(ids), ids)
+            self.save_dirty()
+
+    def adopt(self, staged):
+        """
+        Remplace toutes les partitions par celles de `staged` (construites à part, par exemple
+        pendant une compaction) : ses fichiers sont déplacés dans shard_dir et ses partitions
+        chargées sont reprises telles quelles.
+        """
+        with self._lock, staged._lock:
+            staged.save_dirty()
+            self.reset()
+            os.makedirs(self.shard_dir, exist_ok=True)
+            for key in staged.known_keys():
+                source = staged.shard_path(key)
+                if os.path.exists(source):
+                    os.replace(source, self.shard_path(key))
+                self._keys.add(key)
+            self._shards = staged._shards
+            staged._shards = OrderedDict()
+            self._evict_if_needed()
+        shutil.rmtree(staged.shard_dir, ignore_errors=True)
+
+    def reset(self):
+        """Supprime toutes les partitions (mémoire et disque)."""
+        with self._lock:
+            for key in self.known_keys():
+                path = self.shard_path(key)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._shards.clear()
+            self._dirty.clear()
+            self._keys = set()
@@ -0,0 +1,89 @@
+import faiss
+import numpy as np
+
+
+class VectorSearch:
+    """
+    Recherche filtrée directement sur l'index principal (HNSW) : le filtre
+    département/filière est appliqué pendant le parcours du graphe via un
+    IDSelector, sans reconstruire de sous-index à chaque requête.
+    """
+
+    # En dessous de ce nombre d'IDs autorisés, un produit scalaire exact sur les
+    # vecteurs autorisés est plus rapide (et exact) qu'un parcours HNSW filtré.
+    EXACT_SEARCH_MAX_IDS = 4096
+    # Plafond d'efSearch lorsque le filtre est très sélectif.
+    MAX_EF_SEARCH = 2048
+
+    @staticmethod
+    def clip_ids(allowed_ids, ntotal):
+        """Retourne les IDs autorisés sous forme de np.int64, limités à [0, ntotal)."""
+        ids = np.asarray(allowed_ids, dtype='int64').ravel()
+        return ids[(ids >= 0) & (ids < ntotal)]
+
+    @staticmethod
+    def build_id_selector(allowed_ids, ntotal):
+        """
+        Construit un IDSelectorBitmap à partir des IDs autorisés.
+        Retourne (selector, bitmap) : le bitmap doit rester référencé pendant la recherche.
+        """
+        mask = np.zeros(ntotal, dtype=bool)
+        mask[allowed_ids] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        return faiss.IDSelectorBitmap(bitmap), bitmap
+
+    @staticmethod
+    def adaptive_ef_search(ef_search, k, n_allowed, ntotal):
+        """
+        Élargit efSearch proportionnellement à la sélectivité du filtre :
+        avec 10 % des IDs autorisés, il faut visiter ~10x plus de nœuds pour
+        trouver autant de voisins valides.
+        """
+        selectivity = max(n_allowed / float(ntotal), 1e-6)
+        ef = int(np.ceil(ef_search / selectivity))
+        return int(min(max(ef, ef_search, k), VectorSearch.MAX_EF_SEARCH))
+
+    @staticmethod
+    def exact_search(index, query, allowed_ids, k):
+        """Recherche exacte (produit scalaire) restreinte aux IDs autorisés."""
+        vectors = index.reconstruct_batch(allowed_ids)
+        scores = vectors @ query.ravel()
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top].astype('float32'), allowed_ids[top]
+
+    @staticmethod
+    def search_filtered(index, query, allowed_ids, k, ef_search=100):
+        """
+        Recherche les k plus proches voisins de `query` parmi `allowed_ids`.
+
+        query: np.array de shape (dim,) ou (1, dim), normalisé
+        allowed_ids: itérable d'IDs Faiss globaux autorisés
+        Retourne (scores, ids) triés par score décroissant, sans les résultats vides (-1).
+        """
+        query = np.ascontiguousarray(query, dtype='float32').reshape(1, -1)
+        ntotal = index.ntotal
+        allowed_ids = VectorSearch.clip_ids(allowed_ids, ntotal)
+        k = min(k, allowed_ids.shape[0])
+        if k == 0:
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+
+        if allowed_ids.shape[0] <= VectorSearch.EXACT_SEARCH_MAX_IDS:
+            return VectorSearch.exact_search(index, query, allowed_ids, k)
+
+        # `bitmap` doit rester référencé tant que la recherche utilise le sélecteur.
+        selector, bitmap = VectorSearch.build_id_selector(allowed_ids, ntotal)
+        if hasattr(index, 'hnsw'):
+            params = faiss.SearchParametersHNSW(
+                sel=selector,
+                efSearch=VectorSearch.adaptive_ef_search(ef_search, k, allowed_ids.shape[0], ntotal)
+            )
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        distances, ids = index.search(query, k, params=params)
+
+        valid = ids[0] >= 0
+        return distances[0][valid], ids[0][valid]
@@ -4,10 +4,14 @@ from ollama_api import OllamaAPI
 from .models import *
 import api.models as models
 from Utilitaire.ResourceManager import ResourceManager
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
+import asyncio
 import sqlite3
 from typing import List, Dict, Optional
 from Utilitaire.filter_manager import FilterManager
+from Utilitaire.ingestion_pipeline import IngestionPipeline
+from Utilitaire.ingestion_jobs import IngestionJobQueue
 from AnalyseSentiment.sentiment_analyzer import SimpleSentimentAnalyzer
 from AnalyseSentiment.dashboard_calculator import DashboardDataCalculator
 from RessourceSuppl.RS_Models import Resource, ResourceCreate, ResourceOut, Feedback, FeedbackRequest, FeedbackResponse
@@ -24,6 +28,9 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 router = APIRouter()
 ollama_api = OllamaAPI()
 chatbot = RAGChatbot(ollama_api)
+ingestion_pipeline = IngestionPipeline(chatbot)
+ingestion_jobs = IngestionJobQueue(db_path, ingestion_pipeline)
+ingestion_jobs.start()
 filter_manager = FilterManager(db_path)
 manager = ResourceManager()
 
@@ -177,6 +184,23 @@ def change_password(data: ChangePasswordRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+NO_ANSWER_MESSAGE = (
+    "Je n'ai pas encore la réponse à cette question, mais n'abandonne pas ! "
+    "Essaie de reformuler ta demande ou explore les ressources complémentaires si disponibles. "
+    "Et surtout, continue à être curieux·se !"
+)
+
+def is_no_answer(result):
+    return not result or result.strip().lower() in ["", "je ne sais pas", "je ne peux pas répondre à cette question"]
+
+def find_resources(db, message):
+    tags_keywords = Resource.load_tags_keywords_from_db(db) # Utilise db SQLAlchemy si Resource est SQLAlchemy
+    context_tags = Resource.extract_tags_from_question(message, tags_keywords)
+    return Resource.get_additional_resources(db, context_tags) # Utilise db SQLAlchemy si Resource est SQLAlchemy
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
 @router.post("/chat", response_model=ChatResponse)
 def chat_with_context(data: ChatRequest, db: Session = Depends(get_db)):
     # 1. Génère la réponse via la base vectorielle
@@ -191,13 +215,9 @@ def chat_with_context(data: ChatRequest, db: Session = Depends(get_db)):
     )
 
     # 2. Si la réponse est vide ou "je ne sais pas", retourne le message d'incapacité
-    if not result or result.strip().lower() in ["", "je ne sais pas", "je ne peux pas répondre à cette question"]:
+    if is_no_answer(result):
         return {
-            "response": (
-                "Je n'ai pas encore la réponse à cette question, mais n'abandonne pas ! "
-                "Essaie de reformuler ta demande ou explore les ressources complémentaires si disponibles. "
-                "Et surtout, continue à être curieux·se !"
-            ),
+            "response": NO_ANSWER_MESSAGE,
             "resources": [], # Pas de ressources ici
             "chat_id": chat_id
         }
@@ -206,9 +226,7 @@ def chat_with_context(data: ChatRequest, db: Session = Depends(get_db)):
     # MAIS on ne construit plus de 'resources_text' à CONCATENER à la 'response'.
     found_resources = [] 
     if getattr(data, "show_resources", False):
-        tags_keywords = Resource.load_tags_keywords_from_db(db) # Utilise db SQLAlchemy si Resource est SQLAlchemy
-        context_tags = Resource.extract_tags_from_question(data.message, tags_keywords)
-        found_resources = Resource.get_additional_resources(db, context_tags) # Utilise db SQLAlchemy si Resource est SQLAlchemy
+        found_resources = find_resources(db, data.message)
 
     # 4. Retourne la réponse formatée
     # La clé 'response' contient UNIQUEMENT la réponse du LLM.
@@ -219,6 +237,65 @@ def chat_with_context(data: ChatRequest, db: Session = Depends(get_db)):
         "chat_id": chat_id # L'ID du chat est également séparé
     }
 
+@router.post("/chat/stream")
+async def chat_with_context_stream(data: ChatRequest):
+    """
+    Variante streamée de /chat (Server-Sent Events) :
+    - `token` : fragment de réponse, envoyé dès sa réception depuis le LLM ;
+    - `done` : réponse nettoyée, ressources et chat_id, une fois l'historique enregistré ;
+    - `error` : erreur survenue pendant la génération.
+    """
+    def load_resources():
+        # La session est ouverte ici : la dépendance get_db serait fermée avant la fin du flux.
+        db = SessionLocal()
+        try:
+            return [ResourceOut.from_orm(r).model_dump(mode="json") for r in find_resources(db, data.message)]
+        finally:
+            db.close()
+
+    async def event_stream():
+        try:
+            async for event in chatbot.generate_response_stream(
+                user_query=data.message,
+                user_id=data.user_id,
+                profile_id=data.profile_id,
+                departement_id=data.departement_id,
+                filiere_id=data.filiere_id,
+                use_mmr=data.use_mmr
+            ):
+                if event["type"] == "token":
+                    yield sse_event("token", {"content": event["content"]})
+                    continue
+                result = event["response"]
+                resources = []
+                if is_no_answer(result):
+                    result = NO_ANSWER_MESSAGE
+                elif data.show_resources:
+                    resources = await asyncio.to_thread(load_resources)
+                yield sse_event("done", {"response": result, "resources": resources, "chat_id": event["chat_id"]})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/llm/pool_metrics")
+def llm_pool_metrics():
+    """Métriques du pool de connexions vers Ollama (requêtes, erreurs, timeouts, concurrence, keep-alive)."""
+    return ollama_api.pool_metrics()
+
+@router.get("/cache/stats")
+def cache_stats():
+    """Compteurs des caches du chatbot (embeddings de requêtes et de chunks, réponses sémantiques)."""
+    return {
+        "query_embeddings": chatbot.query_embedding_cache.stats(),
+        "chunk_embeddings": chatbot.embedding_store.stats() if chatbot.embedding_store is not None else None,
+        "responses": chatbot.response_cache.stats() if chatbot.response_cache is not None else None,
+    }
+
 @router.post("/feedback", response_model=FeedbackResponse)
 def receive_feedback(feedback_data: FeedbackRequest, db: Session = Depends(get_db)):
     try:
@@ -286,9 +363,10 @@ async def ingest_document_endpoint( # Renommé pour éviter confusion avec la m
         # Lire le contenu du fichier uploadé en bytes
         file_content_bytes = await file_upload.read()
 
-        # Appeler votre logique d'ingestion avec le contenu du fichier
-        # La méthode ingestion_file de votre classe Chatbot doit être adaptée
-        chatbot.ingestion_file( # Assurez-vous que 'chatbot' est bien l'instance de votre classe
+        # Appeler votre logique d'ingestion avec le contenu du fichier, dans un thread :
+        # l'embedding est long et ne doit pas bloquer la boucle d'événements (chat, streaming)
+        await asyncio.to_thread(
+            chatbot.ingestion_file, # Assurez-vous que 'chatbot' est bien l'instance de votre classe
             base_filename=base_filename, # Utiliser le base_filename fourni par le formulaire
             file_content=file_content_bytes, # Passer le contenu du fichier
             # file_path n'est plus nécessaire ici
@@ -311,6 +389,134 @@ async def ingest_document_endpoint( # Renommé pour éviter confusion avec la m
         # Retourner une erreur générique au client
         raise HTTPException(status_code=500, detail=f"Erreur interne du serveur lors de l'ingestion: {str(e)}")
 
+@router.post("/ingest/batch")
+async def ingest_batch_endpoint(
+    departement_id: int = Form(...),
+    profile_id: int = Form(...),
+    user_id: int = Form(...),
+    filiere_id: Optional[int] = Form(None),
+    module_id: Optional[int] = Form(None),
+    activite_id: Optional[int] = Form(None),
+    # Plusieurs fichiers et/ou archives .zip
+    files: List[UploadFile] = File(...)
+):
+    try:
+        uploads = [(upload.filename, await upload.read()) for upload in files]
+        filters = {
+            "departement_id": departement_id, "filiere_id": filiere_id, "module_id": module_id,
+            "activite_id": activite_id, "profile_id": profile_id, "user_id": user_id,
+        }
+        # Extraction (pool de processus), embedding et commit hors de la boucle d'événements
+        report = await asyncio.to_thread(ingestion_pipeline.run, uploads, filters)
+        return {
+            "status": "success" if not report["errors"] else "partial",
+            "message": f"{len(report['indexed'])} fichier(s) indexé(s), {len(report['skipped'])} ignoré(s), "
+                       f"{len(report['errors'])} en erreur.",
+            **report,
+        }
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erreur interne du serveur lors de l'ingestion par lot: {str(e)}")
+
+@router.post("/ingest/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_ingestion_job(
+    departement_id: int = Form(...),
+    profile_id: int = Form(...),
+    user_id: int = Form(...),
+    filiere_id: Optional[int] = Form(None),
+    module_id: Optional[int] = Form(None),
+    activite_id: Optional[int] = Form(None),
+    files: List[UploadFile] = File(...)
+):
+    """Enregistre un job d'ingestion en arrière-plan et retourne immédiatement son ID."""
+    try:
+        uploads = [(upload.filename, await upload.read()) for upload in files]
+        filters = {
+            "departement_id": departement_id, "filiere_id": filiere_id, "module_id": module_id,
+            "activite_id": activite_id, "profile_id": profile_id, "user_id": user_id,
+        }
+        job_id = await asyncio.to_thread(ingestion_jobs.submit, uploads, filters)
+        return {"status": "queued", "job_id": job_id}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la soumission du job d'ingestion: {str(e)}")
+
+@router.get("/ingest/jobs")
+def list_ingestion_jobs(status: Optional[str] = Query(None), limit: int = Query(50, ge=1, le=500)):
+    return ingestion_jobs.list(status, limit)
+
+@router.get("/ingest/jobs/{job_id}")
+def get_ingestion_job(job_id: int):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job d'ingestion {job_id} introuvable.")
+    return job
+
+@router.post("/ingest/jobs/{job_id}/cancel")
+def cancel_ingestion_job(job_id: int):
+    job_status = ingestion_jobs.cancel(job_id)
+    if job_status is None:
+        raise HTTPException(status_code=404, detail=f"Job d'ingestion {job_id} introuvable.")
+    if job_status in IngestionJobQueue.FINAL_STATES and job_status != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Le job {job_id} est déjà terminé ({job_status}).")
+    return {"job_id": job_id, "status": job_status,
+            "message": "Annulé." if job_status == "cancelled" else "Annulation demandée, effective avant le commit."}
+
+@router.delete("/documents/{file_hash}")
+async def delete_document_endpoint(file_hash: str):
+    """Supprime un document ; ses vecteurs sont exclus des recherches puis retirés à la compaction."""
+    try:
+        result = await asyncio.to_thread(chatbot.delete_document, file_hash)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du document: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Document {file_hash} introuvable.")
+    return {"status": "success", "message": f"Document '{result['base_filename']}' supprimé.", **result}
+
+@router.put("/documents/{file_hash}")
+async def replace_document_endpoint(
+    file_hash: str,
+    base_filename: str = Form(...),
+    departement_id: int = Form(...),
+    profile_id: int = Form(...),
+    user_id: int = Form(...),
+    filiere_id: Optional[int] = Form(None),
+    module_id: Optional[int] = Form(None),
+    activite_id: Optional[int] = Form(None),
+    file_upload: UploadFile = File(...)
+):
+    """Remplace un document par une nouvelle version : seuls les chunks modifiés sont ré-encodés."""
+    file_content_bytes = await file_upload.read()
+    try:
+        result = await asyncio.to_thread(
+            chatbot.replace_document, file_hash, base_filename, file_content_bytes,
+            departement_id, filiere_id, module_id, activite_id, profile_id, user_id
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=409, detail=str(ve))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erreur lors du remplacement du document: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Document {file_hash} introuvable.")
+    return {"status": "success", "message": f"Document '{base_filename}' remplacé.", **result}
+
+@router.post("/documents/compact")
+async def compact_deleted_documents():
+    """Retire de l'index les vecteurs des documents supprimés et renumérote les ID Faiss."""
+    try:
+        removed = await asyncio.to_thread(chatbot.compact_deleted)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la compaction: {str(e)}")
+    return {"status": "success", "vectors_removed": removed, "total_vectors": chatbot.index.ntotal}
+
 @router.get("/ingested", response_model=List[Dict])
 #filter_manager.get_documents_ingested()
 def get_documents():
@@ -530,6 +736,22 @@ def get_sentiment_dashboard_data():
         print(f"Erreur serveur: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur interne du serveur: {e}")
 
+# Endpoint pour reconstruire l'index FAISS depuis le cache d'embeddings (sans ré-encodage)
+@router.post("/reindex")
+async def rebuild_faiss_index(
+    m: Optional[int] = Query(None, ge=4, le=128),
+    ef_construction: Optional[int] = Query(None, ge=8),
+    ef_search: Optional[int] = Query(None, ge=8)
+):
+    """Reconstruit l'index HNSW (paramètres optionnels) à partir des vecteurs en cache."""
+    try:
+        report = await asyncio.to_thread(chatbot.rebuild_index, m, ef_construction, ef_search)
+        return {"status": "success", "message": "Index Faiss reconstruit.", **report}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la reconstruction de l'index: {str(e)}")
+
 # Endpoint pour réinitialiser la base vectorielle FAISS
 @router.post("/reset-faiss")
 def reset_faiss_database():
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compare les stratégies de découpage de FileProcessor sur des documents réels :
+fenêtres de caractères (« characters », historique) contre découpage par phrases et
+paragraphes limité en tokens (« structure »).
+
+Mesures par stratégie : nombre de chunks (= vecteurs Faiss), tokens par chunk
+(moyenne / max, tokenizer du modèle d'embedding ou estimation), tokens totaux indexés,
+doublons supprimés, durée d'extraction.
+
+Usage :
+    python benchmarks/bench_chunking.py Faq.txt cours.pdf --max-tokens 128 192 256
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.file_processor import FileProcessor
+from Utilitaire.chunker import TokenCounter
+
+
+def measure(name, processor, documents, counter):
+    chunk_counts, token_counts, duplicates = [], [], 0
+    start = time.perf_counter()
+    for filename, content in documents:
+        chunks, _ = processor.extract_chunks(filename, content)
+        chunks = chunks or []
+        chunk_counts.append(len(chunks))
+        token_counts.extend(counter.count(chunks))
+        stats = processor.last_chunking_stats or {}
+        duplicates += stats.get("exact_duplicates", 0) + stats.get("near_duplicates", 0)
+    elapsed = time.perf_counter() - start
+    tokens = np.array(token_counts or [0])
+    print(f"{name:>22} {sum(chunk_counts):>8} {tokens.mean():>9.1f} {tokens.max():>8} {tokens.sum():>10} "
+          f"{duplicates:>9} {elapsed:>8.2f}")
+
+
+def run(args):
+    documents = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            documents.append((os.path.basename(path), f.read()))
+    counter = TokenCounter.shared(args.tokenizer)
+    counter.count(["préchauffage"])
+    print(f"{len(documents)} document(s), tokens {'estimés' if counter.approximate else 'du tokenizer ' + args.tokenizer}")
+    print(f"{'stratégie':>22} {'chunks':>8} {'tok/chunk':>9} {'tok max':>8} {'tok total':>10} "
+          f"{'doublons':>9} {'secondes':>8}")
+
+    measure(f"characters {args.chunk_size}/{args.chunk_overlap}",
+            FileProcessor(args.chunk_size, args.chunk_overlap, chunking="characters"), documents, counter)
+    for max_tokens in args.max_tokens:
+        processor = FileProcessor(
+            chunking="structure", tokenizer_name=args.tokenizer, max_tokens=max_tokens,
+            min_tokens=max_tokens // 4, overlap_tokens=args.overlap_tokens
+        )
+        measure(f"structure {max_tokens} tok", processor, documents, counter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", default=["./Faq.txt"])
+    parser.add_argument("--tokenizer", default="BAAI/bge-base-en-v1.5")
+    parser.add_argument("--chunk-size", type=int, default=384)
+    parser.add_argument("--chunk-overlap", type=int, default=96)
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[128, 192, 256])
+    parser.add_argument("--overlap-tokens", type=int, default=0)
+    run(parser.parse_args())
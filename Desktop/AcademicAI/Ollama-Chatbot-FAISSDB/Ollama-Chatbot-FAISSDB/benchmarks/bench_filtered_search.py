@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la recherche filtrée : ancien chemin (reconstruction d'un sous-index
+IndexFlatIP à chaque requête) contre la recherche HNSW filtrée par IDSelector.
+
+Mesure le recall@k (par rapport à une recherche exacte sur les IDs autorisés)
+et la latence p50/p99 pour plusieurs sélectivités de filtre.
+
+Usage :
+    python benchmarks/bench_filtered_search.py --n 100000 --queries 200
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.vector_search import VectorSearch
+
+
+def rebuild_subindex_search(index, query, allowed_ids, k):
+    """Ancien chemin de find_relevant_context : reconstruction + IndexFlatIP temporaire."""
+    storage = index.storage
+    sub_vectors = np.array([storage.reconstruct(int(i)) for i in allowed_ids], dtype='float32')
+    sub_index = faiss.IndexFlatIP(index.d)
+    sub_index.add(sub_vectors)
+    distances, local = sub_index.search(query.reshape(1, -1), min(k, sub_index.ntotal))
+    return distances[0], allowed_ids[local[0]]
+
+
+def exact_ground_truth(vectors, query, allowed_ids, k):
+    scores = vectors[allowed_ids] @ query
+    top = np.argsort(-scores)[:k]
+    return allowed_ids[top]
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(np.array(samples) * 1000.0, q))
+
+
+def run(n, dim, n_queries, k, selectivities, seed):
+    rng = np.random.default_rng(seed)
+    print(f"Construction de l'index HNSW ({n} vecteurs, dim={dim})...")
+    vectors = rng.standard_normal((n, dim)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 80
+    index.hnsw.efSearch = 100
+    index.add(vectors)
+
+    queries = vectors[rng.integers(0, n, n_queries)] + 0.1 * rng.standard_normal((n_queries, dim)).astype('float32')
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"{'sélectivité':>12} {'chemin':>10} {'recall@k':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for selectivity in selectivities:
+        allowed_ids = np.sort(rng.choice(n, max(k, int(n * selectivity)), replace=False)).astype('int64')
+        truths = [exact_ground_truth(vectors, q, allowed_ids, k) for q in queries]
+
+        for name, search in (
+            ("rebuild", lambda q: rebuild_subindex_search(index, q, allowed_ids, k)),
+            ("filtered", lambda q: VectorSearch.search_filtered(index, q, allowed_ids, k, ef_search=100)),
+        ):
+            latencies, hits = [], 0
+            for q, truth in zip(queries, truths):
+                start = time.perf_counter()
+                _, ids = search(q)
+                latencies.append(time.perf_counter() - start)
+                hits += len(set(ids.tolist()) & set(truth.tolist()))
+            recall = hits / float(k * len(queries))
+            print(f"{selectivity:>12.3%} {name:>10} {recall:>9.3f} "
+                  f"{percentile_ms(latencies, 50):>9.2f} {percentile_ms(latencies, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000, help="Nombre de vecteurs dans l'index")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension (768 pour bge-base)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15, help="top_k * 5 quand MMR est activé")
+    parser.add_argument("--selectivities", type=float, nargs="+", default=[0.5, 0.1, 0.01, 0.001])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.n, args.dim, args.queries, args.k, args.selectivities, args.seed)
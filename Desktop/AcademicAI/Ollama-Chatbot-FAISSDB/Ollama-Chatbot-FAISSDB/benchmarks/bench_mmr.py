@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark du MMR : ancienne boucle Python de RAGChatbot.mmr contre le MMR vectorisé
+(Utilitaire.mmr.MMR), pour une requête puis pour un lot de requêtes.
+Vérifie aussi que les deux implémentations sélectionnent les mêmes indices.
+
+Usage :
+    python benchmarks/bench_mmr.py --n 15 75 300 --k 3 10
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.mmr import MMR
+
+
+def legacy_mmr(query_embedding, candidate_embeddings, k=3, lambda_param=0.5):
+    """Ancienne implémentation de RAGChatbot.mmr."""
+    selected = []
+    selected_indices = []
+    candidate_indices = list(range(len(candidate_embeddings)))
+    query_embedding = query_embedding.reshape(1, -1)
+    candidate_embeddings = np.array(candidate_embeddings)
+    sim_to_query = np.dot(candidate_embeddings, query_embedding.T).flatten()
+    for _ in range(min(k, len(candidate_embeddings))):
+        if not selected:
+            idx = int(np.argmax(sim_to_query))
+            selected.append(candidate_embeddings[idx])
+            selected_indices.append(idx)
+            candidate_indices.remove(idx)
+        else:
+            max_score = -np.inf
+            max_idx = -1
+            for idx in candidate_indices:
+                relevance = sim_to_query[idx]
+                diversity = max([np.dot(candidate_embeddings[idx], s) for s in selected])
+                mmr_score = lambda_param * relevance - (1 - lambda_param) * diversity
+                if mmr_score > max_score:
+                    max_score = mmr_score
+                    max_idx = idx
+            selected.append(candidate_embeddings[max_idx])
+            selected_indices.append(max_idx)
+            candidate_indices.remove(max_idx)
+    return selected_indices
+
+
+def normalized(rng, shape):
+    vectors = rng.standard_normal(shape).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def timed_ms(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000.0 / repeat, result
+
+
+def run(sizes, ks, dim, batch, lambda_param, repeat, seed):
+    rng = np.random.default_rng(seed)
+    print(f"{'n':>6} {'k':>4} {'ancien ms':>10} {'vectorisé ms':>13} {'lot/req ms':>11} {'identique':>10}")
+    for n in sizes:
+        for k in ks:
+            queries = normalized(rng, (batch, dim))
+            candidates = normalized(rng, (batch, n, dim))
+            legacy_ms, legacy = timed_ms(lambda: legacy_mmr(queries[0], candidates[0], k, lambda_param), repeat)
+            fast_ms, fast = timed_ms(lambda: MMR.select(queries[0], candidates[0], k, lambda_param), repeat)
+            batch_ms, batched = timed_ms(lambda: MMR.select_batch(queries, candidates, k, lambda_param), repeat)
+            same = legacy == fast and all(
+                legacy_mmr(queries[b], candidates[b], k, lambda_param) == batched[b] for b in range(batch)
+            )
+            print(f"{n:>6} {k:>4} {legacy_ms:>10.3f} {fast_ms:>13.3f} {batch_ms / batch:>11.3f} {str(same):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, nargs="+", default=[15, 75, 300], help="Nombre de candidats (top_k * 5 par défaut)")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--dim", type=int, default=768, help="Dimension (768 pour bge-base)")
+    parser.add_argument("--batch", type=int, default=16, help="Nombre de requêtes traitées en lot")
+    parser.add_argument("--lambda-param", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.n, args.k, args.dim, args.batch, args.lambda_param, args.repeat, args.seed)
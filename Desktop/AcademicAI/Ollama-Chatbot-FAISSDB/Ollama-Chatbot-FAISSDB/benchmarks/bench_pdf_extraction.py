@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark de l'extraction de texte PDF (FileProcessor.iter_content_from_bytes) :
+extraction PyPDF2 en série contre extraction parallèle par plages de pages,
+pour plusieurs nombres de workers. Vérifie que le texte obtenu est identique.
+
+Sans --pdf, un syllabus synthétique de --pages pages (texte Helvetica) est généré.
+
+Usage :
+    python benchmarks/bench_pdf_extraction.py --pdf syllabus.pdf --workers 1 2 4 8
+    python benchmarks/bench_pdf_extraction.py --pages 500 --workers 1 2 4 8
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.file_processor import FileProcessor
+
+WORDS = ("module cours travaux dirigés pratiques examen évaluation chapitre algorithme "
+         "structure données réseau système base compilation semestre crédit objectif "
+         "compétence projet séance enseignant étudiant programme analyse").split()
+
+
+def synthetic_pdf(pages, lines_per_page=45, seed=0):
+    """PDF minimal de `pages` pages de texte (une police standard, sans dépendance externe)."""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1} - " + " ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = " T* ".join("(" + line.encode("ascii", "replace").decode().replace("(", "").replace(")", "") + ") Tj"
+                           for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def extract(pdf_bytes, workers, min_pages, pages_per_task):
+    processor = FileProcessor(pdf_workers=workers, pdf_parallel_min_pages=min_pages, pdf_pages_per_task=pages_per_task)
+    return "".join(processor.iter_content_from_bytes("bench.pdf", pdf_bytes))
+
+
+def run(args):
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+        print(f"{args.pdf} : {len(pdf_bytes) / 1e6:.1f} Mo")
+    else:
+        pdf_bytes = synthetic_pdf(args.pages)
+        print(f"PDF synthétique : {args.pages} pages, {len(pdf_bytes) / 1e6:.1f} Mo")
+
+    start = time.perf_counter()
+    reference = extract(pdf_bytes, 1, args.min_pages, args.pages_per_task)
+    serial_s = time.perf_counter() - start
+    print(f"{'workers':>8} {'secondes':>9} {'accélération':>13} {'identique':>10}")
+    print(f"{1:>8} {serial_s:>9.2f} {1.0:>13.2f} {'True':>10}")
+
+    for workers in args.workers:
+        if workers <= 1:
+            continue
+        # Premier passage : démarrage du pool (spawn), non mesuré
+        extract(pdf_bytes, workers, args.min_pages, args.pages_per_task)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            text = extract(pdf_bytes, workers, args.min_pages, args.pages_per_task)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{workers:>8} {best:>9.2f} {serial_s / best:>13.2f} {str(text == reference):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="Fichier PDF à extraire (sinon PDF synthétique)")
+    parser.add_argument("--pages", type=int, default=500, help="Pages du PDF synthétique")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--min-pages", type=int, default=64, help="Seuil de pages pour l'extraction parallèle")
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=2)
+    run(parser.parse_args())
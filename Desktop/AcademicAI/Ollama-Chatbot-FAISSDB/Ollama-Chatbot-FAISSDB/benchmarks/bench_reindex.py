@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Coût d'une reconstruction complète de l'index Faiss à partir du cache d'embeddings
+(EmbeddingStore), sans inférence : ouverture du cache, lecture des vecteurs par hash de
+chunk, puis construction de l'index HNSW. Les vecteurs sont synthétiques (dimension 768,
+comme BAAI/bge-base-en-v1.5) ; le temps de ré-encodage évité est estimé à partir du débit
+d'embedding passé en argument.
+
+Usage :
+    python benchmarks/bench_reindex.py --chunks 50000 --dtype float16 --embed-rate 40
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.embedding_store import EmbeddingStore
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix="bench_reindex_")
+    try:
+        rng = np.random.default_rng(0)
+        texts = [f"chunk synthétique numéro {i}" for i in range(args.chunks)]
+        vectors = rng.standard_normal((args.chunks, args.dimension)).astype('float32')
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        EmbeddingStore(directory, "bench", args.dimension, args.dtype).put_many(texts, vectors)
+
+        start = time.perf_counter()
+        store = EmbeddingStore(directory, "bench", args.dimension, args.dtype)
+        cached, found = store.get_many(texts)
+        read_s = time.perf_counter() - start
+        assert found.all()
+
+        start = time.perf_counter()
+        index = faiss.IndexHNSWFlat(args.dimension, args.m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = args.ef_construction
+        index.add(cached)
+        build_s = time.perf_counter() - start
+
+        size_mb = sum(os.path.getsize(os.path.join(store.directory, name))
+                      for name in os.listdir(store.directory)) / 1e6
+        print(f"{args.chunks} chunks, cache {args.dtype} : {size_mb:.1f} Mo")
+        print(f"lecture du cache       : {read_s:8.2f} s")
+        print(f"construction HNSW      : {build_s:8.2f} s (M={args.m}, efConstruction={args.ef_construction})")
+        print(f"ré-encodage évité      : {args.chunks / args.embed_rate:8.0f} s (à {args.embed_rate} chunks/s)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=80)
+    parser.add_argument("--embed-rate", type=float, default=40.0, help="Débit d'embedding CPU (chunks/s)")
+    run(parser.parse_args())
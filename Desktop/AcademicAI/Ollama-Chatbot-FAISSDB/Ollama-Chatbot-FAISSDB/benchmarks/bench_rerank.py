@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark latence / qualité du reranking cross-encoder sur la base vectorielle réelle.
+
+Compare la recherche dense seule (top_k) au reranking d'un pool élargi pour
+plusieurs budgets de latence. Le jeu d'évaluation est un fichier JSONL, une
+question par ligne, avec au moins un critère de pertinence :
+    {"query": "...", "relevant_ids": [12, 13], "departement_id": 1, "filiere_id": 3}
+    {"query": "...", "answer_contains": "texte attendu dans le chunk"}
+
+Mesures : hit@k (au moins un chunk pertinent dans le contexte), MRR@k,
+taille moyenne du contexte (caractères envoyés au LLM), latence p50/p99.
+
+Usage :
+    python benchmarks/bench_rerank.py --eval eval.jsonl --k 3 --pool 30 --budgets 50 150 400
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.chunk_store import ChunkStore
+from Utilitaire.vector_search import VectorSearch
+from Utilitaire.reranker import CrossEncoderReranker
+
+
+def load_chunk_store(chunk_store_dir, metadata_file):
+    if ChunkStore.exists_dir(chunk_store_dir):
+        return ChunkStore.open_dir(chunk_store_dir)
+    with open(metadata_file, 'rb') as f:
+        state = pickle.load(f)
+    return ChunkStore.from_records(state) if isinstance(state, list) else ChunkStore.from_state(state)
+
+
+def allowed_ids(store, departement_id, filiere_id):
+    """Même sémantique que FilterManager.get_allowed_indices, à partir des colonnes du ChunkStore."""
+    mask = np.ones(len(store), dtype=bool)
+    if departement_id is not None:
+        mask &= store.column("departement_id") == departement_id
+    if filiere_id is not None:
+        mask &= store.column("filiere_id") == filiere_id
+    return np.nonzero(mask)[0].astype('int64')
+
+
+def is_relevant(example, faiss_id, text):
+    if "relevant_ids" in example and faiss_id in example["relevant_ids"]:
+        return True
+    expected = example.get("answer_contains")
+    return bool(expected) and expected.lower() in (text or "").lower()
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(np.array(samples) * 1000.0, q))
+
+
+def evaluate(name, examples, retrieve, store, k):
+    hits, reciprocal_ranks, context_sizes, latencies = 0, [], [], []
+    for example, query_embedding in examples:
+        start = time.perf_counter()
+        ids = retrieve(example, query_embedding)
+        latencies.append(time.perf_counter() - start)
+        texts = [store.get_text(int(i)) or "" for i in ids[:k]]
+        context_sizes.append(sum(len(text) for text in texts))
+        rank = next((r for r, (i, text) in enumerate(zip(ids[:k], texts), 1)
+                     if is_relevant(example, int(i), text)), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    n = float(len(examples))
+    print(f"{name:>22} {hits / n:>7.3f} {np.mean(reciprocal_ranks):>7.3f} {np.mean(context_sizes):>10.0f} "
+          f"{percentile_ms(latencies, 50):>9.1f} {percentile_ms(latencies, 99):>9.1f}")
+
+
+def run(args):
+    from sentence_transformers import SentenceTransformer
+
+    index = faiss.read_index(args.index)
+    store = load_chunk_store(args.chunk_store_dir, args.metadata)
+    with open(args.eval, encoding='utf-8') as f:
+        raw_examples = [json.loads(line) for line in f if line.strip()]
+    print(f"{len(raw_examples)} questions, {index.ntotal} vecteurs.")
+
+    model = SentenceTransformer(args.embedding_model)
+    embeddings = model.encode([e["query"] for e in raw_examples], normalize_embeddings=True)
+    examples = list(zip(raw_examples, embeddings))
+
+    def dense_pool(example, query_embedding, pool):
+        ids = allowed_ids(store, example.get("departement_id"), example.get("filiere_id"))
+        scores, candidates = VectorSearch.search_filtered(index, query_embedding, ids, pool)
+        return candidates[scores >= args.threshold]
+
+    print(f"{'méthode':>22} {'hit@k':>7} {'MRR':>7} {'contexte':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    evaluate("dense", examples, lambda e, q: dense_pool(e, q, args.k), store, args.k)
+
+    for budget in args.budgets:
+        reranker = CrossEncoderReranker(args.reranker_model, latency_budget_ms=budget, max_candidates=args.pool)
+        # Préchauffage : chargement du modèle et première estimation du coût par paire
+        reranker.rerank("préchauffage", ["préchauffage"] * min(8, args.pool), 1)
+
+        def rerank(example, query_embedding, reranker=reranker):
+            pool_ids = dense_pool(example, query_embedding, args.pool)
+            pool_ids = pool_ids[:reranker.budgeted_size(len(pool_ids))]
+            order, _ = reranker.rerank(example["query"], [store.get_text(int(i)) or "" for i in pool_ids], args.k)
+            return pool_ids[order]
+
+        evaluate(f"rerank {budget:g} ms", examples, rerank, store, args.k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", required=True, help="Fichier JSONL des questions d'évaluation")
+    parser.add_argument("--index", default="./vector_store/faiss_index.faiss")
+    parser.add_argument("--chunk-store-dir", default="./vector_store/chunks")
+    parser.add_argument("--metadata", default="./vector_store/metadata.pickle")
+    parser.add_argument("--embedding-model", default="BAAI/bge-base-en-v1.5")
+    parser.add_argument("--reranker-model", default=CrossEncoderReranker.DEFAULT_MODEL)
+    parser.add_argument("--k", type=int, default=3, help="Chunks gardés dans le contexte")
+    parser.add_argument("--pool", type=int, default=30, help="Candidats denses avant reranking")
+    parser.add_argument("--threshold", type=float, default=0.65, help="Seuil de similarité dense")
+    parser.add_argument("--budgets", type=float, nargs="+", default=[50, 150, 400], help="Budgets de latence (ms)")
+    run(parser.parse_args())
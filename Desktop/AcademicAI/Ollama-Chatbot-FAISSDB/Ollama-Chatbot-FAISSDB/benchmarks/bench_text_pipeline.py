@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Débit (Mo/s) du nettoyage à l'ingestion sur Faq.txt : pipeline NLTK d'origine
+(TextPipeline + TextCleaner, reconstruit par fichier comme avant), FastTextPipeline
+en un seul processus, puis FastTextPipeline par blocs dans un pool de processus.
+Vérifie que toutes les sorties sont identiques.
+
+Usage :
+    python benchmarks/bench_text_pipeline.py --copies 200 --workers 2 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilitaire.EDA_Cleaner import FastTextPipeline, TextPipeline, TextCleaner
+
+
+def best_of(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(args):
+    with open(args.file, encoding="utf-8") as f:
+        sample = f.read()
+    text = "\n".join([sample] * args.copies)
+    megabytes = len(text.encode("utf-8")) / 1e6
+    print(f"{args.file} x{args.copies} : {megabytes:.2f} Mo")
+    print(f"{'pipeline':>24} {'secondes':>9} {'Mo/s':>8} {'identique':>10}")
+
+    reference_s, reference = best_of(lambda: TextPipeline(TextCleaner()).process(text), args.repeat)
+    print(f"{'NLTK (origine)':>24} {reference_s:>9.3f} {megabytes / reference_s:>8.2f} {'True':>10}")
+
+    fast = FastTextPipeline.shared()
+    fast_s, cleaned = best_of(lambda: fast.process(text), args.repeat)
+    print(f"{'FastTextPipeline':>24} {fast_s:>9.3f} {megabytes / fast_s:>8.2f} {str(cleaned == reference):>10}")
+
+    for workers in args.workers:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # Premier passage : démarrage des processus et construction du pipeline, non mesuré
+            fast.process_parallel(text, executor, args.block_chars)
+            parallel_s, cleaned = best_of(lambda: fast.process_parallel(text, executor, args.block_chars), args.repeat)
+        name = f"Fast, {workers} processus"
+        print(f"{name:>24} {parallel_s:>9.3f} {megabytes / parallel_s:>8.2f} {str(cleaned == reference):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="./Faq.txt")
+    parser.add_argument("--copies", type=int, default=200, help="Nombre de copies concaténées du fichier")
+    parser.add_argument("--workers", type=int, nargs="*", default=[2, 4])
+    parser.add_argument("--block-chars", type=int, default=1 << 18, help="Taille des blocs en parallèle")
+    parser.add_argument("--repeat", type=int, default=3)
+    run(parser.parse_args())
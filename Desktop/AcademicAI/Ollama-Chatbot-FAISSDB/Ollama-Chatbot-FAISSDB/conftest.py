@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Fixtures partagées des tests : un RAGChatbot complet sur des fichiers temporaires (index Faiss,
+journal, ChunkStore, base SQLite), avec un modèle d'embedding déterministe à la place de
+BAAI/bge-base-en-v1.5. Les tests qui l'utilisent sont ignorés si sentence_transformers ou
+langchain_groq ne sont pas installés.
+"""
+
+import os
+import sys
+import zlib
+import sqlite3
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+class HashEmbeddingModel:
+    """Vecteurs normalisés pseudo-aléatoires déterminés par le texte ; compte les textes encodés."""
+
+    def __init__(self, model_name=None, dimension=768):
+        self.dimension = dimension
+        self.encoded = 0
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.encoded += len(texts)
+        vectors = np.stack([
+            np.random.default_rng(zlib.crc32(text.encode('utf-8'))).standard_normal(self.dimension)
+            for text in texts
+        ]).astype('float32') if texts else np.empty((0, self.dimension), dtype='float32')
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+def create_metadata_db(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS document_metadata (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "file_hash TEXT NOT NULL, chunk_index INTEGER NOT NULL, chunk_text TEXT NOT NULL, "
+        "departement_id INTEGER, filiere_id INTEGER, module_id INTEGER, activite_id INTEGER, "
+        "profile_id INTEGER, user_id INTEGER, date_Ingestion DATETIME DEFAULT CURRENT_TIMESTAMP, base_filename TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS chat_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+        "question TEXT, answer TEXT, departement_id INTEGER, filiere_id INTEGER, profile_id INTEGER, "
+        "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def make_chatbot(tmp_path, monkeypatch):
+    """
+    Fabrique de RAGChatbot sur tmp_path : chaque appel ouvre une nouvelle instance sur les mêmes
+    fichiers (redémarrage). Les arguments nommés sont passés au constructeur.
+    """
+    pytest.importorskip("sentence_transformers")
+    pytest.importorskip("langchain_groq")
+    import rag_chatbot
+    from Utilitaire import filter_manager
+    from Utilitaire.filter_cache import AllowedIdsCache
+
+    db_path = str(tmp_path / "metadata.db")
+    create_metadata_db(db_path)
+    monkeypatch.setattr(rag_chatbot, "SentenceTransformer", HashEmbeddingModel)
+    monkeypatch.setattr(rag_chatbot.RAGChatbot, "SQLITE_DB_PATH", db_path)
+    monkeypatch.setattr(filter_manager, "db_path", db_path)
+    monkeypatch.setattr(filter_manager, "allowed_ids_cache", AllowedIdsCache(db_path))
+
+    def make(**kwargs):
+        vector_store = tmp_path / "vector_store"
+        options = {
+            "faiss_index_file": str(vector_store / "faiss_index.faiss"),
+            "metadata_file": str(vector_store / "metadata.pickle"),
+            "hashes_file": str(vector_store / "hashes.pickle"),
+            "shard_dir": str(vector_store / "shards"),
+            "log_file": str(vector_store / "ingestion.log"),
+            "chunk_store_dir": str(vector_store / "chunks"),
+            "embedding_store_dir": str(vector_store / "embeddings"),
+            "background_compaction": False,
+        }
+        options.update(kwargs)
+        os.makedirs(vector_store, exist_ok=True)
+        return rag_chatbot.RAGChatbot(None, **options)
+
+    make.db_path = db_path
+    return make
@@ -10,6 +10,7 @@ def main():
     print("Commandes disponibles :")
     print("- 'Ingestion chemin_du_fichier' : pour Ingester un fichier (txt, pdf, docx, json)")
     print("- 'chat' : pour démarrer une conversation")
+    print("- 'reindex [M efConstruction efSearch]' : pour reconstruire l'index Faiss depuis le cache d'embeddings")
     print("- 'exit' : pour quitter")
 
     while True:
@@ -40,6 +41,16 @@ def main():
 
             except ValueError:
                 print("Erreur : tous les identifiants doivent être des entiers valides.")   
+        elif command.lower().split()[:1] == ["reindex"]:
+            try:
+                params = [int(value) for value in command.split()[1:4]]
+                params += [None] * (3 - len(params))
+                report = chatbot.rebuild_index(m=params[0], ef_construction=params[1], ef_search=params[2])
+                print(f"Reconstruction terminée : {report}")
+            except ValueError:
+                print("Erreur : les paramètres HNSW doivent être des entiers valides.")
+            except Exception as e:
+                print(f"Une erreur est survenue lors de la reconstruction : {e}")
         elif command.lower().startswith("index "):
             file_path = command[6:].strip()
             base_filename = os.path.basename(file_path)
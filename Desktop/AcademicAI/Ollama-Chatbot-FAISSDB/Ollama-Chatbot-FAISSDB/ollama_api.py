@@ -1,20 +1,177 @@
 import os
+import time
+import asyncio
+import threading
 import requests
 import json
+import httpx
+from contextlib import contextmanager, asynccontextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 
+
+class OllamaBusyError(Exception):
+    """Levée quand aucune place ne se libère auprès du serveur de modèles dans le délai imparti."""
+    pass
+
+
+class OllamaHttpPool:
+    """
+    Couche HTTP partagée vers le serveur Ollama.
+
+    - connexions keep-alive réutilisées (requests.Session + HTTPAdapter côté synchrone,
+      httpx.AsyncClient côté streaming asynchrone) ;
+    - timeouts de connexion et de lecture (délai max entre deux fragments) sur chaque requête ;
+    - concurrence bornée : au plus `max_concurrency` générations simultanées par chemin
+      (synchrone / asynchrone), les suivantes attendent au plus `acquire_timeout` secondes ;
+    - métriques exposées par `metrics()`.
+    """
+
+    def __init__(self, max_connections=16, max_concurrency=8, connect_timeout=5.0, read_timeout=120.0,
+                 acquire_timeout=30.0, connect_retries=2):
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self.session = requests.Session()
+        # Seules les erreurs de connexion sont rejouées : une génération n'est jamais relancée.
+        self.adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections, pool_block=True,
+            max_retries=Retry(total=connect_retries, connect=connect_retries, read=0, status=0, backoff_factor=0.2)
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        self.async_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.async_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # Créés au premier appel, dans la boucle asyncio du serveur
+        self._async_client = None
+        self._async_semaphore = None
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "requests": 0, "errors": 0, "timeouts": 0, "rejected": 0,
+            "in_flight": 0, "waiting": 0, "max_in_flight": 0, "total_latency_s": 0.0,
+        }
+
+    # --- Métriques ---
+    def _update(self, **deltas):
+        with self._metrics_lock:
+            for name, delta in deltas.items():
+                self._metrics[name] += delta
+            self._metrics["max_in_flight"] = max(self._metrics["max_in_flight"], self._metrics["in_flight"])
+
+    def _record_error(self, error):
+        if isinstance(error, (requests.Timeout, httpx.TimeoutException)):
+            self._update(timeouts=1)
+        self._update(errors=1)
+
+    def metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        completed = metrics["requests"]
+        metrics["avg_latency_s"] = metrics["total_latency_s"] / completed if completed else None
+        metrics["max_concurrency"] = self.max_concurrency
+        metrics["max_connections"] = self.max_connections
+        # Connexions ouvertes par urllib3 : si elles augmentent comme les requêtes, le keep-alive ne joue pas.
+        pools = [self.adapter.poolmanager.pools[key] for key in self.adapter.poolmanager.pools.keys()]
+        metrics["sync_connections_opened"] = sum(pool.num_connections for pool in pools)
+        metrics["sync_requests_sent"] = sum(pool.num_requests for pool in pools)
+        return metrics
+
+    # --- Chemin synchrone ---
+    @contextmanager
+    def post_stream(self, url, payload):
+        """POST streamé ; la place de concurrence est conservée jusqu'à la fin de la lecture."""
+        self._update(waiting=1)
+        acquired = self._semaphore.acquire(timeout=self.acquire_timeout)
+        self._update(waiting=-1)
+        if not acquired:
+            self._update(rejected=1)
+            raise OllamaBusyError(f"Serveur de modèles saturé ({self.max_concurrency} générations en cours).")
+        self._update(in_flight=1)
+        start = time.perf_counter()
+        try:
+            with self.session.post(url, json=payload, stream=True,
+                                   timeout=(self.connect_timeout, self.read_timeout)) as response:
+                yield response
+        except Exception as e:
+            self._record_error(e)
+            raise
+        finally:
+            self._update(in_flight=-1, requests=1, total_latency_s=time.perf_counter() - start)
+            self._semaphore.release()
+
+    # --- Chemin asynchrone ---
+    def _get_async_client(self):
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(timeout=self.async_timeout, limits=self.async_limits)
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client
+
+    @asynccontextmanager
+    async def apost_stream(self, url, payload):
+        """Équivalent asynchrone de post_stream (httpx)."""
+        client = self._get_async_client()
+        self._update(waiting=1)
+        try:
+            await asyncio.wait_for(self._async_semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._update(rejected=1)
+            raise OllamaBusyError(f"Serveur de modèles saturé ({self.max_concurrency} générations en cours).")
+        finally:
+            self._update(waiting=-1)
+        self._update(in_flight=1)
+        start = time.perf_counter()
+        try:
+            async with client.stream("POST", url, json=payload) as response:
+                yield response
+        except Exception as e:
+            self._record_error(e)
+            raise
+        finally:
+            self._update(in_flight=-1, requests=1, total_latency_s=time.perf_counter() - start)
+            self._async_semaphore.release()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        self.session.close()
+
+
 class OllamaAPI:
-    def __init__(self, api_url="http://localhost:11434/api/generate"):
+    def __init__(self, api_url="http://localhost:11434/api/generate", pool=None):
         self.api_url = api_url
+        # Connexions keep-alive, timeouts et concurrence bornée vers Ollama
+        self.pool = pool if pool is not None else OllamaHttpPool()
         load_dotenv()
         GROQ_API_KEY = os.getenv("GROQ_API_KEY")
         # Instancie le LLM Groq de LangChain
         self.groq_llm = ChatGroq(api_key=GROQ_API_KEY,
                                  model="llama3-8b-8192",
-                                 temperature=0.6                                 
+                                 temperature=0.6
                                  )
 
+    @staticmethod
+    def build_ollama_payload(prompt, model, max_tokens, repeat_penalty, top_p, temperature, stop):
+        return {
+            "model": model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "repeat_penalty": repeat_penalty,
+            "top_p": top_p,
+            "temperature": temperature,
+            "stop": stop
+        }
+
     def chat_with_ollama(self, prompt,
                         model="gemma3:4b",
                         max_tokens=8000,
@@ -38,39 +195,93 @@ class OllamaAPI:
 
         # 2. Si Groq échoue, fallback sur Ollama local
         try:
-            response = requests.post(
-                self.api_url,
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "max_tokens": max_tokens,
-                    "repeat_penalty": repeat_penalty,
-                    "top_p": top_p,
-                    "temperature": temperature,
-                    "stop": stop
-                },
-                stream=True
-            )
-            if response.status_code == 200:
-                messages = []
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            json_line = line.decode('utf-8')
-                            data = json.loads(json_line)
-                            messages.append(data.get("response", ""))
-                            if data.get("done", False):
-                                break
-                        except json.JSONDecodeError:
-                            continue
-                return "".join(messages)
-            else:
-                return f"Error: {response.status_code} - {response.text}"
+            payload = self.build_ollama_payload(prompt, model, max_tokens, repeat_penalty, top_p, temperature, stop)
+            with self.pool.post_stream(self.api_url, payload) as response:
+                if response.status_code == 200:
+                    messages = []
+                    for line in response.iter_lines():
+                        if line:
+                            try:
+                                json_line = line.decode('utf-8')
+                                data = json.loads(json_line)
+                                messages.append(data.get("response", ""))
+                                if data.get("done", False):
+                                    break
+                            except json.JSONDecodeError:
+                                continue
+                    return "".join(messages)
+                else:
+                    return f"Error: {response.status_code} - {response.text}"
         except Exception as e:
             return f"Error: {str(e)}"
 
+    async def astream_chat(self, prompt,
+                           model="gemma3:4b",
+                           max_tokens=8000,
+                           repeat_penalty=1.1,
+                           top_p=0.9,
+                           temperature=0.6,
+                           stop=None,
+                           status=None):
+        """
+        Version asynchrone et streamée de chat_with_ollama : produit les tokens dès leur arrivée.
+        Groq (en ligne) d'abord, sinon fallback sur Ollama local tant qu'aucun token n'a été émis.
+        status: dict optionnel ; status["complete"] passe à True seulement si la réponse est arrivée
+            en entier (les erreurs, même après des tokens, sont émises comme du texte).
+        """
+        if status is not None:
+            status["complete"] = False
+        # 1. Essayer Groq (en ligne)
+        emitted = False
+        try:
+            async for chunk in self.groq_llm.astream(prompt):
+                token = chunk.content if hasattr(chunk, "content") else str(chunk)
+                if token:
+                    emitted = True
+                    yield token
+            if status is not None:
+                status["complete"] = True
+            return
+        except Exception as e:
+            if emitted:
+                # La réponse est partiellement envoyée : pas de fallback possible.
+                yield f"\nError: {str(e)}"
+                return
+            print(f"Groq failed: {e}, fallback to Ollama local.")
+
+        # 2. Si Groq échoue, fallback sur Ollama local (NDJSON streamé)
+        try:
+            payload = self.build_ollama_payload(prompt, model, max_tokens, repeat_penalty, top_p, temperature, stop)
+            async with self.pool.apost_stream(self.api_url, payload) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    yield f"Error: {response.status_code} - {body.decode('utf-8', errors='replace')}"
+                    return
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    token = data.get("response", "")
+                    if token:
+                        yield token
+                    if data.get("done", False):
+                        if status is not None:
+                            status["complete"] = True
+                        break
+        except Exception as e:
+            yield f"Error: {str(e)}"
+
+    def pool_metrics(self):
+        return self.pool.metrics()
+
+    async def aclose(self):
+        await self.pool.aclose()
+
 # # Utilisation
 # ollama_api = OllamaAPI()
 # prompt_text = "Bonjour, peux-tu m'aider ?"
 # llm_raw_response = ollama_api.chat_with_ollama(prompt_text)
-# print(llm_raw_response)
\ No newline at end of file
+# print(llm_raw_response)
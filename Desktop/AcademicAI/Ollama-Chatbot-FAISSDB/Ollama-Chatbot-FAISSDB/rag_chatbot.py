@@ -1,5 +1,7 @@
 import sys
 import time
+import asyncio
+import threading
 import os, re
 import pickle
 import faiss
@@ -8,37 +10,159 @@ from colorama import Fore, Style
 from sentence_transformers import SentenceTransformer
 # Supposons que OllamaAPI, FileProcessor, FilterManager sont correctement importés
 from ollama_api import OllamaAPI
-from Utilitaire.file_processor import FileProcessor
+from Utilitaire.file_processor import FileProcessor, AlreadyProcessedError
+from Utilitaire.EDA_Cleaner import FastTextPipeline
 from Utilitaire.filter_manager import FilterManager
 from Utilitaire.promptbuilder import PromptBuilder
+from Utilitaire.vector_search import VectorSearch
+from Utilitaire.sharded_index import ShardedIndex
+from Utilitaire.chunk_store import ChunkStore
+from Utilitaire.ingestion_log import IngestionLog
+from Utilitaire.semantic_cache import SemanticCache
+from Utilitaire.embedding_cache import QueryEmbeddingCache
+from Utilitaire.mmr import MMR
+from Utilitaire.reranker import CrossEncoderReranker
+from Utilitaire.lexical_index import LexicalIndex
+from Utilitaire.chunk_dedup import ChunkDedupIndex
+from Utilitaire.embedding_store import EmbeddingStore
+from Utilitaire.rw_lock import ReadWriteLock
 
 import traceback # Pour un meilleur débogage
 
 class RAGChatbot:
     
-    def __init__(self, ollama_api, chunk_size=384, chunk_overlap=96, faiss_index_file='./vector_store/faiss_index.faiss', metadata_file='./vector_store/metadata.pickle', hashes_file='./vector_store/hashes.pickle'):
+    def __init__(self, ollama_api, chunk_size=384, chunk_overlap=96, faiss_index_file='./vector_store/faiss_index.faiss', metadata_file='./vector_store/metadata.pickle', hashes_file='./vector_store/hashes.pickle',
+                 use_shards=False, shard_dir='./vector_store/shards', max_loaded_shards=16,
+                 embedding_batch_size=64, embedding_sort_by_length=True,
+                 log_file='./vector_store/ingestion.log', compaction_threshold=5000, background_compaction=True,
+                 chunk_store_dir='./vector_store/chunks', mmap_index=True,
+                 use_response_cache=False, response_cache_threshold=0.95, response_cache_ttl=3600,
+                 response_cache_max_entries=512, query_cache_size=2048, query_cache_path=None,
+                 use_reranker=False, reranker_model=CrossEncoderReranker.DEFAULT_MODEL, rerank_budget_ms=150.0,
+                 rerank_pool_factor=10, use_hybrid_search=False, hybrid_min_similarity=0.3, rrf_k=60,
+                 chunking='characters', chunk_max_tokens=192,
+                 chunk_dedup=True, chunk_dedup_near_duplicates=True, chunk_dedup_threshold=0.85,
+                 deletion_compaction_ratio=0.2,
+                 embedding_store_dir='./vector_store/embeddings', embedding_store_dtype='float32'):
         self.ollama_api = ollama_api
-        self.embedding_model = SentenceTransformer('BAAI/bge-base-en-v1.5')
-        self.file_processor = FileProcessor(chunk_size, chunk_overlap)
+        self.embedding_model_name = 'BAAI/bge-base-en-v1.5'
+        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        # Cache des embeddings de requêtes (texte normalisé), optionnellement persistant sur disque
+        self.query_embedding_cache = QueryEmbeddingCache(
+            self.embedding_model_name, query_cache_size, query_cache_path
+        )
+        # chunking='structure' : chunks de phrases/paragraphes limités à chunk_max_tokens tokens du modèle,
+        # doublons supprimés dans chaque document
+        self.file_processor = FileProcessor(
+            chunk_size, chunk_overlap, chunking=chunking,
+            tokenizer_name=self.embedding_model_name, max_tokens=chunk_max_tokens
+        )
         self.dimension = 768  # Correct pour BAAI/bge-base-en-v1.5
+        # Cache persistant des embeddings de chunks (modèle, hash du texte) : ré-ingestion et
+        # reconstruction de l'index (rebuild_index) sans inférence pour les chunks déjà encodés
+        self.embedding_store = EmbeddingStore(
+            embedding_store_dir, self.embedding_model_name, self.dimension, embedding_store_dtype
+        ) if embedding_store_dir else None
         self.MCNoeud = 32
         self.efSearch = 100
         self.efConstruction = 80
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_sort_by_length = embedding_sort_by_length
+        self.last_embedding_throughput = None  # chunks/seconde de la dernière ingestion
+        # Reranking optionnel par cross-encoder sur un pool élargi (top_k * rerank_pool_factor)
+        self.rerank_pool_factor = rerank_pool_factor
+        self.reranker = CrossEncoderReranker(
+            reranker_model, latency_budget_ms=rerank_budget_ms
+        ) if use_reranker else None
+        # Recherche hybride optionnelle : BM25 (SQLite FTS5 sur chunk_text) fusionné aux résultats Faiss par RRF.
+        # La requête est nettoyée comme les chunks à l'ingestion (mêmes tokens des deux côtés).
+        self.lexical_index = LexicalIndex(
+            self.SQLITE_DB_PATH, normalize=FastTextPipeline.shared().process
+        ) if use_hybrid_search else None
+        self.hybrid_min_similarity = hybrid_min_similarity
+        self.rrf_k = rrf_k
+        # Déduplication des chunks entre documents d'un même locataire : les chunks déjà indexés
+        # réutilisent l'ID Faiss existant ; les quasi-doublons (MinHash/LSH) gardent leur texte
+        # et leur ID, mais recopient le vecteur existant au lieu d'être encodés
+        self.chunk_dedup = ChunkDedupIndex(
+            self.SQLITE_DB_PATH, threshold=chunk_dedup_threshold
+        ) if chunk_dedup else None
+        self.chunk_dedup_near_duplicates = chunk_dedup_near_duplicates
+        # Cache sémantique des réponses par (locataire, type de prompt), invalidé à l'ingestion (optionnel)
+        self.response_cache = SemanticCache(
+            response_cache_threshold, response_cache_ttl, response_cache_max_entries
+        ) if use_response_cache else None
         self.faiss_index_file = faiss_index_file
         self.metadata_file = metadata_file
         self.hashes_file = hashes_file
+        # Index et métadonnées projetés en mémoire (mmap) : démarrage en temps constant,
+        # pages partagées entre workers uvicorn. L'index est rechargé en mémoire avant le premier ajout.
+        # Limite : si le journal d'ingestion n'est pas vide au démarrage (ingestions depuis la dernière
+        # compaction), l'index complet est lu en RAM pour y rejouer le journal ; le démarrage redevient
+        # en temps constant après la prochaine compaction (compact_state).
+        self.chunk_store_dir = chunk_store_dir
+        self.mmap_index = mmap_index
+        self._index_mapped = False
+        # Journal append-only : compacté en snapshot complet au-delà de `compaction_threshold` vecteurs
+        self.compaction_threshold = compaction_threshold
+        self.background_compaction = background_compaction
+        self._state_lock = threading.RLock()
+        # Recherches (lecture) et modifications en mémoire de l'état de recherche (écriture) : HNSW
+        # n'accepte pas d'ajout pendant une recherche, et une recherche ne doit jamais voir un état
+        # à moitié mis à jour (index, ChunkStore, IDs autorisés, tombstones, partitions)
+        self._search_lock = ReadWriteLock()
+        self._compaction_thread = None
+        # Suppression de documents : les chunks supprimés (tombstones) sont exclus des recherches,
+        # puis retirés de l'index et les IDs renumérotés au-delà de `deletion_compaction_ratio` de l'index
+        self.deletion_compaction_ratio = deletion_compaction_ratio
+        self._deletion_compaction_thread = None
+        self.id_generation = 0  # incrémenté à chaque renumérotation des ID Faiss
 
         self.index = self.load_or_initialize_index()
-        self.metadata = self.load_or_initialize_metadata() # C'est une liste de dictionnaires
+        self.metadata = self.load_or_initialize_metadata() # ChunkStore adressé par ID Faiss
         self.load_processed_hashes()
+        self.ingestion_log = IngestionLog(log_file)
+        if self.ingestion_log.size_bytes() > 0:
+            self._ensure_writable_index()
+        # Les trames d'un commit interrompu après l'écriture du journal (SQLite non validé) ne sont pas rejouées
+        replayed = self.ingestion_log.replay_into(
+            self.index, self.metadata, self.file_processor.processed_hashes,
+            last_committed_id=FilterManager.get_last_committed_id()
+        )
+        if replayed:
+            print(f"{replayed} vecteurs rejoués depuis le journal {log_file}.")
+        # Documents entièrement dédupliqués : aucune trame de journal, leur hash n'est que dans SQLite
+        self.file_processor.processed_hashes |= FilterManager.get_ingested_hashes()
+        self.tombstones, deleted_hashes = FilterManager.load_deletions()
+        # Les documents supprimés peuvent être ré-ingérés (le journal rejoue leurs hashes)
+        self.file_processor.processed_hashes -= deleted_hashes
+        if len(self.tombstones):
+            print(f"{len(self.tombstones)} chunks supprimés en attente de compaction.")
+
+        # Index partitionnés par (departement_id, filiere_id), optionnels.
+        # L'index principal reste la référence (persistance, reconstruction, requêtes sans filtre).
+        self.shards = None
+        if use_shards:
+            self.shards = ShardedIndex(shard_dir, self.dimension, self.MCNoeud, self.efSearch,
+                                       self.efConstruction, max_loaded_shards)
+            self.shards.set_source(lambda: self.index, lambda key: self.metadata.ids_for_tenant(*key))
+            if self.index.ntotal > 0 and not self.shards.known_keys():
+                print("Construction initiale des index partitionnés à partir de l'index principal...")
+                self.shards.rebuild(self.index, self.metadata.tenant_keys())
 
     def normalize_embedding(self, embedding):
         norm = np.linalg.norm(embedding)
         return embedding / norm if norm > 0 else embedding
 
-    def load_or_initialize_index(self):
+    def load_or_initialize_index(self, mmap=None):
+        mmap = self.mmap_index if mmap is None else mmap
+        self._index_mapped = False
         if os.path.exists(self.faiss_index_file):
             # print(f"Chargement de l'index Faiss depuis {self.faiss_index_file}")
+            mmap_flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', None)
+            if mmap and mmap_flag is not None:
+                self._index_mapped = True
+                return faiss.read_index(self.faiss_index_file, mmap_flag)
             return faiss.read_index(self.faiss_index_file)
         else:
             
@@ -48,14 +172,36 @@ class RAGChatbot:
             index.hnsw.efConstruction = self.efConstruction
             return index
 
+    def _ensure_writable_index(self):
+        """
+        Un index projeté en mémoire est en lecture seule : le charger en RAM avant tout ajout.
+        Appelé aussi au démarrage quand le journal n'est pas vide : le rejeu lit alors tout l'index
+        (pas de delta en RAM au-dessus de la base projetée), au prix de la mémoire de chaque worker.
+        """
+        if self._index_mapped:
+            print("Chargement de l'index Faiss en mémoire avant écriture...")
+            self.index = self.load_or_initialize_index(mmap=False)
+
     def load_or_initialize_metadata(self):
+        if ChunkStore.exists_dir(self.chunk_store_dir):
+            return ChunkStore.open_dir(self.chunk_store_dir, mmap=True)
         if os.path.exists(self.metadata_file):
             #print(f"Chargement des métadonnées depuis {self.metadata_file}")
             with open(self.metadata_file, 'rb') as f:
-                return pickle.load(f)
+                state = pickle.load(f)
+            if isinstance(state, list):
+                # Ancien format : liste de dictionnaires, convertie une seule fois.
+                print("Conversion des métadonnées (liste de dictionnaires) vers le ChunkStore...")
+                store = ChunkStore.from_records(state)
+            else:
+                store = ChunkStore.from_state(state)
+            # Migration vers le format projetable en mémoire, lu directement aux prochains démarrages.
+            print(f"Migration des métadonnées vers {self.chunk_store_dir}...")
+            store.save_dir(self.chunk_store_dir)
+            return store
         else:
-            print("Initialisation d'une nouvelle liste de métadonnées.")
-            return []
+            print("Initialisation d'un nouveau stockage de métadonnées.")
+            return ChunkStore()
 
     def load_processed_hashes(self):
         if os.path.exists(self.hashes_file):
@@ -69,16 +215,260 @@ class RAGChatbot:
                  self.file_processor.processed_hashes = set()
 
 
+    @staticmethod
+    def _atomic_write(path, write):
+        """Écrit via un fichier temporaire puis os.replace : un crash ne laisse jamais de fichier à moitié écrit."""
+        tmp_path = path + ".tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _write_pickle(self, obj):
+        def write(path):
+            with open(path, 'wb') as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+        return write
+
     def save_state(self):
+        """Écrit un snapshot complet (index, métadonnées, hashes)."""
         print("Sauvegarde de l'état (index, métadonnées, hashes)...")
-        os.makedirs(os.path.dirname(self.faiss_index_file), exist_ok=True)
-        faiss.write_index(self.index, self.faiss_index_file)
-        with open(self.metadata_file, 'wb') as f:
-            pickle.dump(self.metadata, f)
-        with open(self.hashes_file, 'wb') as f:
-            pickle.dump(self.file_processor.processed_hashes, f)
+        with self._state_lock:
+            self._write_snapshot(self.index, self.metadata)
         print("État sauvegardé.")
 
+    def _write_snapshot(self, index, metadata):
+        """Écrit `index` et `metadata` (pas forcément encore publiés) avec les hashes traités."""
+        os.makedirs(os.path.dirname(self.faiss_index_file), exist_ok=True)
+        self._atomic_write(self.faiss_index_file, lambda path: faiss.write_index(index, path))
+        metadata.save_dir(self.chunk_store_dir)
+        self._atomic_write(self.hashes_file, self._write_pickle(set(self.file_processor.processed_hashes)))
+
+    def compact_state(self):
+        """Compacte le journal : écrit un snapshot complet puis vide le journal."""
+        with self._state_lock:
+            self.save_state()
+            self.ingestion_log.reset()
+        print("Journal d'ingestion compacté.")
+
+    def _maybe_compact(self):
+        if self.ingestion_log.vector_count < self.compaction_threshold:
+            return
+        if not self.background_compaction:
+            self.compact_state()
+        elif self._compaction_thread is None or not self._compaction_thread.is_alive():
+            self._compaction_thread = threading.Thread(target=self.compact_state, daemon=True)
+            self._compaction_thread.start()
+
+    def rollback_index(self, ntotal):
+        """
+        Ramène l'index Faiss à `ntotal` vecteurs. HNSW ne permet pas de retirer des
+        vecteurs : on recharge le dernier snapshot et on rejoue le journal, déjà tronqué.
+        """
+        print(f"Annulation de l'ajout Faiss : retour à {ntotal} vecteurs.")
+        index = self.load_or_initialize_index(mmap=False)
+        self.ingestion_log.replay_into(index, self.metadata, self.file_processor.processed_hashes)
+        with self._search_lock.write():
+            self.index = index
+        if self.index.ntotal != ntotal:
+            raise RuntimeError(
+                f"Impossible d'annuler l'ajout Faiss : l'état sauvegardé contient {self.index.ntotal} vecteurs, {ntotal} attendus."
+            )
+
+    def delete_document(self, file_hash):
+        """
+        Supprime un document : ses lignes SQLite sont effacées et ses chunks qui ne sont plus
+        référencés par aucun document (chunks dédupliqués partagés exclus) deviennent des tombstones,
+        exclus des recherches jusqu'à la compaction (compact_deleted).
+        Retourne un résumé de la suppression, ou None si le document est inconnu.
+        """
+        with self._state_lock:
+            with FilterManager.metadata_transaction() as conn:
+                deleted = FilterManager.delete_document_metadata(conn, file_hash)
+                if deleted is None:
+                    return None
+                orphaned = [ids for ids in deleted["orphaned"].values()]
+                orphaned = np.concatenate(orphaned) if orphaned else np.empty(0, dtype='int64')
+                if self.chunk_dedup is not None:
+                    self.chunk_dedup.delete(conn, orphaned)
+
+            with self._search_lock.write():
+                self.tombstones = np.union1d(self.tombstones, orphaned)
+                for (departement_id, filiere_id), ids in deleted["orphaned"].items():
+                    FilterManager.remove_allowed_indices(ids, departement_id, filiere_id)
+            self.file_processor.processed_hashes.discard(file_hash)
+            if self.chunk_dedup is not None:
+                self.chunk_dedup.forget(orphaned)
+            if self.response_cache is not None:
+                for departement_id, filiere_id in deleted["orphaned"]:
+                    self.response_cache.invalidate_tenant(departement_id, filiere_id)
+        print(f"Document {deleted['base_filename']} supprimé : {deleted['chunks']} chunks, "
+              f"{len(orphaned)} vecteurs marqués supprimés ({len(self.tombstones)} en attente de compaction).")
+        self._maybe_compact_deleted()
+        return {
+            "file_hash": file_hash,
+            "base_filename": deleted["base_filename"],
+            "chunks": deleted["chunks"],
+            "vectors_removed": int(len(orphaned)),
+            "pending_tombstones": int(len(self.tombstones)),
+        }
+
+    def replace_document(self, file_hash, base_filename, file_content, departement_id, filiere_id, module_id, activite_id, profile_id, user_id):
+        """
+        Remplace un document par une nouvelle version. La nouvelle version est ingérée d'abord :
+        ses chunks inchangés réutilisent les vecteurs de l'ancienne (déduplication), seuls les
+        chunks modifiés sont encodés. L'ancienne version est ensuite supprimée ; seuls ses chunks
+        disparus deviennent des tombstones.
+        Retourne le résumé de la suppression (avec "new_file_hash"), ou None si file_hash est inconnu.
+        """
+        if FilterManager.get_document_summary(file_hash) is None:
+            return None
+        new_file_hash = self.ingestion_file(
+            base_filename, file_content, departement_id, filiere_id, module_id, activite_id, profile_id, user_id
+        )
+        if new_file_hash is None:
+            raise ValueError(f"La nouvelle version de {base_filename} ne contient aucun chunk : l'ancienne est conservée.")
+        deleted = self.delete_document(file_hash)
+        if deleted is not None:
+            deleted["new_file_hash"] = new_file_hash
+        return deleted
+
+    def compact_deleted(self):
+        """
+        Compaction des suppressions : reconstruit l'index HNSW sans les tombstones (vecteurs
+        recopiés depuis l'index, sans ré-encodage), renumérote les ID Faiss de façon contiguë
+        (ChunkStore, document_metadata, empreintes de déduplication, partitions), puis écrit un
+        snapshot complet et vide le journal. Retourne le nombre de vecteurs retirés.
+        """
+        with self._state_lock:
+            tombstones = self.tombstones
+            if len(tombstones) == 0:
+                return 0
+            ntotal = self.index.ntotal
+            live_ids = np.setdiff1d(np.arange(ntotal, dtype='int64'), tombstones)
+            print(f"Compaction des suppressions : {len(tombstones)} vecteurs retirés, {len(live_ids)} conservés...")
+            index = faiss.IndexHNSWFlat(self.dimension, self.MCNoeud, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.efSearch
+            index.hnsw.efConstruction = self.efConstruction
+            for start in range(0, len(live_ids), 4096):
+                index.add(self.index.reconstruct_batch(live_ids[start:start + 4096]))
+            metadata = self.metadata.subset(live_ids)
+            shards = None
+            if self.shards is not None:
+                shards = ShardedIndex(self.shards.shard_dir + ".compaction", self.dimension, m=self.shards.m,
+                                      ef_search=self.shards.ef_search, ef_construction=self.shards.ef_construction,
+                                      max_loaded_shards=self.shards.max_loaded_shards)
+                shards.reset()
+                shards.rebuild(index, metadata.tenant_keys())
+
+            # Le nouvel état est préparé à part ; les recherches voient l'ancien jusqu'à la publication.
+            with FilterManager.metadata_transaction() as conn:
+                FilterManager.remap_chunk_indices(conn, live_ids)
+                if self.chunk_dedup is not None:
+                    self.chunk_dedup.remap(conn, live_ids)
+                allowed_ids = FilterManager.read_allowed_indices(conn)
+                # Le snapshot renuméroté est écrit avant la validation SQLite. En cas d'échec, la
+                # transaction est annulée et l'ancien état (toujours publié) est réécrit sur disque.
+                try:
+                    self._write_snapshot(index, metadata)
+                    self.ingestion_log.reset()
+                except Exception:
+                    self.save_state()
+                    raise
+
+                # Publication en une seule fois : validation SQLite et bascule de tout l'état de recherche
+                with self._search_lock.write():
+                    try:
+                        conn.commit()
+                    except Exception:
+                        self.save_state()
+                        raise
+                    self.index, self.metadata, self._index_mapped = index, metadata, False
+                    self.tombstones = np.empty(0, dtype='int64')
+                    self.id_generation += 1
+                    FilterManager.replace_allowed_indices(allowed_ids)
+                    if shards is not None:
+                        self.shards.adopt(shards)
+                    if self.response_cache is not None:
+                        self.response_cache.clear()
+
+            if self.chunk_dedup is not None:
+                self.chunk_dedup.reset()
+        print(f"Compaction terminée : l'index Faiss contient {self.index.ntotal} vecteurs.")
+        return int(len(tombstones))
+
+    def _maybe_compact_deleted(self):
+        if len(self.tombstones) < self.deletion_compaction_ratio * max(self.index.ntotal, 1):
+            return
+        if not self.background_compaction:
+            self.compact_deleted()
+        elif self._deletion_compaction_thread is None or not self._deletion_compaction_thread.is_alive():
+            self._deletion_compaction_thread = threading.Thread(target=self.compact_deleted, daemon=True)
+            self._deletion_compaction_thread.start()
+
+    def rebuild_index(self, m=None, ef_construction=None, ef_search=None):
+        """
+        Reconstruit l'index HNSW sans ré-encoder le corpus, par exemple pour changer les paramètres
+        HNSW ou après la corruption de l'index. Les vecteurs viennent du cache d'embeddings (clé :
+        texte de chaque chunk du ChunkStore) ; à défaut, de l'index courant s'il est lisible ; seuls
+        les chunks absents des deux sont encodés. Les ID Faiss sont conservés.
+        Écrit un snapshot complet et vide le journal. Retourne un rapport.
+        """
+        start_time = time.perf_counter()
+        with self._state_lock:
+            count = len(self.metadata)
+            texts = [self.metadata.get_text(faiss_id) or "" for faiss_id in range(count)]
+            if self.embedding_store is not None:
+                vectors, found = self.embedding_store.get_many(texts)
+            else:
+                vectors, found = np.zeros((count, self.dimension), dtype='float32'), np.zeros(count, dtype=bool)
+            from_cache = int(found.sum())
+            from_index = 0
+            missing = np.nonzero(~found)[0]
+            if missing.size and getattr(self.index, 'ntotal', 0) == count:
+                try:
+                    vectors[missing] = self.index.reconstruct_batch(missing)
+                    from_index = int(missing.size)
+                    if self.embedding_store is not None:
+                        # Le cache est complété : la prochaine reconstruction n'aura plus besoin de l'index
+                        self.embedding_store.put_many([texts[i] for i in missing], vectors[missing])
+                    missing = missing[:0]
+                except Exception as e:
+                    print(f"Index courant illisible ({e}) : les vecteurs manquants seront ré-encodés.")
+            if missing.size:
+                vectors[missing] = self.embed_chunks([texts[i] for i in missing])
+
+            if m is not None:
+                self.MCNoeud = m
+            if ef_construction is not None:
+                self.efConstruction = ef_construction
+            if ef_search is not None:
+                self.efSearch = ef_search
+            index = faiss.IndexHNSWFlat(self.dimension, self.MCNoeud, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.efSearch
+            index.hnsw.efConstruction = self.efConstruction
+            for start in range(0, count, 4096):
+                index.add(vectors[start:start + 4096])
+            with self._search_lock.write():
+                self.index, self._index_mapped = index, False
+            self.save_state()
+            self.ingestion_log.reset()
+            if self.shards is not None:
+                self.shards.rebuild(self.index, self.metadata.tenant_keys())
+        report = {
+            "vectors": count,
+            "from_cache": from_cache,
+            "from_index": from_index,
+            "encoded": int(missing.size),
+            "m": self.MCNoeud,
+            "ef_construction": self.efConstruction,
+            "ef_search": self.efSearch,
+            "seconds": round(time.perf_counter() - start_time, 3),
+        }
+        print(f"Index Faiss reconstruit : {count} vecteurs ({from_cache} depuis le cache, {from_index} depuis "
+              f"l'index, {report['encoded']} encodés) en {report['seconds']}s.")
+        return report
+
     def reset_faiss_database(self):
         """
         Vide complètement la base vectorielle FAISS en supprimant tous les fichiers
@@ -87,76 +477,296 @@ class RAGChatbot:
         Returns:
             dict: Message de confirmation avec le statut de l'opération
         """
-        try:
-            print("Début de la réinitialisation de la base vectorielle FAISS...")
+        # Aucune ingestion ni recherche pendant la réinitialisation
+        with self._state_lock, self._search_lock.write():
+            try:
+                print("Début de la réinitialisation de la base vectorielle FAISS...")
+
+                # Vider le journal en premier : il ne doit pas être rejoué sur l'état vide
+                self.ingestion_log.reset()
             
-            # Liste des fichiers à supprimer
-            files_to_remove = [
-                self.faiss_index_file,
-                self.metadata_file, 
-                self.hashes_file
-            ]
+                # Liste des fichiers à supprimer
+                files_to_remove = [
+                    self.faiss_index_file,
+                    self.metadata_file, 
+                    self.hashes_file
+                ]
             
-            # Supprimer les fichiers existants s'ils existent
-            removed_files = []
-            for file_path in files_to_remove:
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        removed_files.append(file_path)
-                        print(f"Fichier supprimé : {file_path}")
-                    except OSError as e:
-                        print(f"Erreur lors de la suppression de {file_path} : {e}")
-                        raise
+                # Supprimer les fichiers existants s'ils existent
+                removed_files = []
+                for file_path in files_to_remove:
+                    if os.path.exists(file_path):
+                        try:
+                            os.remove(file_path)
+                            removed_files.append(file_path)
+                            print(f"Fichier supprimé : {file_path}")
+                        except OSError as e:
+                            print(f"Erreur lors de la suppression de {file_path} : {e}")
+                            raise
             
-            # Réinitialiser l'index FAISS avec un nouvel index vide
-            print("Création d'un nouvel index FAISS vide...")
-            self.index = faiss.IndexHNSWFlat(self.dimension, self.MCNoeud, faiss.METRIC_INNER_PRODUCT)
-            self.index.hnsw.efSearch = self.efSearch
-            self.index.hnsw.efConstruction = self.efConstruction
+                # Réinitialiser l'index FAISS avec un nouvel index vide
+                print("Création d'un nouvel index FAISS vide...")
+                self.index = faiss.IndexHNSWFlat(self.dimension, self.MCNoeud, faiss.METRIC_INNER_PRODUCT)
+                self.index.hnsw.efSearch = self.efSearch
+                self.index.hnsw.efConstruction = self.efConstruction
+                self._index_mapped = False
             
-            # Réinitialiser les métadonnées
-            self.metadata = []
+                # Réinitialiser les métadonnées
+                self.metadata = ChunkStore()
             
-            # Réinitialiser les hashes traités
-            self.file_processor.processed_hashes = set()
+                # Réinitialiser les hashes traités
+                self.file_processor.processed_hashes = set()
+                # Le cache d'embeddings est conservé : la ré-ingestion des fichiers ne ré-encode pas leurs chunks
+
+                # Supprimer les index partitionnés
+                if self.shards is not None:
+                    self.shards.reset()
             
-            # Supprimer les métadonnées de la base SQLite (si nécessaire)
-            try:
-                FilterManager.clear_all_metadata_sqlite()
-                print("Métadonnées SQLite vidées")
-            except Exception as e:
-                print(f"Avertissement : Erreur lors du vidage des métadonnées SQLite : {e}")
+                # Supprimer les métadonnées de la base SQLite (si nécessaire)
+                try:
+                    FilterManager.clear_all_metadata_sqlite()
+                    print("Métadonnées SQLite vidées")
+                except Exception as e:
+                    print(f"Avertissement : Erreur lors du vidage des métadonnées SQLite : {e}")
+                FilterManager.invalidate_allowed_indices()
+                FilterManager.clear_deletions()
+                self.tombstones = np.empty(0, dtype='int64')
+                if self.chunk_dedup is not None:
+                    self.chunk_dedup.clear()
+                if self.response_cache is not None:
+                    self.response_cache.clear()
             
-            # Sauvegarder l'état vide
-            self.save_state()
+                # Sauvegarder l'état vide
+                self.save_state()
             
-            result_message = {
-                "status": "success",
-                "message": "Base vectorielle FAISS réinitialisée avec succès",
-                "details": {
-                    "removed_files": removed_files,
-                    "total_vectors_before": "Inconnu (fichiers supprimés)",
-                    "total_vectors_after": 0,
-                    "metadata_count": 0,
-                    "processed_hashes_count": 0
+                result_message = {
+                    "status": "success",
+                    "message": "Base vectorielle FAISS réinitialisée avec succès",
+                    "details": {
+                        "removed_files": removed_files,
+                        "total_vectors_before": "Inconnu (fichiers supprimés)",
+                        "total_vectors_after": 0,
+                        "metadata_count": 0,
+                        "processed_hashes_count": 0
+                    }
                 }
-            }
             
-            print("Réinitialisation FAISS terminée avec succès")
-            return result_message
+                print("Réinitialisation FAISS terminée avec succès")
+                return result_message
             
-        except Exception as e:
-            error_message = {
-                "status": "error", 
-                "message": f"Erreur lors de la réinitialisation FAISS : {str(e)}",
-                "details": {
-                    "error_type": type(e).__name__
+            except Exception as e:
+                error_message = {
+                    "status": "error", 
+                    "message": f"Erreur lors de la réinitialisation FAISS : {str(e)}",
+                    "details": {
+                        "error_type": type(e).__name__
+                    }
                 }
-            }
-            print(f"Erreur lors de la réinitialisation FAISS : {e}")
-            traceback.print_exc()
-            return error_message
+                print(f"Erreur lors de la réinitialisation FAISS : {e}")
+                traceback.print_exc()
+                return error_message
+
+    def embed_chunks(self, chunks, on_batch=None):
+        """
+        Encode les chunks par lots de `embedding_batch_size` (batching SentenceTransformer).
+        Si `embedding_sort_by_length` est actif, les chunks sont encodés par longueur
+        décroissante pour limiter le padding, puis remis dans leur ordre d'origine.
+        on_batch(encodés, total) est appelé après chaque lot (progression, annulation).
+        Les chunks présents dans le cache d'embeddings ne sont pas ré-encodés ; les nouveaux y sont ajoutés.
+        Retourne un np.array float32 de shape (len(chunks), dimension), normalisé.
+        """
+        embeddings = np.empty((len(chunks), self.dimension), dtype='float32')
+        if not chunks:
+            return embeddings
+
+        to_encode = np.arange(len(chunks))
+        if self.embedding_store is not None:
+            cached, found = self.embedding_store.get_many(chunks)
+            embeddings[found] = cached[found]
+            to_encode = np.nonzero(~found)[0]
+            if found.any():
+                print(f"{int(found.sum())} embeddings sur {len(chunks)} lus depuis le cache.")
+        if to_encode.shape[0] == 0:
+            if on_batch is not None:
+                on_batch(len(chunks), len(chunks))
+            return embeddings
+
+        if self.embedding_sort_by_length:
+            order = to_encode[np.argsort([-len(chunks[i]) for i in to_encode], kind='stable')]
+        else:
+            order = to_encode
+
+        start_time = time.perf_counter()
+        for batch_start in range(0, len(order), self.embedding_batch_size):
+            batch_ids = order[batch_start:batch_start + self.embedding_batch_size]
+            embeddings[batch_ids] = self.embedding_model.encode(
+                [chunks[i] for i in batch_ids],
+                batch_size=self.embedding_batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True
+            )
+            if on_batch is not None:
+                on_batch(min(batch_start + self.embedding_batch_size, len(order)), len(order))
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        self.last_embedding_throughput = len(order) / elapsed
+        print(f"{len(order)} chunks encodés en {elapsed:.2f}s "
+              f"({self.last_embedding_throughput:.1f} chunks/s, batch={self.embedding_batch_size})")
+        if self.embedding_store is not None:
+            self.embedding_store.put_many([chunks[i] for i in to_encode], embeddings[to_encode])
+        return embeddings
+
+    def plan_deduplication(self, documents, departement_id=None, filiere_id=None):
+        """
+        Repère dans chaque document (dict avec "chunks") les chunks déjà indexés pour le locataire :
+        les doublons exacts réutilisent l'ID Faiss existant (document["reuse"]), les quasi-doublons
+        sont de nouveaux chunks qui recopient un vecteur existant (document["vector_sources"]).
+        Seuls document["to_encode"] sont à encoder (voir ChunkDedupIndex.plan).
+        Retourne le nombre de chunks dédupliqués (doublons exacts, quasi-doublons).
+        """
+        if self.chunk_dedup is None:
+            for document in documents:
+                document["new_chunks"] = document["to_encode"] = document["chunks"]
+            return 0, 0
+        exact, near = self.chunk_dedup.plan(
+            documents, departement_id, filiere_id, use_near_duplicates=self.chunk_dedup_near_duplicates
+        )
+        for document in documents:
+            document["id_generation"] = self.id_generation
+        if exact or near:
+            print(f"Déduplication : {exact} chunks identiques réutilisés, {near} quasi identiques recopient un vecteur existant.")
+        return exact, near
+
+    def commit_documents(self, documents, filters):
+        """
+        Valide en une seule étape des documents déjà découpés et encodés :
+        une transaction SQLite, un seul ajout Faiss, une trame de journal par document.
+        documents: liste de dicts {"base_filename", "file_hash", "chunks", "embeddings"}, plus
+            éventuellement "reuse", "vector_sources" et "fingerprints" (plan_deduplication) :
+            "embeddings" ne contient alors que les vecteurs de document["to_encode"].
+        filters: dict des colonnes de ChunkStore.INT_COLUMNS, communes à tous les documents.
+        Retourne la liste des ID Faiss attribués à chaque document (un par chunk, réutilisés compris).
+        Lève AlreadyProcessedError, sans rien écrire, si un document a été validé depuis son extraction.
+        """
+        departement_id, filiere_id = filters.get("departement_id"), filters.get("filiere_id")
+        with self._state_lock:
+            # Deux ingestions concurrentes du même fichier passent toutes deux la vérification de l'extraction :
+            # SQLite fait foi (processed_hashes contient aussi les hashes réservés à l'extraction)
+            committed = FilterManager.get_committed_hashes(document["file_hash"] for document in documents)
+            if committed:
+                raise AlreadyProcessedError(
+                    [document["file_hash"] for document in documents if document["file_hash"] in committed]
+                )
+            start_index = self.index.ntotal
+            reuses = [
+                document.get("reuse", np.full(len(document["chunks"]), -1, dtype='int64')) for document in documents
+            ]
+            sources = [
+                document.get("vector_sources", np.full(int(np.sum(reuse == -1)), -1, dtype='int64'))
+                for document, reuse in zip(documents, reuses)
+            ]
+            for document, reuse, source in zip(documents, reuses, sources):
+                reused = np.concatenate([reuse[reuse >= 0], source[source >= 0]])
+                if len(reused) and (document.get("id_generation") != self.id_generation
+                                    or np.isin(reused, self.tombstones).any()):
+                    # Compaction ou suppression concurrente depuis plan_deduplication
+                    raise RuntimeError(
+                        f"Les chunks réutilisés par {document['base_filename']} ont été supprimés ou renumérotés : "
+                        "relancer l'ingestion."
+                    )
+            bounds = np.cumsum([0] + [int(np.sum(reuse == -1)) for reuse in reuses]) + start_index
+            document_indices, new_chunks = [], []
+            for i, (document, reuse) in enumerate(zip(documents, reuses)):
+                # -1 : nouveau chunk ; <= -2 : nouveau chunk d'un document précédent du lot ; >= 0 : ID existant
+                chunk_indices = reuse.copy()
+                is_new = reuse == -1
+                chunk_indices[is_new] = np.arange(bounds[i], bounds[i + 1])
+                in_batch = reuse <= -2
+                chunk_indices[in_batch] = start_index - reuse[in_batch] - 2
+                document_indices.append(chunk_indices)
+                new_chunks.append([chunk for chunk, new in zip(document["chunks"], is_new) if new])
+            # Vecteurs des nouveaux chunks : encodés, ou recopiés d'un quasi-doublon (index ou lot)
+            all_sources = np.concatenate(sources)
+            all_embeddings = np.empty((len(all_sources), self.dimension), dtype='float32')
+            all_embeddings[all_sources == -1] = np.vstack([document["embeddings"] for document in documents])
+            copied = np.nonzero(all_sources >= 0)[0]
+            if len(copied):
+                all_embeddings[copied] = self.index.reconstruct_batch(all_sources[copied])
+            for position in np.nonzero(all_sources <= -2)[0]:
+                all_embeddings[position] = all_embeddings[-all_sources[position] - 2]
+            document_embeddings = [
+                all_embeddings[bounds[i] - start_index:bounds[i + 1] - start_index] for i in range(len(documents))
+            ]
+            index_updated = False
+            log_offset = None
+            self._ensure_writable_index()
+            try:
+                # Une seule transaction SQLite ; elle n'est validée qu'une fois
+                # les vecteurs ajoutés à l'index Faiss et au journal.
+                with FilterManager.metadata_transaction() as conn:
+                    for i, (document, chunk_indices) in enumerate(zip(documents, document_indices)):
+                        FilterManager.insert_metadata_sqlite_bulk(
+                            conn, document["base_filename"], document["file_hash"], chunk_indices, document["chunks"],
+                            departement_id, filiere_id, filters.get("module_id"), filters.get("activite_id"),
+                            filters.get("profile_id"), filters.get("user_id")
+                        )
+                        if self.chunk_dedup is not None and "fingerprints" in document:
+                            self.chunk_dedup.insert(
+                                conn, np.arange(bounds[i], bounds[i + 1]), document["fingerprints"],
+                                departement_id, filiere_id
+                            )
+                    if len(all_embeddings):
+                        with self._search_lock.write():
+                            self.index.add(all_embeddings)
+                        index_updated = True
+                    # Les trames ne contiennent que les nouveaux chunks (IDs consécutifs à partir de start_index) ;
+                    # un document entièrement dédupliqué n'en écrit pas (son hash est relu depuis SQLite).
+                    for i, document in enumerate(documents):
+                        if not new_chunks[i]:
+                            continue
+                        offset = self.ingestion_log.append({
+                            "start_index": int(bounds[i]),
+                            "file_hash": document["file_hash"],
+                            "original_filename": document["base_filename"],
+                            "chunks": new_chunks[i],
+                            "filters": filters,
+                        }, document_embeddings[i])
+                        if log_offset is None:
+                            log_offset = offset
+            except Exception:
+                # Garder Faiss, le journal et SQLite cohérents si le commit a échoué.
+                if log_offset is not None:
+                    self.ingestion_log.truncate(log_offset)
+                if index_updated:
+                    self.rollback_index(start_index)
+                for document in documents:
+                    self.file_processor.processed_hashes.discard(document["file_hash"])
+                raise
+
+            # Publication des nouveaux chunks pour les recherches (en une seule fois)
+            with self._search_lock.write():
+                # Métadonnées adressées par ID Faiss (start_index + i), filtres inclus
+                for i, document in enumerate(documents):
+                    if new_chunks[i]:
+                        self.metadata.append_chunks(document["file_hash"], document["base_filename"], new_chunks[i], **filters)
+                    self.file_processor.processed_hashes.add(document["file_hash"])
+                    if self.chunk_dedup is not None and "fingerprints" in document:
+                        self.chunk_dedup.add(
+                            np.arange(bounds[i], bounds[i + 1]), document["fingerprints"], departement_id, filiere_id
+                        )
+                new_indices = np.arange(start_index, bounds[-1])
+                # Les vecteurs réutilisés appartiennent déjà au locataire : seuls les nouveaux sont enregistrés
+                FilterManager.register_allowed_indices(new_indices, departement_id, filiere_id)
+                if self.response_cache is not None:
+                    self.response_cache.invalidate_tenant(departement_id, filiere_id)
+                if self.shards is not None and len(new_indices):
+                    shard_key = ShardedIndex.shard_key(departement_id, filiere_id)
+                    self.shards.add(shard_key, all_embeddings, new_indices)
+            if self.shards is not None and len(new_indices):
+                # Seule la partition du locataire est réécrite.
+                self.shards.save_shard(shard_key)
+        # La trame du journal suffit à la durabilité : le snapshot complet n'est réécrit qu'à la compaction.
+        self._maybe_compact()
+        return document_indices
 
     def ingestion_file(self, base_filename, file_content, departement_id, filiere_id, module_id, activite_id, profile_id, user_id):
         try:
@@ -171,45 +781,26 @@ class RAGChatbot:
                 print(f"Aucun chunk extrait de {base_filename}. L'indexation est annulée pour ce fichier.")
                 return
 
-            embeddings = []
-            for chunk_text_content in chunks:
-                # Pour BGE, il est recommandé de ne pas ajouter d'instruction aux documents lors de l'indexation.
-                embedding = self.embedding_model.encode([chunk_text_content], normalize_embeddings=True)[0]
-                # La normalisation est déjà faite par normalize_embeddings=True
-                # normalized_embedding = self.normalize_embedding(embedding) # Plus besoin si normalize_embeddings=True
-                embeddings.append(embedding) # Utiliser directement l'embedding normalisé
+            filters = {
+                "departement_id": departement_id, "filiere_id": filiere_id, "module_id": module_id,
+                "activite_id": activite_id, "profile_id": profile_id, "user_id": user_id,
+            }
+            document = {"base_filename": base_filename, "file_hash": file_hash, "chunks": chunks}
+            self.plan_deduplication([document], departement_id, filiere_id)
+
+            # Pour BGE, il est recommandé de ne pas ajouter d'instruction aux documents lors de l'indexation.
+            # Seuls les chunks absents de l'index sont encodés.
+            embeddings_np = self.embed_chunks(document["to_encode"])
 
-            if not embeddings:
+            if embeddings_np.shape[0] != len(document["to_encode"]):
                 print(f"Aucun embedding n'a pu être généré pour les chunks de {base_filename}.")
                 raise ValueError(f"Échec de la génération d'embeddings pour {base_filename}.")
 
-            embeddings_np = np.array(embeddings, dtype='float32')
-            start_index = self.index.ntotal
-            self.index.add(embeddings_np)
-
-            for i, chunk_text_content in enumerate(chunks):
-                current_global_chunk_index = start_index + i
-                self.metadata.append({
-                    "file_hash": file_hash,
-                    "original_filename": base_filename,
-                    "faiss_index": current_global_chunk_index,
-                    "chunk_text": chunk_text_content,
-                    # Stocker aussi les filtres pour un accès direct si nécessaire, ou compter sur la DB
-                    "departement_id": departement_id,
-                    "filiere_id": filiere_id,
-                    "module_id": module_id,
-                    "activite_id": activite_id,
-                    "profile_id": profile_id,
-                    "user_id": user_id
-                })
-                FilterManager.insert_metadata_sqlite(
-                    base_filename=base_filename, file_hash=file_hash,
-                    chunk_index=current_global_chunk_index, chunk_text=chunk_text_content,
-                    departement_id=departement_id, filiere_id=filiere_id, module_id=module_id,
-                    activite_id=activite_id, profile_id=profile_id, user_id=user_id
-                )
-            self.save_state()
-            print(f"Fichier {base_filename} indexé. {len(chunks)} chunks ajoutés. L'index Faiss contient maintenant {self.index.ntotal} vecteurs.")
+            document["embeddings"] = embeddings_np
+            self.commit_documents([document], filters)
+            print(f"Fichier {base_filename} indexé. {len(chunks)} chunks ajoutés "
+                  f"({len(document['new_chunks'])} nouveaux vecteurs, {len(document['to_encode'])} encodés). L'index Faiss contient maintenant {self.index.ntotal} vecteurs.")
+            return file_hash
         except ValueError as ve:
             print(f"Erreur de valeur lors de l'indexation de {base_filename} : {str(ve)}")
             raise
@@ -227,44 +818,11 @@ class RAGChatbot:
         k: nombre de chunks à retourner
         lambda_param: balance entre pertinence et diversité (0.0 = diversité max, 1.0 = pertinence max)
         """
-        selected = []
-        selected_indices = []
-        candidate_indices = list(range(len(candidate_embeddings)))
-        query_embedding = query_embedding.reshape(1, -1)
-        candidate_embeddings = np.array(candidate_embeddings)
-        # Similarité entre la requête et chaque chunk
-        sim_to_query = np.dot(candidate_embeddings, query_embedding.T).flatten()
-        for _ in range(min(k, len(candidate_embeddings))):
-            if not selected:
-                idx = int(np.argmax(sim_to_query))
-                selected.append(candidate_embeddings[idx])
-                selected_indices.append(idx)
-                candidate_indices.remove(idx)
-            else:
-                max_score = -np.inf
-                max_idx = -1
-                for idx in candidate_indices:
-                    # Pertinence
-                    relevance = sim_to_query[idx]
-                    # Diversité : max similarité avec les déjà sélectionnés
-                    diversity = max([np.dot(candidate_embeddings[idx], s) for s in selected])
-                    mmr_score = lambda_param * relevance - (1 - lambda_param) * diversity
-                    if mmr_score > max_score:
-                        max_score = mmr_score
-                        max_idx = idx
-                selected.append(candidate_embeddings[max_idx])
-                selected_indices.append(max_idx)
-                candidate_indices.remove(max_idx)
-        return selected_indices
+        return MMR.select(query_embedding, candidate_embeddings, k=k, lambda_param=lambda_param)
 
     # --- Recherche de contexte avec option MMR (Maximal Marginal Relevance) ---
-    def find_relevant_context(self, user_query,
-                              departement_id=None, filiere_id=None,
-                              top_k=3, similarity_threshold=0.65, use_mmr=False, mmr_lambda=0.5):
-        """
-        Recherche les chunks les plus pertinents pour une requête utilisateur,
-        en utilisant les ID Faiss globaux filtrés et en reconstruisant les vecteurs correctement.
-        """
+    def embed_query(self, user_query):
+        """Embedding normalisé de la requête utilisateur (None en cas d'erreur)."""
         try:
             # Pour BGE, il est souvent recommandé d'ajouter une instruction aux requêtes.
             # Consultez la documentation du modèle BGE spécifique.
@@ -272,121 +830,156 @@ class RAGChatbot:
             # "Represent this sentence for searching relevant passages: "
             # Cependant, SentenceTransformer peut le gérer implicitement pour certains modèles.
             # Si vous utilisez normalize_embeddings=True, la normalisation est déjà faite.
-            query_embedding = self.embedding_model.encode([user_query], normalize_embeddings=True)[0]
-            # normalized_query = self.normalize_embedding(query_embedding).reshape(1, -1) # Plus besoin
-            normalized_query = query_embedding.reshape(1, -1)
+            return self.query_embedding_cache.get_or_compute(
+                user_query, lambda text: self.embedding_model.encode([text], normalize_embeddings=True)[0]
+            )
         except Exception as e:
             print(f"Erreur lors de la génération de l'embedding de la requête: {e}")
             traceback.print_exc()
             return None
 
-        if not hasattr(self.index, 'ntotal') or self.index.ntotal == 0:
-            print("Aucun contexte indexé dans Faiss ou l'index n'est pas correctement initialisé.")
-            return None
-
+    def _fuse_lexical(self, user_query, normalized_query, dense_ids, departement_id, filiere_id, k, min_similarity):
+        """
+        Fusionne (RRF) les IDs denses avec les k meilleurs résultats BM25 du même locataire.
+        Un résultat lexical n'est gardé que s'il reste proche de la question
+        (similarité dense >= min_similarity) : les termes rares passent, le bruit non.
+        """
         try:
-            allowed_faiss_ids = FilterManager.get_allowed_indices(
-                departement_id, filiere_id
-            )
+            lexical_ids, _ = self.lexical_index.search(user_query, departement_id, filiere_id, k)
         except Exception as e:
-            print(f"Erreur lors de la récupération des IDs autorisés depuis FilterManager: {e}")
+            print(f"Erreur lors de la recherche lexicale, résultats denses seuls : {e}")
             traceback.print_exc()
-            return None
+            return dense_ids
+        lexical_ids = VectorSearch.clip_ids(lexical_ids, self.index.ntotal)
+        if lexical_ids.shape[0] == 0:
+            return dense_ids
+        similarities = self.index.reconstruct_batch(lexical_ids) @ normalized_query.ravel()
+        lexical_ids = lexical_ids[similarities >= min_similarity]
+        return LexicalIndex.reciprocal_rank_fusion([dense_ids, lexical_ids], k=self.rrf_k)
 
-        if not allowed_faiss_ids:
-            print("Aucun chunk autorisé trouvé pour ce contexte académique et ces filtres.")
-            return None
+    def find_relevant_context(self, user_query,
+                              departement_id=None, filiere_id=None,
+                              top_k=3, similarity_threshold=0.65, use_mmr=False, mmr_lambda=0.5,
+                              query_embedding=None, candidate_pool=None, use_rerank=None):
+        """
+        Recherche les chunks les plus pertinents pour une requête utilisateur,
+        en filtrant la recherche HNSW par les ID Faiss globaux autorisés.
+        query_embedding: embedding normalisé déjà calculé pour user_query (optionnel).
+        candidate_pool: nombre de voisins demandés à Faiss (défaut : top_k * 5 avec MMR, top_k sinon).
+        use_rerank: reclasser le pool par cross-encoder (défaut : si le reranker est activé) ;
+                    prioritaire sur MMR.
+        """
+        if use_rerank is None:
+            use_rerank = self.reranker is not None
+        if use_rerank and candidate_pool is None:
+            candidate_pool = top_k * self.rerank_pool_factor
+        if query_embedding is None:
+            query_embedding = self.embed_query(user_query)
+            if query_embedding is None:
+                return None
+        normalized_query = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
 
-        allowed_faiss_ids_array = np.array(list(allowed_faiss_ids), dtype='int64')
-        valid_ids_for_reconstruction = np.array(
-            [fid for fid in allowed_faiss_ids_array if 0 <= fid < self.index.ntotal],
-            dtype='int64'
-        )
+        # Lecture cohérente de l'état de recherche : aucun ajout ni publication pendant la recherche
+        with self._search_lock.read():
+            if not hasattr(self.index, 'ntotal') or self.index.ntotal == 0:
+                print("Aucun contexte indexé dans Faiss ou l'index n'est pas correctement initialisé.")
+                return None
 
-        if len(valid_ids_for_reconstruction) == 0:
-            print("Aucun ID Faiss autorisé n'est actuellement valide dans l'index principal.")
-            return None
+            k_search = candidate_pool or (top_k * 5 if use_mmr else top_k)
+            if self.shards is not None:
+                # Recherche limitée aux partitions du locataire, fusion des top-k.
+                # Les partitions contiennent encore les chunks supprimés : marge pour les écarter.
+                try:
+                    distances, candidate_faiss_ids = self.shards.search(
+                        normalized_query, k_search + min(len(self.tombstones), k_search), departement_id, filiere_id
+                    )
+                except Exception as e:
+                    print(f"Erreur lors de la recherche dans les index partitionnés: {e}")
+                    traceback.print_exc()
+                    return None
+            else:
+                try:
+                    allowed_faiss_ids = FilterManager.get_allowed_indices(
+                        departement_id, filiere_id
+                    )
+                except Exception as e:
+                    print(f"Erreur lors de la récupération des IDs autorisés depuis FilterManager: {e}")
+                    traceback.print_exc()
+                    return None
 
-        sub_vectors_list = []
-        try:
-            # Pour IndexHNSWFlat, les vecteurs sont dans 'storage' qui est un IndexFlat.
-            # Si self.index.storage n'existe pas ou est None, il y a un problème avec l'init de l'index HNSW.
-            if not hasattr(self.index, 'storage') or self.index.storage is None:
-                 print("L'index HNSW ne semble pas avoir de 'storage' valide pour la reconstruction.")
-                 return None
-            
-            reconstruction_source = self.index.storage
-            for vector_id in valid_ids_for_reconstruction:
-                reconstructed_vec = reconstruction_source.reconstruct(int(vector_id))
-                sub_vectors_list.append(reconstructed_vec)
+                if len(allowed_faiss_ids) == 0:
+                    print("Aucun chunk autorisé trouvé pour ce contexte académique et ces filtres.")
+                    return None
 
-            if not sub_vectors_list:
-                print("La liste des vecteurs reconstruits est vide.")
-                return None
-            sub_vectors = np.array(sub_vectors_list, dtype='float32')
+                valid_allowed_ids = VectorSearch.clip_ids(allowed_faiss_ids, self.index.ntotal)
+                if len(valid_allowed_ids) == 0:
+                    print("Aucun ID Faiss autorisé n'est actuellement valide dans l'index principal.")
+                    return None
 
-        except AttributeError as ae:
-            print(f"Erreur d'attribut lors de la reconstruction (vérifiez type d'index): {ae}")
-            traceback.print_exc()
-            return None
-        except Exception as e:
-            print(f"Erreur inattendue lors de la reconstruction des vecteurs: {e}")
-            traceback.print_exc()
-            return None
+                try:
+                    # Recherche directement dans l'index HNSW principal, filtrée par un IDSelector
+                    # (plus de reconstruction d'un sous-index à chaque requête).
+                    distances, candidate_faiss_ids = VectorSearch.search_filtered(
+                        self.index, normalized_query, valid_allowed_ids, k_search, ef_search=self.efSearch
+                    )
+                except Exception as e:
+                    print(f"Erreur lors de la recherche filtrée dans l'index Faiss: {e}")
+                    traceback.print_exc()
+                    return None
 
-        if sub_vectors.shape[0] == 0:
-            print("Aucun vecteur n'a pu être reconstruit (shape[0] est 0).")
-            return None
+            if len(candidate_faiss_ids) == 0:
+                print("La recherche filtrée n'a retourné aucun résultat.")
+                return None
 
-        try:
-            # Le sous-index doit utiliser la même métrique que l'index principal si on compare les scores
-            # Si l'index HNSW utilise METRIC_INNER_PRODUCT, le sous-index aussi.
-            sub_index = faiss.IndexFlatIP(self.dimension)
-            sub_index.add(sub_vectors)
-        except Exception as e:
-            print(f"Erreur lors de la création/ajout au sous-index Faiss: {e}")
-            traceback.print_exc()
-            return None
+            # Un seul masque NumPy sur les résultats (déjà triés par score décroissant) :
+            # IDs valides et similarité au-dessus du seuil.
+            keep = (candidate_faiss_ids >= 0) & (distances >= similarity_threshold)
+            if len(self.tombstones):
+                keep &= ~np.isin(candidate_faiss_ids, self.tombstones)
+            candidate_faiss_ids = candidate_faiss_ids[keep][:k_search]
+            if self.lexical_index is not None:
+                # Les résultats lexicaux ont leur propre seuil, plus bas que celui des résultats denses :
+                # ils ont justement vocation à rattraper les termes rares sous ce seuil
+                candidate_faiss_ids = self._fuse_lexical(
+                    user_query, normalized_query, candidate_faiss_ids, departement_id, filiere_id, k_search,
+                    self.hybrid_min_similarity
+                )
 
-        try:
-            k_search = min(top_k * 5 if use_mmr else top_k, sub_index.ntotal)
-            if k_search == 0:
-                print("Le sous-index est vide, impossible de rechercher.")
-                return None
-            distances, local_indices_in_sub = sub_index.search(normalized_query, k_search)
-        except Exception as e:
-            print(f"Erreur lors de la recherche sur le sous-index Faiss: {e}")
-            traceback.print_exc()
-            return None
+            selected_faiss_ids = None
+            if use_rerank and candidate_faiss_ids.shape[0] > 0:
+                try:
+                    # Seuls les premiers candidats qui tiennent dans le budget de latence sont reclassés.
+                    pool_ids = candidate_faiss_ids[:self.reranker.budgeted_size(candidate_faiss_ids.shape[0])]
+                    pool_texts = [self.metadata.get_text(i) or "" for i in pool_ids.tolist()]
+                    order, _ = self.reranker.rerank(user_query, pool_texts, top_k)
+                    selected_faiss_ids = pool_ids[order]
+                    print(f"Debug: {len(pool_ids)} candidats reclassés en {self.reranker.last_latency_ms:.1f} ms")
+                except Exception as e:
+                    print(f"Erreur lors du reranking, ordre dense conservé : {e}")
+                    traceback.print_exc()
 
-        # Récupérer les embeddings des candidats pour MMR
-        candidate_embeddings = [sub_vectors[i] for i in local_indices_in_sub[0] if i >= 0 and distances[0][list(local_indices_in_sub[0]).index(i)] >= similarity_threshold]
-        candidate_indices = [i for i in local_indices_in_sub[0] if i >= 0 and distances[0][list(local_indices_in_sub[0]).index(i)] >= similarity_threshold]
+            if selected_faiss_ids is None:
+                if use_mmr and candidate_faiss_ids.shape[0] > 0:
+                    # Embeddings des candidats pour MMR
+                    candidate_embeddings = self.index.reconstruct_batch(candidate_faiss_ids)
+                    mmr_indices = self.mmr(normalized_query.flatten(), candidate_embeddings, k=top_k, lambda_param=mmr_lambda)
+                    selected_faiss_ids = candidate_faiss_ids[mmr_indices]
+                else:
+                    selected_faiss_ids = candidate_faiss_ids[:top_k]
 
-        if use_mmr and candidate_embeddings:
-            mmr_indices = self.mmr(normalized_query.flatten(), candidate_embeddings, k=top_k, lambda_param=mmr_lambda)
-            selected_indices = [candidate_indices[i] for i in mmr_indices]
-        else:
-            selected_indices = candidate_indices[:top_k]
-
-        relevant_chunks_texts = []
-        for i in selected_indices:
-            global_faiss_id = valid_ids_for_reconstruction[i]
-            chunk_data = None
-            for meta_item in self.metadata:
-                if meta_item.get("faiss_index") == global_faiss_id:
-                    chunk_data = meta_item
-                    break
-            if chunk_data and 'chunk_text' in chunk_data:
-                relevant_chunks_texts.append(chunk_data['chunk_text'])
-                print(f"Debug: Chunk pertinent trouvé: ID={global_faiss_id}")
-            else:
-                print(f"Attention : Métadonnées ou texte du chunk introuvables pour l'ID Faiss global {global_faiss_id}")
+            relevant_chunks_texts = []
+            for global_faiss_id in selected_faiss_ids.tolist():
+                chunk_text = self.metadata.get_text(global_faiss_id)
+                if chunk_text is not None:
+                    relevant_chunks_texts.append(chunk_text)
+                    print(f"Debug: Chunk pertinent trouvé: ID={global_faiss_id}")
+                else:
+                    print(f"Attention : Métadonnées ou texte du chunk introuvables pour l'ID Faiss global {global_faiss_id}")
 
-        if not relevant_chunks_texts:
-            print("Aucun chunk pertinent trouvé (seuil de similarité non atteint ou problème de métadonnées).")
-            return None
-        return relevant_chunks_texts
+            if not relevant_chunks_texts:
+                print("Aucun chunk pertinent trouvé (seuil de similarité non atteint ou problème de métadonnées).")
+                return None
+            return relevant_chunks_texts
 
     # ... (autres méthodes : clean_llm_response, generate_response, etc. restent inchangées) ...
     def clean_llm_response(self, response: str) -> str:
@@ -401,23 +994,32 @@ class RAGChatbot:
     
     SQLITE_DB_PATH = "./bdd/chatbot_metadata.db"
     
-    def generate_response(self, user_query, user_id, profile_id, departement_id, filiere_id, use_mmr=False):
-        INVITE_PROFILE_ID = 5
+    INVITE_PROFILE_ID = 5
+
+    def resolve_tenant(self, profile_id, departement_id, filiere_id):
+        """Le mode invité force le département Scolarité. Retourne (departement_id, filiere_id, is_invite)."""
+        if profile_id == self.INVITE_PROFILE_ID:
+            return 1, 3, True
+        return departement_id, filiere_id, False
 
-        is_invite = (profile_id == INVITE_PROFILE_ID)
-        if is_invite:
-            departement_id = 1
-            filiere_id = 3
+    def build_prompt(self, user_query, profile_id, departement_id, filiere_id, use_mmr=False, query_embedding=None):
+        """
+        Recherche le contexte et construit le prompt envoyé au LLM.
+        Retourne (prompt_text, departement_id, filiere_id) : le mode invité force le département Scolarité.
+        """
+        departement_id, filiere_id, is_invite = self.resolve_tenant(profile_id, departement_id, filiere_id)
 
         context_chunks = self.find_relevant_context(
-            user_query, departement_id, filiere_id, top_k=3, similarity_threshold=0.65, use_mmr=use_mmr
+            user_query, departement_id, filiere_id, top_k=3, similarity_threshold=0.65, use_mmr=use_mmr,
+            query_embedding=query_embedding
         )
 
         if context_chunks:
             context_text = "\n".join(context_chunks)
-            if PromptBuilder.is_qcm_request(user_query):
+            prompt_type = PromptBuilder.get_prompt_type(user_query)
+            if prompt_type == "qcm":
                 prompt_text = PromptBuilder.build_qcm_prompt(context_text, user_query)
-            elif "résumé" in user_query.lower() or "synthèse" in user_query.lower():
+            elif prompt_type == "summary":
                 prompt_text = PromptBuilder.build_summary_prompt(context_text, user_query)
             else:
                 prompt_text = PromptBuilder.build_standard_prompt(context_text, user_query)
@@ -448,8 +1050,53 @@ class RAGChatbot:
                 "Réponds que tu n'as pas d'informations pertinentes pour cette question."
             )
 
-        llm_raw_response = self.ollama_api.chat_with_ollama(prompt_text)
-        cleaned_llm_response = self.clean_llm_response(llm_raw_response)
+        return prompt_text, departement_id, filiere_id
+
+    # --- Cache sémantique des réponses ---
+    def _response_cache_lookup(self, user_query, profile_id, departement_id, filiere_id):
+        """
+        Calcule l'embedding de la question et interroge le cache sémantique.
+        Retourne (cache_entry, query_embedding, réponse en cache ou None) ;
+        cache_entry est à repasser à _response_cache_store après génération.
+        """
+        query_embedding = self.embed_query(user_query)
+        if self.response_cache is None or query_embedding is None:
+            return None, query_embedding, None
+        departement_id, filiere_id, is_invite = self.resolve_tenant(profile_id, departement_id, filiere_id)
+        # Le prompt invité diffère du prompt standard : clé distincte.
+        prompt_type = ("invite_" if is_invite else "") + PromptBuilder.get_prompt_type(user_query)
+        # Les nombres de la question font partie de la clé : « 5 QCM » et « 10 QCM » ont des
+        # embeddings presque identiques mais ne partagent pas de réponse.
+        numbers = re.findall(r"\d+", user_query)
+        if numbers:
+            prompt_type += "#" + ",".join(numbers)
+        cache_key = (departement_id, filiere_id, prompt_type)
+        cache_entry = (cache_key, self.response_cache.generation(departement_id, filiere_id))
+        return cache_entry, query_embedding, self.response_cache.lookup(query_embedding, *cache_key)
+
+    def _response_cache_store(self, cache_entry, query_embedding, answer, complete=True):
+        # Les erreurs du LLM et les réponses streamées incomplètes ne sont jamais mises en cache.
+        if cache_entry is None or not complete or not answer or answer.startswith("Error"):
+            return
+        cache_key, generation = cache_entry
+        self.response_cache.store(query_embedding, *cache_key, answer, generation=generation)
+
+    def generate_response(self, user_query, user_id, profile_id, departement_id, filiere_id, use_mmr=False):
+        cache_entry, query_embedding, cached_response = self._response_cache_lookup(
+            user_query, profile_id, departement_id, filiere_id
+        )
+        if cached_response is not None:
+            print("Réponse servie depuis le cache sémantique.")
+            cleaned_llm_response = cached_response
+            departement_id, filiere_id, _ = self.resolve_tenant(profile_id, departement_id, filiere_id)
+        else:
+            prompt_text, departement_id, filiere_id = self.build_prompt(
+                user_query, profile_id, departement_id, filiere_id, use_mmr=use_mmr, query_embedding=query_embedding
+            )
+
+            llm_raw_response = self.ollama_api.chat_with_ollama(prompt_text)
+            cleaned_llm_response = self.clean_llm_response(llm_raw_response)
+            self._response_cache_store(cache_entry, query_embedding, cleaned_llm_response)
 
         chat_id = FilterManager.save_chat_history(
             user_id=user_id,
@@ -463,6 +1110,51 @@ class RAGChatbot:
 
         return cleaned_llm_response, chat_id
 
+    async def generate_response_stream(self, user_query, user_id, profile_id, departement_id, filiere_id, use_mmr=False):
+        """
+        Version streamée de generate_response.
+        Produit des événements {"type": "token", "content": ...} au fil de la génération,
+        puis {"type": "done", "response": ..., "chat_id": ...} une fois l'historique enregistré.
+        """
+        # Embedding, cache et recherche (CPU, bloquants) hors de la boucle asyncio
+        cache_entry, query_embedding, cached_response = await asyncio.to_thread(
+            self._response_cache_lookup, user_query, profile_id, departement_id, filiere_id
+        )
+        if cached_response is not None:
+            print("Réponse servie depuis le cache sémantique.")
+            cleaned_llm_response = cached_response
+            departement_id, filiere_id, _ = self.resolve_tenant(profile_id, departement_id, filiere_id)
+            yield {"type": "token", "content": cached_response}
+        else:
+            prompt_text, departement_id, filiere_id = await asyncio.to_thread(
+                self.build_prompt, user_query, profile_id, departement_id, filiere_id, use_mmr, query_embedding
+            )
+
+            tokens = []
+            stream_status = {}
+            async for token in self.ollama_api.astream_chat(prompt_text, status=stream_status):
+                tokens.append(token)
+                yield {"type": "token", "content": token}
+
+            cleaned_llm_response = self.clean_llm_response("".join(tokens))
+            # Flux interrompu (erreur après des tokens) : la réponse partielle n'est pas mise en cache.
+            # Un client déconnecté ferme ce générateur avant cette ligne.
+            self._response_cache_store(
+                cache_entry, query_embedding, cleaned_llm_response, complete=stream_status.get("complete", False)
+            )
+
+        chat_id = await asyncio.to_thread(
+            FilterManager.save_chat_history,
+            user_id=user_id,
+            question=user_query,
+            answer=cleaned_llm_response,
+            departement_id=departement_id,
+            filiere_id=filiere_id,
+            profile_id=profile_id,
+            db_path=self.SQLITE_DB_PATH
+        )
+        yield {"type": "done", "response": cleaned_llm_response, "chat_id": chat_id}
+
     # def generate_response(self, user_query,user_id,profile_id, departement_id, filiere_id):
     #     # Appelle votre méthode pour trouver le contexte pertinent
     #     context_chunks = self.find_relevant_context(
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests de la sélection des candidats de RAGChatbot.find_relevant_context (masque NumPy unique) :
+ordre par score, seuil de similarité, pool de candidats, filtre du locataire, MMR et chunks supprimés.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def lettered(label, n_words):
+    # Sans chiffres : le nettoyage des textes les supprime
+    return " ".join(f"{label}{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(n_words))
+
+
+def ingest(chatbot, labels, departement_id, filiere_id):
+    return {label: chatbot.ingestion_file(f"{label}.txt", lettered(label, 12).encode('utf-8'),
+                                          departement_id, filiere_id, None, None, None, None)
+            for label in labels}
+
+
+def vector_of(chatbot, label):
+    """Vecteur indexé du chunk (unique) du document `label`."""
+    for faiss_id in range(len(chatbot.metadata)):
+        if chatbot.metadata.get_text(faiss_id).startswith(label):
+            return chatbot.index.reconstruct(faiss_id)
+    raise KeyError(label)
+
+
+def make_query(chatbot, weights):
+    query = sum(weight * vector_of(chatbot, label) for label, weight in weights.items())
+    return query / np.linalg.norm(query)
+
+
+def labels_of(texts):
+    return [text.split()[0][:-2] for text in texts] if texts else texts
+
+
+def test_candidates_follow_score_order_and_threshold(make_chatbot):
+    chatbot = make_chatbot()
+    ingest(chatbot, ["alpha", "beta", "gamma", "delta", "epsilon", "zeta"], 1, 2)
+    ingest(chatbot, ["intrus"], 1, 3)
+    query = make_query(chatbot, {"alpha": 1.0, "beta": 0.8, "gamma": 0.6, "delta": 0.5, "intrus": 1.2})
+
+    def search(**kwargs):
+        options = {"top_k": 3, "similarity_threshold": 0.2, "query_embedding": query}
+        options.update(kwargs)
+        return labels_of(chatbot.find_relevant_context("question", 1, 2, **options))
+
+    assert search() == ["alpha", "beta", "gamma"]
+    assert search(top_k=10, candidate_pool=10) == ["alpha", "beta", "gamma", "delta"]
+    assert search(similarity_threshold=0.37) == ["alpha", "beta"]
+    assert search(similarity_threshold=0.99) is None
+    # Sans filtre de filière, le document de l'autre locataire passe en tête
+    assert labels_of(chatbot.find_relevant_context("question", 1, None, top_k=2, similarity_threshold=0.2,
+                                                   query_embedding=query)) == ["intrus", "alpha"]
+    # MMR : top_k textes distincts choisis dans le pool au-dessus du seuil
+    selected = search(use_mmr=True, top_k=3)
+    assert len(set(selected)) == 3 and set(selected) <= {"alpha", "beta", "gamma", "delta"}
+
+
+def test_deleted_chunks_are_masked_out(make_chatbot):
+    chatbot = make_chatbot()
+    hashes = ingest(chatbot, ["alpha", "beta", "gamma", "delta"], 1, 2)
+    query = make_query(chatbot, {"alpha": 1.0, "beta": 0.8, "gamma": 0.6})
+    chatbot.delete_document(hashes["alpha"])
+    assert labels_of(chatbot.find_relevant_context("question", 1, 2, top_k=3, similarity_threshold=0.2,
+                                                   query_embedding=query)) == ["beta", "gamma"]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests de RAGChatbot.generate_response_stream (source des événements SSE de /chat/stream) :
+tokens relayés dans l'ordre, événement final après l'enregistrement de l'historique, erreur
+du LLM en cours de flux et client déconnecté avant la fin.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import sqlite3
+
+import httpx
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FailingGroq:
+    async def astream(self, prompt):
+        raise RuntimeError("Groq indisponible")
+        yield
+
+
+def ndjson_body(tokens, error=None):
+    async def body():
+        for token in tokens:
+            yield (json.dumps({"response": token, "done": False}) + "\n").encode('utf-8')
+        if error is not None:
+            raise error
+        yield (json.dumps({"response": "", "done": True}) + "\n").encode('utf-8')
+    return body()
+
+
+@pytest.fixture
+def make_streaming_chatbot(make_chatbot, monkeypatch):
+    import ollama_api
+
+    monkeypatch.setattr(ollama_api, "ChatGroq", lambda **kwargs: FailingGroq())
+
+    def make(tokens, error=None, **kwargs):
+        chatbot = make_chatbot(**kwargs)
+        chatbot.ollama_api = ollama_api.OllamaAPI(api_url="http://ollama.test/api/generate")
+        chatbot.stream_body = lambda: ndjson_body(tokens, error)
+        return chatbot
+    return make
+
+
+def run_stream(chatbot, query="Qu'est-ce qu'un graphe ?", stop_after=None):
+    async def run():
+        pool = chatbot.ollama_api.pool
+        pool._async_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=chatbot.stream_body()))
+        )
+        pool._async_semaphore = asyncio.Semaphore(pool.max_concurrency)
+        events = []
+        stream = chatbot.generate_response_stream(query, 42, 1, 1, 2)
+        async for event in stream:
+            events.append(event)
+            if stop_after is not None and len(events) == stop_after:
+                await stream.aclose()  # client déconnecté
+                break
+        await chatbot.ollama_api.aclose()
+        return events
+    return asyncio.run(run())
+
+
+def history(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT user_id, question, answer, departement_id, filiere_id FROM chat_history").fetchall()
+    conn.close()
+    return rows
+
+
+def test_tokens_then_done_event(make_streaming_chatbot, make_chatbot):
+    chatbot = make_streaming_chatbot(["<think>brouillon</think>", "Un graphe", " est un ensemble."])
+    events = run_stream(chatbot)
+    assert [event["type"] for event in events] == ["token", "token", "token", "done"]
+    assert "".join(event["content"] for event in events[:-1]) == \
+        "<think>brouillon</think>Un graphe est un ensemble."
+    done = events[-1]
+    assert done["response"] == "Un graphe est un ensemble."
+    assert history(make_chatbot.db_path) == [(42, "Qu'est-ce qu'un graphe ?", done["response"], 1, 2)]
+    assert done["chat_id"] is not None
+
+
+def test_error_mid_stream_ends_with_partial_answer(make_streaming_chatbot, make_chatbot):
+    chatbot = make_streaming_chatbot(["Un graphe"], error=httpx.ReadError("connexion perdue"),
+                                     use_response_cache=True)
+    events = run_stream(chatbot)
+    assert events[0] == {"type": "token", "content": "Un graphe"}
+    assert events[1]["type"] == "token" and events[1]["content"].startswith("Error:")
+    assert events[-1]["type"] == "done" and events[-1]["response"].startswith("Un graphe")
+    assert len(history(make_chatbot.db_path)) == 1
+    assert chatbot.response_cache.stats()["entries"] == 0  # réponse partielle jamais mise en cache
+
+
+def test_disconnected_client_does_not_save_history(make_streaming_chatbot, make_chatbot):
+    chatbot = make_streaming_chatbot(["Un", " graphe", " est", " un ensemble."])
+    events = run_stream(chatbot, stop_after=1)
+    assert events == [{"type": "token", "content": "Un"}]
+    assert history(make_chatbot.db_path) == []
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests de l'index de déduplication des chunks (ChunkDedupIndex) : doublons exacts et
+quasi-doublons (MinHash/LSH), doublons internes au lot, locataires séparés et
+rechargement des empreintes depuis SQLite, document entièrement dédupliqué sur un store
+rouvert en mémoire projetée, remplacement d'un document par une version quasi identique.
+"""
+
+import os
+import sys
+import sqlite3
+
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.chunk_dedup import ChunkDedupIndex
+from Utilitaire.chunk_store import ChunkStore
+
+
+def words(label, n_words):
+    return " ".join(f"{label}{i}" for i in range(n_words))
+
+
+def lettered(label, n_words):
+    # Sans chiffres : le nettoyage des textes les supprime
+    return " ".join(f"{label}{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(n_words))
+
+
+def make_db(tmp_path, rows=()):
+    db_path = str(tmp_path / "metadata.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE document_metadata (id INTEGER PRIMARY KEY, chunk_index INTEGER, chunk_text TEXT, "
+                 "departement_id INTEGER, filiere_id INTEGER)")
+    conn.executemany("INSERT INTO document_metadata (chunk_index, chunk_text, departement_id, filiere_id) "
+                     "VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_existing_chunks_are_reused(tmp_path):
+    db_path = make_db(tmp_path, [(0, words("a", 60), 1, 2), (1, words("b", 60), 1, 2)])
+    dedup = ChunkDedupIndex(db_path)
+    near = words("b", 60).replace("b59", "autre")
+    documents = [{"chunks": [words("a", 60), near, words("c", 60)]}]
+    assert dedup.plan(documents, 1, 2) == (1, 1)
+    # Le quasi-doublon garde son texte et un nouvel ID, mais recopie le vecteur du chunk 1
+    assert documents[0]["reuse"].tolist() == [0, -1, -1]
+    assert documents[0]["new_chunks"] == [near, words("c", 60)]
+    assert documents[0]["vector_sources"].tolist() == [1, -1]
+    assert documents[0]["to_encode"] == [words("c", 60)]
+    # Un autre locataire ne réutilise pas les vecteurs
+    other = [{"chunks": [words("a", 60)]}]
+    assert dedup.plan(other, 1, 3) == (0, 0)
+    assert other[0]["reuse"].tolist() == [-1]
+
+
+def test_duplicates_inside_batch_point_to_new_chunk(tmp_path):
+    dedup = ChunkDedupIndex(make_db(tmp_path))
+    documents = [{"chunks": [words("x", 40), words("y", 40)]}, {"chunks": [words("y", 40), "court"]}]
+    assert dedup.plan(documents) == (1, 0)
+    # -(p + 2) : p-ième nouveau chunk du lot
+    assert documents[1]["reuse"].tolist() == [-3, -1]
+    assert documents[1]["new_chunks"] == ["court"]
+
+
+def test_inserted_fingerprints_survive_reload(tmp_path):
+    db_path = make_db(tmp_path)
+    dedup = ChunkDedupIndex(db_path)
+    documents = [{"chunks": [words("x", 40)]}]
+    dedup.plan(documents, 1, 2)
+    conn = sqlite3.connect(db_path)
+    dedup.insert(conn, [7], documents[0]["fingerprints"], 1, 2)
+    conn.commit()
+    conn.close()
+    reloaded = [{"chunks": [words("x", 40)]}]
+    assert ChunkDedupIndex(db_path).plan(reloaded, 1, 2) == (1, 0)
+    assert reloaded[0]["reuse"].tolist() == [7]
+
+
+def test_empty_append_on_mapped_store(tmp_path):
+    store = ChunkStore()
+    store.append_chunks("hA", "a.txt", ["a0", "a1"], departement_id=1, filiere_id=2)
+    store.save_dir(str(tmp_path / "chunks"))
+    mapped = ChunkStore.open_dir(str(tmp_path / "chunks"), mmap=True)
+    assert mapped.append_chunks("hB", "b.txt", []) == 2
+    assert mapped.append_chunks("hC", "c.txt", ["c0"], departement_id=1, filiere_id=2) == 2
+    assert [mapped.get_text(i) for i in range(3)] == ["a0", "a1", "c0"]
+
+
+def test_fully_deduplicated_document_after_restart(make_chatbot):
+    content = "\n\n".join(words(label, 60) for label in ("alpha", "beta", "gamma")).encode('utf-8')
+    chatbot = make_chatbot(use_hybrid_search=False)
+    first_hash = chatbot.ingestion_file("a.txt", content, 1, 2, None, None, None, None)
+    chatbot.compact_state()
+    ntotal = chatbot.index.ntotal
+
+    # Redémarrage sur le snapshot projeté en mémoire, puis copie ne différant que par des chiffres
+    chatbot = make_chatbot(use_hybrid_search=False)
+    copy_hash = chatbot.ingestion_file("copie.txt", content + b" 2024", 1, 2, None, None, None, None)
+    assert copy_hash != first_hash and chatbot.index.ntotal == ntotal and len(chatbot.metadata) == ntotal
+
+    restarted = make_chatbot(use_hybrid_search=False)
+    assert restarted.index.ntotal == ntotal and len(restarted.metadata) == ntotal
+    assert {first_hash, copy_hash} <= restarted.file_processor.processed_hashes
+
+
+def test_near_duplicate_replacement_keeps_new_text(make_chatbot):
+    chatbot = make_chatbot(use_hybrid_search=False)
+    text = lettered("cours", 30) + " examen lundi " + lettered("salle", 30)
+    old_hash = chatbot.ingestion_file("edt.txt", text.encode('utf-8'), 1, 2, None, None, None, None)
+    encoded = chatbot.embedding_model.encoded
+
+    deleted = chatbot.replace_document(
+        old_hash, "edt.txt", text.replace("lundi", "mardi").encode('utf-8'), 1, 2, None, None, None, None
+    )
+    assert chatbot.embedding_model.encoded == encoded  # vecteur recopié, pas d'encodage
+    assert deleted["vectors_removed"] == 1
+    live = np.setdiff1d(np.arange(len(chatbot.metadata)), chatbot.tombstones)
+    texts = " ".join(chatbot.metadata.get_text(int(faiss_id)) for faiss_id in live)
+    assert "mardi" in texts and "lundi" not in texts
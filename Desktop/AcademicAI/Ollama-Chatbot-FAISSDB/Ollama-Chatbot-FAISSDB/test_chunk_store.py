@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests du stockage colonnaire des chunks (ChunkStore) : accès par ID Faiss, filtres par locataire,
+persistance par générations (mmap ou non), ajout après ouverture projetée et migration.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.chunk_store import ChunkStore
+
+
+def make_store(capacity=2):
+    store = ChunkStore(capacity=capacity)
+    assert store.append_chunks("h1", "cours.pdf", ["Théorème de Gödel", "fin"], departement_id=1, filiere_id=2) == 0
+    assert store.append_chunks("h2", "td.docx", ["exercice", "", "corrigé ✓"], departement_id=1, user_id=7) == 2
+    assert store.append_chunks("h1", "cours.pdf", ["annexe"], departement_id=1, filiere_id=2) == 5
+    return store
+
+
+def assert_contents(store):
+    assert len(store) == 6
+    assert [store.get_text(i) for i in range(6)] == ["Théorème de Gödel", "fin", "exercice", "", "corrigé ✓", "annexe"]
+    assert store.get_text(6) is None and store.get_record(-1) is None
+    assert store.get_record(3) == {
+        "file_hash": "h2", "original_filename": "td.docx", "faiss_index": 3, "chunk_text": "",
+        "departement_id": 1, "filiere_id": None, "module_id": None, "activite_id": None,
+        "profile_id": None, "user_id": 7,
+    }
+    assert store.get_record(5)["file_hash"] == "h1"
+    assert store.ids_for_tenant(1, 2).tolist() == [0, 1, 5]
+    assert store.ids_for_tenant(1, None).tolist() == [2, 3, 4]
+    assert store.tenant_keys() == [(1, 2), (1, 2), (1, None), (1, None), (1, None), (1, 2)]
+
+
+def test_append_grows_and_reads_by_faiss_id():
+    store = make_store()
+    assert_contents(store)
+    assert store.documents == [("h1", "cours.pdf"), ("h2", "td.docx")]
+    column = store.column("user_id")
+    assert column.tolist() == [-1, -1, 7, 7, 7, -1]
+    with pytest.raises(ValueError):
+        column[0] = 1
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_open_round_trip(tmp_path, mmap):
+    directory = str(tmp_path / "chunks")
+    make_store().save_dir(directory)
+    store = ChunkStore.open_dir(directory, mmap=mmap)
+    assert isinstance(store._document_ids, np.memmap) == mmap
+    assert_contents(store)
+
+    # Premier ajout sur un store projeté : copie en mémoire, fichiers inchangés
+    assert store.append_chunks("h3", "tp.txt", ["graphe"], filiere_id=4) == 6
+    assert store.get_text(6) == "graphe" and store.get_text(0) == "Théorème de Gödel"
+    assert len(ChunkStore.open_dir(directory, mmap=mmap)) == 6
+
+    store.save_dir(directory)
+    assert sorted(entry for entry in os.listdir(directory) if entry.startswith("gen-")) == ["gen-00000001"]
+    reopened = ChunkStore.open_dir(directory, mmap=mmap)
+    assert len(reopened) == 7 and reopened.get_record(6)["filiere_id"] == 4
+
+
+def test_empty_store_round_trip(tmp_path):
+    directory = str(tmp_path / "chunks")
+    assert not ChunkStore.exists_dir(directory)
+    ChunkStore().save_dir(directory)
+    assert ChunkStore.exists_dir(directory)
+    store = ChunkStore.open_dir(directory)
+    assert len(store) == 0 and store.get_text(0) is None
+    assert store.append_chunks("h", "a.txt", ["a"]) == 0
+
+
+def test_state_and_records_migration():
+    store = make_store()
+    assert_contents(ChunkStore.from_state(store.to_state()))
+    assert_contents(ChunkStore.from_records(list(reversed(list(store)))))
+    with pytest.raises(ValueError):
+        ChunkStore.from_records([{"faiss_index": 1, "chunk_text": "trou"}])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests d'atomicité de RAGChatbot.commit_documents : une erreur au milieu du commit d'un lot
+laisse SQLite (métadonnées et empreintes de déduplication), l'index Faiss, le ChunkStore
+et le journal d'ingestion inchangés ; un crash entre l'écriture du journal et la validation
+SQLite ne laisse pas de document fantôme au redémarrage.
+"""
+
+import os
+import sys
+import sqlite3
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def lettered(label, n_words):
+    return " ".join(f"{label}{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(n_words))
+
+
+def prepare(chatbot, names, departement_id=1, filiere_id=2):
+    documents = [{"base_filename": f"{name}.txt", "file_hash": f"hash-{name}", "chunks": [lettered(name, 40)]}
+                 for name in names]
+    chatbot.plan_deduplication(documents, departement_id, filiere_id)
+    for document in documents:
+        document["embeddings"] = chatbot.embed_chunks(document["to_encode"])
+    return documents
+
+
+def snapshot(chatbot, db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT file_hash, chunk_index FROM document_metadata ORDER BY id").fetchall()
+    rows += conn.execute("SELECT chunk_hash, faiss_id FROM chunk_fingerprints ORDER BY faiss_id").fetchall()
+    conn.close()
+    return {
+        "rows": rows,
+        "vectors": chatbot.index.reconstruct_n(0, chatbot.index.ntotal),
+        "chunks": [chatbot.metadata.get_text(i) for i in range(len(chatbot.metadata))],
+        "log_bytes": chatbot.ingestion_log.size_bytes(),
+    }
+
+
+def assert_same(before, after):
+    assert after["rows"] == before["rows"]
+    assert np.array_equal(after["vectors"], before["vectors"])
+    assert after["chunks"] == before["chunks"]
+    assert after["log_bytes"] == before["log_bytes"]
+
+
+def test_failure_mid_commit_leaves_state_unchanged(make_chatbot, monkeypatch):
+    filters = {"departement_id": 1, "filiere_id": 2}
+    chatbot = make_chatbot()
+    chatbot.commit_documents(prepare(chatbot, ["socle"]), filters)
+    chatbot.compact_state()
+    chatbot.commit_documents(prepare(chatbot, ["journal"]), filters)  # trame rejouée au rollback
+    before = snapshot(chatbot, make_chatbot.db_path)
+
+    # La deuxième trame du lot échoue : la première est déjà écrite, l'index déjà modifié
+    append = chatbot.ingestion_log.append
+    calls = []
+
+    def failing_append(record, vectors):
+        calls.append(record["file_hash"])
+        if len(calls) == 2:
+            raise OSError("disque plein")
+        return append(record, vectors)
+
+    monkeypatch.setattr(chatbot.ingestion_log, "append", failing_append)
+    with pytest.raises(OSError):
+        chatbot.commit_documents(prepare(chatbot, ["alpha", "beta"]), filters)
+
+    assert_same(before, snapshot(chatbot, make_chatbot.db_path))
+    assert not {"hash-alpha", "hash-beta"} & chatbot.file_processor.processed_hashes
+    # Le redémarrage retrouve le même état (journal tronqué à la dernière trame valide)
+    assert_same(before, snapshot(make_chatbot(), make_chatbot.db_path))
+
+
+class Crash(BaseException):
+    """Arrêt brutal du processus : aucun bloc `except Exception` ne s'exécute."""
+
+
+def test_crash_after_log_append_is_not_replayed(make_chatbot, monkeypatch):
+    filters = {"departement_id": 1, "filiere_id": 2}
+    chatbot = make_chatbot(deletion_compaction_ratio=1.0)
+    chatbot.commit_documents(prepare(chatbot, ["socle", "garde"]), filters)
+    chatbot.delete_document("hash-socle")  # trame conservée, lignes SQLite effacées
+    before = snapshot(chatbot, make_chatbot.db_path)
+
+    # Crash après l'écriture (fsync) des deux trames, avant la validation SQLite
+    append = chatbot.ingestion_log.append
+    calls = []
+
+    def crashing_append(record, vectors):
+        offset = append(record, vectors)
+        calls.append(record["file_hash"])
+        if len(calls) == 2:
+            raise Crash()
+        return offset
+
+    monkeypatch.setattr(chatbot.ingestion_log, "append", crashing_append)
+    with pytest.raises(Crash):
+        chatbot.commit_documents(prepare(chatbot, ["alpha", "beta"]), filters)
+    assert chatbot.ingestion_log.size_bytes() > before["log_bytes"]
+
+    restarted = make_chatbot(deletion_compaction_ratio=1.0)
+    assert_same(before, snapshot(restarted, make_chatbot.db_path))
+    assert "hash-garde" in restarted.file_processor.processed_hashes
+    assert not {"hash-alpha", "hash-beta"} & restarted.file_processor.processed_hashes
+    assert len(restarted.tombstones) > 0
+    # Le document peut être ré-ingéré et devient cherchable
+    restarted.commit_documents(prepare(restarted, ["alpha"]), filters)
+    texts = restarted.find_relevant_context("question", 1, 2, top_k=10, similarity_threshold=-1.0,
+                                            query_embedding=restarted.embed_chunks([lettered("alpha", 40)])[0])
+    assert lettered("alpha", 40) in texts
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests de concurrence entre l'ingestion (worker de jobs, asyncio.to_thread) et les recherches
+(/chat) : ajouts à l'index HNSW et recherches simultanées, sans erreur et sans résultat
+d'un autre locataire ; recherches pendant la compaction des suppressions (renumérotation des
+ID Faiss) ; exclusion mutuelle du verrou lecteurs / rédacteur.
+"""
+
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.rw_lock import ReadWriteLock
+
+
+def lettered(label, n_words):
+    # Sans chiffres : le nettoyage des textes les supprime
+    return " ".join(f"{label}{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(n_words))
+
+
+def document_label(tenant, number):
+    return f"{tenant}{chr(97 + number // 26)}{chr(97 + number % 26)}"
+
+
+class OverlapDetectingIndex:
+    """Enveloppe d'un index Faiss : compte les recherches exécutées pendant un ajout (ralenti)."""
+
+    def __init__(self, index):
+        self._index = index
+        self._adding = threading.Event()
+        self.overlaps = 0
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+    def add(self, vectors):
+        self._adding.set()
+        try:
+            time.sleep(0.02)
+            self._index.add(vectors)
+        finally:
+            self._adding.clear()
+
+    def _read(self, method, *args, **kwargs):
+        if self._adding.is_set():
+            self.overlaps += 1
+        return getattr(self._index, method)(*args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._read("search", *args, **kwargs)
+
+    def reconstruct_batch(self, *args, **kwargs):
+        return self._read("reconstruct_batch", *args, **kwargs)
+
+
+def test_writer_excludes_readers_and_waits_for_them():
+    lock, events = ReadWriteLock(), []
+    reading, release = threading.Event(), threading.Event()
+
+    def reader():
+        with lock.read():
+            events.append("lecture")
+            reading.set()
+            release.wait(5)
+        events.append("fin lecture")
+
+    def writer():
+        with lock.write():
+            with lock.write(), lock.read():  # ré-entrance du rédacteur
+                events.append("écriture")
+
+    threads = [threading.Thread(target=reader)]
+    threads[0].start()
+    assert reading.wait(5)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    time.sleep(0.1)
+    assert events == ["lecture"]  # l'écriture attend la fin de la lecture
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert events == ["lecture", "fin lecture", "écriture"]
+
+
+@pytest.mark.parametrize("use_shards", [False, True])
+def test_ingestion_concurrent_with_searches(make_chatbot, use_shards):
+    chatbot = make_chatbot(use_shards=use_shards)
+    for number in range(4):
+        chatbot.ingestion_file(f"{document_label('deux', number)}.txt",
+                               lettered(document_label("deux", number), 30).encode('utf-8'),
+                               1, 2, None, None, None, None)
+    chatbot.index = OverlapDetectingIndex(chatbot.index)
+    stop, errors, searches = threading.Event(), [], [0]
+
+    def search(seed):
+        rng = np.random.default_rng(seed)
+        try:
+            while not stop.is_set():
+                query = rng.standard_normal(chatbot.dimension).astype('float32')
+                texts = chatbot.find_relevant_context("question", 1, 2, top_k=5, similarity_threshold=-1.0,
+                                                      query_embedding=query / np.linalg.norm(query))
+                assert texts and all(text.startswith("deux") for text in texts), texts
+                searches[0] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for number in range(4, 40):
+            tenant, filiere_id = ("deux", 2) if number % 2 else ("trois", 3)
+            chatbot.ingestion_file(f"{document_label(tenant, number)}.txt",
+                                   lettered(document_label(tenant, number), 30).encode('utf-8'),
+                                   1, filiere_id, None, None, None, None)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(30)
+    assert not errors, errors[0]
+    assert searches[0] > 0
+    assert chatbot.index.overlaps == 0  # aucune recherche pendant un ajout HNSW
+    assert len(chatbot.metadata.documents) == 40 and chatbot.index.ntotal == len(chatbot.metadata)
+
+
+@pytest.mark.parametrize("use_shards", [False, True])
+def test_searches_during_compaction_see_a_consistent_state(make_chatbot, use_shards):
+    chatbot = make_chatbot(use_shards=use_shards, deletion_compaction_ratio=1.0)
+    file_hashes = []
+    for number in range(8):
+        tenant, filiere_id = ("deux", 2) if number % 2 == 0 else ("trois", 3)
+        file_hashes.append(chatbot.ingestion_file(f"{document_label(tenant, number)}.txt",
+                                                  lettered(document_label(tenant, number), 30).encode('utf-8'),
+                                                  1, filiere_id, None, None, None, None))
+    chatbot.delete_document(file_hashes[0])  # tous les ID suivants seront décalés
+    query = np.random.default_rng(0).standard_normal(chatbot.dimension).astype('float32')
+    query /= np.linalg.norm(query)
+
+    def search(filiere_id):
+        return chatbot.find_relevant_context("question", 1, filiere_id, top_k=50, similarity_threshold=-1.0,
+                                             query_embedding=query)
+
+    before = {filiere_id: sorted(search(filiere_id)) for filiere_id in (2, 3)}
+    during = []
+    write_snapshot = chatbot._write_snapshot
+
+    def write_snapshot_while_searching(index, metadata):
+        # Le snapshot renuméroté est écrit, mais pas encore publié
+        during.append({filiere_id: sorted(search(filiere_id)) for filiere_id in (2, 3)})
+        write_snapshot(index, metadata)
+
+    chatbot._write_snapshot = write_snapshot_while_searching
+    assert chatbot.compact_deleted() > 0
+    assert during == [before]
+    assert {filiere_id: sorted(search(filiere_id)) for filiere_id in (2, 3)} == before
+    assert before[2] and all("trois" not in text for text in before[2])
+    assert before[3] and all("deux" not in text for text in before[3])
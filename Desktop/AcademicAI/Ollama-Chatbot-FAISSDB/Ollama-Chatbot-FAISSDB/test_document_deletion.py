@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests de la suppression de documents : chunks orphelins (tombstones) en tenant compte des
+chunks partagés par déduplication, et renumérotation des ID Faiss à la compaction
+(ChunkStore, document_metadata, empreintes de déduplication).
+"""
+
+import os
+import sys
+import sqlite3
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.chunk_store import ChunkStore
+from Utilitaire.chunk_dedup import ChunkDedupIndex
+from Utilitaire.filter_manager import FilterManager
+
+
+def make_db(tmp_path, rows):
+    db_path = str(tmp_path / "metadata.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE document_metadata (id INTEGER PRIMARY KEY, base_filename TEXT, file_hash TEXT, "
+                 "chunk_index INTEGER, chunk_text TEXT, departement_id INTEGER, filiere_id INTEGER)")
+    conn.executemany("INSERT INTO document_metadata (base_filename, file_hash, chunk_index, chunk_text, "
+                     "departement_id, filiere_id) VALUES (?, ?, ?, ?, 1, 2)", rows)
+    conn.commit()
+    return db_path, conn
+
+
+def test_shared_chunks_are_not_orphaned(tmp_path):
+    # Le chunk 0 est partagé par A et B (déduplication)
+    _, conn = make_db(tmp_path, [("a.txt", "hA", 0, "commun"), ("a.txt", "hA", 1, "propre à A"),
+                                 ("b.txt", "hB", 0, "commun"), ("b.txt", "hB", 2, "propre à B")])
+    deleted = FilterManager.delete_document_metadata(conn, "hA")
+    assert deleted["base_filename"] == "a.txt" and deleted["chunks"] == 2
+    assert {key: ids.tolist() for key, ids in deleted["orphaned"].items()} == {(1, 2): [1]}
+    assert conn.execute("SELECT faiss_id FROM deleted_chunks").fetchall() == [(1,)]
+    assert FilterManager.delete_document_metadata(conn, "hA") is None
+
+
+def test_remap_renumbers_metadata_and_fingerprints(tmp_path):
+    db_path, conn = make_db(tmp_path, [("b.txt", "hB", 0, "un deux trois quatre"),
+                                       ("b.txt", "hB", 2, "cinq six sept huit")])
+    conn.close()
+    dedup = ChunkDedupIndex(db_path)
+    dedup.ensure_loaded()
+    conn = sqlite3.connect(db_path)
+    FilterManager.remap_chunk_indices(conn, [0, 2])
+    dedup.remap(conn, [0, 2])
+    conn.commit()
+    assert conn.execute("SELECT chunk_index FROM document_metadata ORDER BY id").fetchall() == [(0,), (1,)]
+    dedup.reset()
+    documents = [{"chunks": ["cinq six sept huit"]}]
+    dedup.plan(documents, 1, 2)
+    assert documents[0]["reuse"].tolist() == [1]
+
+
+def test_chunk_store_subset_renumbers_chunks():
+    store = ChunkStore()
+    store.append_chunks("hA", "a.txt", ["a0", "a1"], departement_id=1, filiere_id=2)
+    store.append_chunks("hB", "b.txt", ["b0é", "b1"], departement_id=3, filiere_id=None)
+    subset = store.subset([0, 2, 3])
+    assert len(subset) == 3
+    assert [subset.get_text(i) for i in range(3)] == ["a0", "b0é", "b1"]
+    assert subset.get_record(1)["original_filename"] == "b.txt"
+    assert subset.get_record(2)["filiere_id"] is None
+    assert subset.ids_for_tenant(3, None).tolist() == [1, 2]
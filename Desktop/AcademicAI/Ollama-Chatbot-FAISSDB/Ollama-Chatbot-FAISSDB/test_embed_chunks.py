@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests de l'encodage batché des chunks (RAGChatbot.embed_chunks) : taille des lots, tri par longueur
+sans changer l'ordre des résultats, progression et chunks lus depuis le cache d'embeddings.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+CHUNKS = ["court", "un chunk nettement plus long que les autres", "moyen texte", "x",
+          "encore un chunk assez long", "deux mots", "fin"]
+
+
+def record_batches(chatbot):
+    batches = []
+    encode = chatbot.embedding_model.encode
+
+    def recording_encode(texts, **kwargs):
+        batches.append(list(texts))
+        return encode(texts, **kwargs)
+
+    chatbot.embedding_model.encode = recording_encode
+    return batches
+
+
+@pytest.mark.parametrize("sort_by_length", [True, False])
+def test_batches_keep_chunk_order(make_chatbot, sort_by_length):
+    chatbot = make_chatbot(embedding_batch_size=3, embedding_sort_by_length=sort_by_length,
+                           embedding_store_dir=None)
+    expected = np.stack([chatbot.embedding_model.encode(chunk) for chunk in CHUNKS])
+    batches = record_batches(chatbot)
+    progress = []
+
+    embeddings = chatbot.embed_chunks(CHUNKS, lambda done, total: progress.append((done, total)))
+
+    assert embeddings.dtype == np.float32 and embeddings.shape == (len(CHUNKS), chatbot.dimension)
+    assert np.allclose(embeddings, expected)
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert progress == [(3, 7), (6, 7), (7, 7)]
+    if sort_by_length:
+        lengths = [len(chunk) for batch in batches for chunk in batch]
+        assert lengths == sorted(lengths, reverse=True)
+    else:
+        assert [chunk for batch in batches for chunk in batch] == CHUNKS
+
+
+def test_cached_chunks_are_not_encoded_again(make_chatbot):
+    chatbot = make_chatbot(embedding_batch_size=2)
+    first = chatbot.embed_chunks(CHUNKS[:4])
+    batches = record_batches(chatbot)
+    progress = []
+
+    embeddings = chatbot.embed_chunks(CHUNKS, lambda done, total: progress.append((done, total)))
+
+    assert sorted(chunk for batch in batches for chunk in batch) == sorted(CHUNKS[4:])
+    assert np.allclose(embeddings[:4], first, atol=1e-3)
+    assert progress[-1] == (3, 3)
+    assert chatbot.embed_chunks([]).shape == (0, chatbot.dimension)
+    batches.clear()
+    chatbot.embed_chunks(CHUNKS[:2], lambda done, total: progress.append((done, total)))
+    assert batches == [] and progress[-1] == (2, 2)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests du cache persistant des embeddings de chunks (EmbeddingStore) : relecture après
+réouverture, doublons ignorés, écriture interrompue tronquée et type de stockage float16.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.embedding_store import EmbeddingStore
+
+
+def unit_vectors(n, dimension=8, seed=0):
+    vectors = np.random.default_rng(seed).random((n, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_vectors_survive_reopen_and_duplicates_are_ignored(tmp_path):
+    vectors = unit_vectors(3)
+    store = EmbeddingStore(str(tmp_path), "modele/test", 8)
+    assert store.put_many(["a", "b", "a"], vectors) == 2
+    assert store.put_many(["b"], vectors[:1]) == 0
+    reopened = EmbeddingStore(str(tmp_path), "modele/test", 8)
+    found_vectors, found = reopened.get_many(["b", "inconnu", "a"])
+    assert found.tolist() == [True, False, True]
+    assert np.array_equal(found_vectors[0], vectors[1]) and np.array_equal(found_vectors[2], vectors[0])
+    assert not found_vectors[1].any()
+
+
+def test_interrupted_write_is_truncated(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "m", 8)
+    store.put_many(["a", "b"], unit_vectors(2))
+    with open(os.path.join(store.directory, EmbeddingStore.VECTORS_FILE), "ab") as f:
+        f.write(b"\x00" * 10)  # ligne incomplète
+    reopened = EmbeddingStore(str(tmp_path), "m", 8)
+    assert len(reopened) == 2
+    reopened.put_many(["c"], unit_vectors(1, seed=1))
+    assert np.array_equal(EmbeddingStore(str(tmp_path), "m", 8).get_many(["c"])[0], unit_vectors(1, seed=1))
+
+
+def test_float16_store_returns_float32_close_to_original(tmp_path):
+    vectors = unit_vectors(4)
+    store = EmbeddingStore(str(tmp_path), "m", 8, dtype="float16")
+    store.put_many(["a", "b", "c", "d"], vectors)
+    found_vectors, _ = store.get_many(["a", "b", "c", "d"])
+    assert found_vectors.dtype == np.float32
+    assert np.abs(found_vectors - vectors).max() < 1e-3
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests du cache des ID Faiss autorisés (AllowedIdsCache) : filtres résolus (mémoïsés) mis à
+jour après une ingestion ou une suppression du locataire, et rechargement après invalidation.
+"""
+
+import os
+import sys
+import sqlite3
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.filter_cache import AllowedIdsCache
+from Utilitaire.filter_manager import FilterManager
+
+
+def make_db(tmp_path, rows):
+    db_path = str(tmp_path / "metadata.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE document_metadata (id INTEGER PRIMARY KEY, chunk_index INTEGER, "
+                 "departement_id INTEGER, filiere_id INTEGER)")
+    conn.executemany("INSERT INTO document_metadata (chunk_index, departement_id, filiere_id) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_resolved_filters_follow_additions_and_removals(tmp_path):
+    cache = AllowedIdsCache(make_db(tmp_path, [(0, 1, 2), (1, 1, 3), (2, 4, 2)]))
+    assert cache.get(1, 2).tolist() == [0]
+    assert cache.get(1).tolist() == [0, 1]
+    assert cache.get().tolist() == [0, 1, 2]
+
+    cache.add([5, 6], 1, 2)
+    assert cache.get(1, 2).tolist() == [0, 5, 6]
+    assert cache.get(1).tolist() == [0, 1, 5, 6]
+    assert cache.get(None, 2).tolist() == [0, 2, 5, 6]
+    assert cache.get(4, 2).tolist() == [2]  # autre locataire inchangé
+
+    cache.remove([0, 6], 1, 2)
+    assert cache.get(1, 2).tolist() == [5]
+    assert cache.get().tolist() == [1, 2, 5]
+
+
+def test_invalidate_reloads_from_sqlite(tmp_path):
+    db_path = make_db(tmp_path, [(0, 1, 2)])
+    cache = AllowedIdsCache(db_path)
+    assert cache.get(1, 2).tolist() == [0]
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE document_metadata SET chunk_index = 9")
+    conn.commit()
+    conn.close()
+    assert cache.get(1, 2).tolist() == [0]  # servi depuis la mémoire
+    cache.invalidate()
+    assert cache.get(1, 2).tolist() == [9]
+
+
+def test_chatbot_ingestion_and_deletion_refresh_allowed_ids(make_chatbot):
+    chatbot = make_chatbot()
+    assert len(FilterManager.get_allowed_indices(1, 2)) == 0
+    file_hash = chatbot.ingestion_file("cours.txt", "Les graphes orientés et pondérés.".encode('utf-8'),
+                                       1, 2, None, None, None, None)
+    assert FilterManager.get_allowed_indices(1, 2).tolist() == [0]
+    assert FilterManager.get_allowed_indices(1).tolist() == [0]
+    chatbot.delete_document(file_hash)
+    assert len(FilterManager.get_allowed_indices(1, 2)) == 0
+    assert len(FilterManager.get_allowed_indices(1)) == 0
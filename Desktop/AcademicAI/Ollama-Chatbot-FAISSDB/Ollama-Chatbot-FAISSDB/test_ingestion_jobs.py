@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests de la file de jobs d'ingestion (IngestionJobQueue) : annulation d'un job en file ou en cours
+(avant le commit), et reprise au démarrage des jobs laissés « pending » ou « running ».
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.ingestion_jobs import IngestionJobQueue
+from Utilitaire.ingestion_pipeline import IngestionPipeline
+
+
+class RecordingPipeline:
+    """Pipeline factice : enregistre les fichiers reçus."""
+
+    def __init__(self):
+        self.runs = []
+
+    def run(self, files, filters, progress=None, should_cancel=None):
+        self.runs.append(files)
+        return {"indexed": [name for name, _ in files]}
+
+
+def wait_for(queue, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in IngestionJobQueue.FINAL_STATES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} non terminé : {queue.get(job_id)['status']}")
+
+
+def make_queue(tmp_path, pipeline, start=False):
+    queue = IngestionJobQueue(str(tmp_path / "jobs.db"), pipeline, payload_dir=str(tmp_path / "payloads"),
+                              poll_interval=0.05)
+    if not start:
+        queue.start = lambda: None  # soumission sans worker : le job reste en file
+    return queue
+
+
+def set_status(tmp_path, job_id, status, cancel_requested=0):
+    conn = sqlite3.connect(str(tmp_path / "jobs.db"))
+    conn.execute("UPDATE ingestion_jobs SET status = ?, cancel_requested = ? WHERE id = ?",
+                 (status, cancel_requested, job_id))
+    conn.commit()
+    conn.close()
+
+
+def test_cancel_queued_job_never_runs(tmp_path):
+    pipeline = RecordingPipeline()
+    queue = make_queue(tmp_path, pipeline)
+    job_id = queue.submit([("cours.txt", b"graphes")], {"departement_id": 1})
+    assert queue.cancel(job_id) == "cancelled"
+    assert not os.path.exists(queue._job_dir(job_id))
+
+    queue = make_queue(tmp_path, pipeline, start=True)
+    other = queue.submit([("td.txt", b"arbres")], {"departement_id": 1})
+    assert wait_for(queue, other)["status"] == "succeeded"
+    queue.stop()
+    assert pipeline.runs == [[("td.txt", b"arbres")]]
+    assert queue.get(job_id)["status"] == "cancelled"
+
+
+def test_restart_recovers_stale_jobs(tmp_path):
+    queue = make_queue(tmp_path, RecordingPipeline())
+    running = queue.submit([("a.txt", b"alpha")], {})
+    pending = queue.submit([("b.txt", b"beta")], {})
+    cancelling = queue.submit([("c.txt", b"gamma")], {})
+    # État laissé par un arrêt du serveur
+    set_status(tmp_path, running, "running")
+    set_status(tmp_path, pending, "pending")
+    set_status(tmp_path, cancelling, "running", cancel_requested=1)
+
+    pipeline = RecordingPipeline()
+    queue = make_queue(tmp_path, pipeline, start=True)
+    assert queue.get(pending)["status"] == "failed" and queue.get(pending)["error"]
+    assert queue.get(cancelling)["status"] == "cancelled"
+    assert not os.path.exists(queue._job_dir(pending))
+    assert not os.path.exists(queue._job_dir(cancelling))
+
+    queue.start()
+    assert wait_for(queue, running)["status"] == "succeeded"
+    queue.stop()
+    assert pipeline.runs == [[("a.txt", b"alpha")]]
+    assert not os.path.exists(queue._job_dir(running))
+
+
+def test_failed_payload_write_does_not_leave_pending_job(tmp_path):
+    queue = make_queue(tmp_path, RecordingPipeline())
+    (tmp_path / "payloads").write_bytes(b"")  # le répertoire des fichiers ne peut pas être créé
+    with pytest.raises(OSError):
+        queue.submit([("a.txt", b"alpha")], {})
+    assert [job["status"] for job in queue.list()] == ["failed"]
+
+
+def test_cancel_running_job_before_commit(tmp_path, make_chatbot):
+    chatbot = make_chatbot()
+    embedding_started, release = threading.Event(), threading.Event()
+    embed_chunks = chatbot.embed_chunks
+
+    def blocking_embed(chunks, on_batch=None):
+        embedding_started.set()
+        release.wait(30)
+        return embed_chunks(chunks, on_batch)
+
+    chatbot.embed_chunks = blocking_embed
+    queue = make_queue(tmp_path, IngestionPipeline(chatbot, max_workers=1), start=True)
+    job_id = queue.submit([("cours.txt", "Les graphes orientés et pondérés.".encode('utf-8'))],
+                          {"departement_id": 1, "filiere_id": 2})
+    assert embedding_started.wait(30)
+    assert queue.cancel(job_id) == "running"
+    release.set()
+    assert wait_for(queue, job_id)["status"] == "cancelled"
+    queue.stop()
+
+    assert chatbot.index.ntotal == 0
+    conn = sqlite3.connect(make_chatbot.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM document_metadata").fetchone()[0] == 0
+    conn.close()
+    assert not chatbot.file_processor.processed_hashes
+    assert not os.path.exists(queue._job_dir(job_id))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests de cohérence du journal d'ingestion (IngestionLog) après un crash :
+trame incomplète, rejeu idempotent sur un snapshot, annulation d'une trame.
+"""
+
+import os
+import sys
+import tempfile
+
+import faiss
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.chunk_store import ChunkStore
+from Utilitaire.ingestion_log import IngestionLog
+
+DIMENSION = 16
+
+
+def make_record(start_index, file_hash, chunks, departement_id=1, filiere_id=2):
+    filters = {name: None for name in ChunkStore.INT_COLUMNS}
+    filters.update(departement_id=departement_id, filiere_id=filiere_id)
+    return {
+        "start_index": start_index,
+        "file_hash": file_hash,
+        "original_filename": f"{file_hash}.txt",
+        "chunks": chunks,
+        "filters": filters,
+    }
+
+
+def ingest(index, store, log, file_hash, n_chunks, rng):
+    """Reproduit la séquence de RAGChatbot.ingestion_file : index, journal, puis ChunkStore."""
+    vectors = rng.standard_normal((n_chunks, DIMENSION)).astype('float32')
+    chunks = [f"{file_hash} chunk {i}" for i in range(n_chunks)]
+    start_index = index.ntotal
+    index.add(vectors)
+    offset = log.append(make_record(start_index, file_hash, chunks), vectors)
+    store.append_chunks(file_hash, f"{file_hash}.txt", chunks, departement_id=1, filiere_id=2)
+    return offset
+
+
+def test_replay_after_crash_restores_state():
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        log = IngestionLog(os.path.join(tmp, "ingestion.log"))
+        index, store = faiss.IndexFlatIP(DIMENSION), ChunkStore()
+        ingest(index, store, log, "a", 3, rng)
+        ingest(index, store, log, "b", 2, rng)
+
+        # Crash : seul le snapshot vide existe, le journal contient les deux ingestions.
+        recovered_index, recovered_store, hashes = faiss.IndexFlatIP(DIMENSION), ChunkStore(), set()
+        replayed = IngestionLog(log.path).replay_into(recovered_index, recovered_store, hashes)
+
+        assert replayed == 5
+        assert recovered_index.ntotal == len(recovered_store) == 5
+        assert hashes == {"a", "b"}
+        assert recovered_store.get_text(4) == "b chunk 1"
+        np.testing.assert_array_equal(recovered_index.reconstruct_n(0, 5), index.reconstruct_n(0, 5))
+
+
+def test_replay_is_idempotent_on_snapshot():
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        log = IngestionLog(os.path.join(tmp, "ingestion.log"))
+        index, store = faiss.IndexFlatIP(DIMENSION), ChunkStore()
+        ingest(index, store, log, "a", 3, rng)
+
+        # Crash après le snapshot mais avant le vidage du journal : rien ne doit être dupliqué.
+        replayed = IngestionLog(log.path).replay_into(index, store, set())
+        assert replayed == 0
+        assert index.ntotal == len(store) == 3
+
+
+def test_torn_tail_is_ignored_and_truncated():
+    rng = np.random.default_rng(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        log = IngestionLog(os.path.join(tmp, "ingestion.log"))
+        index, store = faiss.IndexFlatIP(DIMENSION), ChunkStore()
+        ingest(index, store, log, "a", 3, rng)
+        ingest(index, store, log, "b", 2, rng)
+        complete_size = log.size_bytes()
+        ingest(index, store, log, "c", 4, rng)
+
+        # Crash pendant l'écriture de la troisième trame.
+        with open(log.path, "r+b") as f:
+            f.truncate(complete_size + IngestionLog.HEADER.size + 10)
+
+        recovered_index, recovered_store, hashes = faiss.IndexFlatIP(DIMENSION), ChunkStore(), set()
+        recovered_log = IngestionLog(log.path)
+        replayed = recovered_log.replay_into(recovered_index, recovered_store, hashes)
+
+        assert replayed == 5
+        assert hashes == {"a", "b"}
+        assert recovered_log.size_bytes() == complete_size
+
+        # Les ajouts suivants restent lisibles après la troncature.
+        ingest(recovered_index, recovered_store, recovered_log, "d", 1, rng)
+        assert [record["file_hash"] for record, _ in IngestionLog(log.path).read()] == ["a", "b", "d"]
+
+
+def test_truncate_cancels_last_frame():
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        log = IngestionLog(os.path.join(tmp, "ingestion.log"))
+        index, store = faiss.IndexFlatIP(DIMENSION), ChunkStore()
+        ingest(index, store, log, "a", 3, rng)
+        offset = ingest(index, store, log, "b", 2, rng)
+
+        # Échec du commit SQLite : la trame de "b" est retirée du journal.
+        log.truncate(offset)
+        assert log.vector_count == 3
+
+        hashes = set()
+        IngestionLog(log.path).replay_into(faiss.IndexFlatIP(DIMENSION), ChunkStore(), hashes)
+        assert hashes == {"a"}
+
+
+if __name__ == "__main__":
+    for test in (
+        test_replay_after_crash_restores_state,
+        test_replay_is_idempotent_on_snapshot,
+        test_torn_tail_is_ignored_and_truncated,
+        test_truncate_cancels_last_frame,
+    ):
+        test()
+        print(f"{test.__name__} : OK")
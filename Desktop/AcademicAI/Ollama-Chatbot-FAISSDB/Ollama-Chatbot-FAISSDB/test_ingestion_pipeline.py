@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests de l'ingestion par lot (IngestionPipeline) : dépliage des archives zip, fichiers ignorés
+(doublons, déjà indexés, vides), un seul passage d'embedding, progression par étape, annulation
+avant le commit, chunks identiques à une extraction fichier par fichier et fichier validé
+par une ingestion concurrente pendant le lot.
+"""
+
+import io
+import os
+import sys
+import sqlite3
+import zipfile
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.ingestion_pipeline import IngestionPipeline, IngestionCancelled
+from Utilitaire.file_processor import AlreadyProcessedError
+
+FILTERS = {"departement_id": 1, "filiere_id": 2}
+
+
+def lettered(label, n_words):
+    # Sans chiffres : le nettoyage des textes les supprime
+    return " ".join(f"{label}{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(n_words))
+
+
+def zip_bytes(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def stored_chunks(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT base_filename, chunk_text FROM document_metadata ORDER BY base_filename, chunk_index").fetchall()
+    conn.close()
+    return rows
+
+
+def test_expand_uploads_unpacks_zip_archives():
+    archive = zip_bytes([("cours/graphes.txt", "graphes"), ("cours/", ""), ("__MACOSX/cours/._graphes.txt", "x"),
+                         ("cours/.cache.txt", "x"), ("cours/outil.exe", "x"), ("td.json", "{}")])
+    documents, skipped = IngestionPipeline.expand_uploads(
+        [("lot.zip", archive), ("notes.txt", b"notes"), ("image.png", b"x"), ("casse.zip", b"pas un zip")]
+    )
+    assert documents == [("graphes.txt", b"graphes"), ("td.json", b"{}"), ("notes.txt", b"notes")]
+    assert [entry["file"] for entry in skipped] == ["lot.zip/cours/outil.exe", "image.png", "casse.zip"]
+    assert skipped[-1]["reason"].startswith("archive invalide")
+
+
+def test_batch_skips_duplicates_and_embeds_once(make_chatbot):
+    chatbot = make_chatbot()
+    chatbot.ingestion_file("ancien.txt", lettered("ancien", 20).encode('utf-8'), 1, 2, None, None, None, None)
+    pipeline = IngestionPipeline(chatbot, max_workers=1)
+    encode_calls = []
+    encode = chatbot.embedding_model.encode
+    chatbot.embedding_model.encode = lambda texts, **kwargs: encode_calls.append(len(texts)) or encode(texts, **kwargs)
+    stages = []
+
+    report = pipeline.run(
+        [("lot.zip", zip_bytes([("alpha.txt", lettered("alpha", 20)), ("beta.txt", lettered("beta", 20))])),
+         ("copie.txt", lettered("alpha", 20).encode('utf-8')),
+         ("ancien.txt", lettered("ancien", 20).encode('utf-8')),
+         ("vide.txt", b"   "),
+         ("gamma.txt", lettered("gamma", 20).encode('utf-8'))],
+        FILTERS, progress=lambda stage, fraction: stages.append(stage)
+    )
+
+    assert [entry["file"] for entry in report["indexed"]] == ["alpha.txt", "beta.txt", "gamma.txt"]
+    reasons = {entry["file"]: entry["reason"] for entry in report["skipped"]}
+    assert reasons["copie.txt"] == "déjà traité" and reasons["ancien.txt"] == "déjà traité"
+    assert reasons["vide.txt"] == "aucun contenu exploitable"
+    assert encode_calls == [3]  # un seul passage d'embedding pour tout le lot
+    assert stages.index("extraction") < stages.index("embedding") < stages.index("commit")
+    assert set(report["timings"]) == {"extraction_s", "embedding_s", "commit_s"}
+    assert chatbot.index.ntotal == 4
+
+
+def test_batch_matches_file_by_file_extraction(make_chatbot):
+    files = [(f"{label}.txt", lettered(label, 300).encode('utf-8')) for label in ["alpha", "beta", "gamma"]]
+    chatbot = make_chatbot()
+    IngestionPipeline(chatbot, max_workers=1).run(files, FILTERS)
+
+    expected_chunks = [chatbot.file_processor.extract_chunks(name, content)[0] for name, content in files]
+    assert all(len(chunks) > 1 for chunks in expected_chunks)  # plusieurs chunks par fichier
+    expected = [(name, chunk) for (name, _), chunks in zip(files, expected_chunks) for chunk in chunks]
+    assert stored_chunks(make_chatbot.db_path) == expected
+    texts = [chatbot.metadata.get_text(i) for i in range(chatbot.index.ntotal)]
+    assert sorted(texts) == sorted(chunk for _, chunk in expected)
+    assert np.allclose(chatbot.index.reconstruct_n(0, chatbot.index.ntotal),
+                       chatbot.embedding_model.encode(texts), atol=1e-5)
+
+
+def test_cancel_before_commit_indexes_nothing(make_chatbot):
+    chatbot = make_chatbot()
+    stages = []
+
+    def should_cancel():
+        return stages[-1:] == ["embedding"]
+
+    with pytest.raises(IngestionCancelled):
+        IngestionPipeline(chatbot, max_workers=1).run(
+            [("alpha.txt", lettered("alpha", 20).encode('utf-8'))], FILTERS,
+            progress=lambda stage, fraction: stages.append(stage), should_cancel=should_cancel
+        )
+    assert chatbot.index.ntotal == 0 and stored_chunks(make_chatbot.db_path) == []
+    assert not chatbot.file_processor.processed_hashes
+
+
+def test_file_committed_concurrently_is_skipped(make_chatbot):
+    chatbot = make_chatbot()
+    files = [(f"{label}.txt", lettered(label, 20).encode('utf-8')) for label in ["alpha", "beta", "gamma"]]
+    encode_calls = []
+    encode = chatbot.embedding_model.encode
+
+    def encode_during_concurrent_upload(texts, **kwargs):
+        encode_calls.append(len(texts))
+        if len(encode_calls) == 1:
+            # Un autre envoi valide beta.txt après l'extraction du lot, avant son commit
+            chatbot.embedding_model.encode = encode
+            chatbot.ingestion_file("beta.txt", files[1][1], 1, 2, None, None, None, None)
+            chatbot.embedding_model.encode = encode_during_concurrent_upload
+        return encode(texts, **kwargs)
+
+    chatbot.embedding_model.encode = encode_during_concurrent_upload
+    report = IngestionPipeline(chatbot, max_workers=1).run(files, FILTERS)
+
+    assert [entry["file"] for entry in report["indexed"]] == ["alpha.txt", "gamma.txt"]
+    assert [(entry["file"], entry["reason"]) for entry in report["skipped"]] == [("beta.txt", "déjà traité")]
+    assert encode_calls == [3]  # alpha et gamma ne sont pas ré-encodés à la reprise
+    assert [name for name, _ in stored_chunks(make_chatbot.db_path)] == ["alpha.txt", "beta.txt", "gamma.txt"]
+    assert chatbot.index.ntotal == len(chatbot.metadata) == 3
+
+
+def test_commit_rejects_documents_already_processed(make_chatbot):
+    chatbot = make_chatbot()
+    chatbot.ingestion_file("alpha.txt", lettered("alpha", 20).encode('utf-8'), 1, 2, None, None, None, None)
+    document = {"base_filename": "alpha.txt", "file_hash": next(iter(chatbot.file_processor.processed_hashes)),
+                "chunks": [lettered("alpha", 20)]}
+    chatbot.plan_deduplication([document], 1, 2)
+    document["embeddings"] = chatbot.embed_chunks(document["to_encode"])
+    with pytest.raises(AlreadyProcessedError):
+        chatbot.commit_documents([document], FILTERS)
+    assert chatbot.index.ntotal == 1 and len(stored_chunks(make_chatbot.db_path)) == 1
+    assert document["file_hash"] in chatbot.file_processor.processed_hashes
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests de l'index lexical BM25 (LexicalIndex) : requête nettoyée comme les chunks indexés,
+filtre département/filière, fusion RRF et seuil de similarité propre aux résultats lexicaux.
+"""
+
+import os
+import sys
+import sqlite3
+
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.EDA_Cleaner import FastTextPipeline
+from Utilitaire.lexical_index import LexicalIndex
+
+
+def make_db(tmp_path, texts):
+    pipeline = FastTextPipeline.shared()
+    db_path = str(tmp_path / "metadata.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE document_metadata (id INTEGER PRIMARY KEY, chunk_index INTEGER, chunk_text TEXT, "
+                 "departement_id INTEGER, filiere_id INTEGER)")
+    conn.executemany("INSERT INTO document_metadata (chunk_index, chunk_text, departement_id, filiere_id) "
+                     "VALUES (?, ?, ?, ?)",
+                     [(i, pipeline.process(text), dep, fil) for i, (text, dep, fil) in enumerate(texts)])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_query_is_cleaned_like_indexed_chunks(tmp_path):
+    db_path = make_db(tmp_path, [("Le module INF301 traite des graphes.", 1, 2),
+                                 ("Planning du semestre et des examens.", 1, 2)])
+    index = LexicalIndex(db_path, normalize=FastTextPipeline.shared().process)
+    ids, scores = index.search("Quel est le contenu du module INF301 ?")
+    assert ids.tolist() == [0] and scores[0] > 0
+    # Sans nettoyage, « inf301 » ne correspond à aucun token indexé (chiffres supprimés)
+    assert LexicalIndex(db_path).search("INF301")[0].tolist() == []
+
+
+def test_search_is_limited_to_tenant(tmp_path):
+    db_path = make_db(tmp_path, [("graphes orientés", 1, 2), ("graphes pondérés", 1, 3)])
+    index = LexicalIndex(db_path, normalize=FastTextPipeline.shared().process)
+    assert index.search("graphes", 1, 3)[0].tolist() == [1]
+    assert sorted(index.search("graphes", 1)[0].tolist()) == [0, 1]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = LexicalIndex.reciprocal_rank_fusion([[5, 7, 9], [9, 8]], k=60)
+    assert fused.tolist()[0] == 9
+    assert set(fused.tolist()) == {5, 7, 8, 9}
+
+
+def query_with_similarity(chunk, similarity):
+    other = np.random.default_rng(0).standard_normal(chunk.shape[0]).astype('float32')
+    other -= (other @ chunk) * chunk
+    return similarity * chunk + np.sqrt(1 - similarity ** 2) * other / np.linalg.norm(other)
+
+
+def test_lexical_hits_use_their_own_similarity_floor(make_chatbot):
+    chatbot = make_chatbot(use_hybrid_search=True, hybrid_min_similarity=0.3)
+    chatbot.ingestion_file("graphes.txt", "Le module traite des graphes orientés.".encode('utf-8'),
+                           1, 2, None, None, None, None)
+    chunk = chatbot.index.reconstruct(0)
+    # Sous le seuil dense de build_prompt (0.65), mais retrouvé par BM25 : le résultat lexical est gardé
+    assert chatbot.find_relevant_context("graphes", 1, 2, similarity_threshold=0.65,
+                                         query_embedding=query_with_similarity(chunk, 0.4)) \
+        == [chatbot.metadata.get_text(0)]
+    # Sans correspondance lexicale, le seuil dense s'applique seul
+    assert chatbot.find_relevant_context("arbres", 1, 2, similarity_threshold=0.65,
+                                         query_embedding=query_with_similarity(chunk, 0.4)) is None
+    # Trop loin de la question : même un résultat lexical est écarté
+    assert chatbot.find_relevant_context("graphes", 1, 2, similarity_threshold=0.65,
+                                         query_embedding=query_with_similarity(chunk, 0.2)) is None
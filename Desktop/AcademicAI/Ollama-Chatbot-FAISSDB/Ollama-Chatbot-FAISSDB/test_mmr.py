@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests du MMR vectorisé (MMR.select, MMR.select_batch) : mêmes indices, dans le même ordre,
+que l'ancienne boucle Python de RAGChatbot.mmr, y compris en cas d'égalité, pour k > n
+et pour lambda = 0 ou 1.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.mmr import MMR
+from benchmarks.bench_mmr import legacy_mmr, normalized
+
+
+@pytest.mark.parametrize("lambda_param", [0.0, 0.3, 0.5, 1.0])
+@pytest.mark.parametrize("n, k", [(1, 3), (5, 3), (20, 5), (20, 20), (4, 10)])
+def test_select_matches_reference_loop(n, k, lambda_param):
+    rng = np.random.default_rng(n * 100 + k)
+    for _ in range(20):
+        query, candidates = normalized(rng, (64,)), normalized(rng, (n, 64))
+        expected = legacy_mmr(query, candidates, k=k, lambda_param=lambda_param)
+        assert MMR.select(query, candidates, k=k, lambda_param=lambda_param) == expected
+        assert len(expected) == min(k, n)
+
+
+@pytest.mark.parametrize("lambda_param", [0.0, 0.5, 1.0])
+def test_ties_select_the_first_index(lambda_param):
+    # Valeurs exactes en float32 : doublons et candidats équidistants de la requête
+    query = np.array([1, 0, 0, 0], dtype='float32')
+    candidates = np.array([[0, 1, 0, 0], [1, 0, 0, 0], [0, 0, 1, 0], [1, 0, 0, 0],
+                           [0, 0, 0, 1], [0, 1, 0, 0]], dtype='float32')
+    expected = legacy_mmr(query, candidates, k=6, lambda_param=lambda_param)
+    assert MMR.select(query, candidates, k=6, lambda_param=lambda_param) == expected
+    assert MMR.select_batch(query[np.newaxis], candidates[np.newaxis], k=6, lambda_param=lambda_param) == [expected]
+    assert expected[0] == 1
+
+
+def test_empty_candidates():
+    query = np.ones(4, dtype='float32')
+    assert MMR.select(query, np.empty((0, 4), dtype='float32')) == []
+    assert MMR.select_batch(np.ones((2, 4), dtype='float32'), np.empty((2, 0, 4), dtype='float32')) == [[], []]
+
+
+@pytest.mark.parametrize("lambda_param", [0.0, 0.5, 1.0])
+def test_select_batch_matches_reference_loop(lambda_param):
+    rng = np.random.default_rng(7)
+    counts = [0, 1, 3, 8, 15, 15]
+    queries = normalized(rng, (len(counts), 32))
+    candidates = [normalized(rng, (count, 32)) for count in counts]
+    for k in (1, 4, 20):
+        expected = [legacy_mmr(q, c, k=k, lambda_param=lambda_param) if len(c) else []
+                    for q, c in zip(queries, candidates)]
+        # Liste de tableaux de tailles différentes
+        assert MMR.select_batch(queries, candidates, k=k, lambda_param=lambda_param) == expected
+        # Tableau complété (padding) avec le nombre de candidats valides
+        padded = np.zeros((len(counts), max(counts), 32), dtype='float32')
+        for i, c in enumerate(candidates):
+            padded[i, :len(c)] = c
+        assert MMR.select_batch(queries, padded, k=k, lambda_param=lambda_param,
+                                candidate_counts=np.array(counts)) == expected
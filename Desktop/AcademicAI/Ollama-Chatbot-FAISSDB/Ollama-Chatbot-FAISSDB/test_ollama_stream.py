@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests du streaming asynchrone vers Ollama (OllamaAPI.astream_chat, OllamaHttpPool.apost_stream)
+sur un transport httpx simulé : tokens NDJSON, statut de fin, erreurs HTTP ou réseau en cours de flux,
+concurrence bornée et métriques du pool.
+"""
+
+import os
+import sys
+import json
+import asyncio
+
+import httpx
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("langchain_groq")
+import ollama_api
+from ollama_api import OllamaAPI, OllamaHttpPool, OllamaBusyError
+
+
+class FakeGroq:
+    """LLM en ligne scripté : émet `tokens` puis lève `error` (None : fin normale)."""
+
+    def __init__(self, tokens=(), error=RuntimeError("Groq indisponible")):
+        self.tokens = tokens
+        self.error = error
+
+    async def astream(self, prompt):
+        for token in self.tokens:
+            yield type("Chunk", (), {"content": token})()
+        if self.error is not None:
+            raise self.error
+
+
+def ndjson(*tokens, done=True):
+    lines = [json.dumps({"response": token, "done": False}) for token in tokens]
+    if done:
+        lines.append(json.dumps({"response": "", "done": True}))
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def make_api(monkeypatch, handler, groq=None, **pool_options):
+    monkeypatch.setattr(ollama_api, "ChatGroq", lambda **kwargs: groq or FakeGroq())
+    pool = OllamaHttpPool(**pool_options)
+    api = OllamaAPI(api_url="http://ollama.test/api/generate", pool=pool)
+
+    def install_transport():
+        # Client créé dans la boucle du test, comme _get_async_client le fait dans celle du serveur
+        pool._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        pool._async_semaphore = asyncio.Semaphore(pool.max_concurrency)
+
+    api.install_transport = install_transport
+    return api
+
+
+def collect(api, **kwargs):
+    async def run():
+        api.install_transport()
+        status = {}
+        tokens = [token async for token in api.astream_chat("question", status=status, **kwargs)]
+        await api.aclose()
+        return tokens, status
+    return asyncio.run(run())
+
+
+def test_ollama_fallback_streams_tokens_until_done(monkeypatch):
+    payloads = []
+
+    def handler(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, content=ndjson("Bon", "jour", " !") + ndjson("ignoré"))
+
+    api = make_api(monkeypatch, handler)
+    tokens, status = collect(api, model="gemma3:4b", stop=["</s>"])
+    assert tokens == ["Bon", "jour", " !"]
+    assert status == {"complete": True}
+    assert payloads[0]["prompt"] == "question" and payloads[0]["stop"] == ["</s>"]
+    metrics = api.pool_metrics()
+    assert metrics["requests"] == 1 and metrics["errors"] == 0 and metrics["in_flight"] == 0
+
+
+def test_groq_stream_is_used_first(monkeypatch):
+    def handler(request):
+        raise AssertionError("Ollama ne doit pas être appelé")
+
+    api = make_api(monkeypatch, handler, groq=FakeGroq(["Réponse", " en ligne"], error=None))
+    assert collect(api) == (["Réponse", " en ligne"], {"complete": True})
+
+
+def test_groq_error_after_tokens_is_not_retried_on_ollama(monkeypatch):
+    def handler(request):
+        raise AssertionError("Ollama ne doit pas être appelé")
+
+    api = make_api(monkeypatch, handler, groq=FakeGroq(["Début"], error=RuntimeError("coupure")))
+    tokens, status = collect(api)
+    assert tokens == ["Début", "\nError: coupure"]
+    assert status == {"complete": False}
+
+
+def test_http_error_status_is_emitted_as_text(monkeypatch):
+    api = make_api(monkeypatch, lambda request: httpx.Response(500, content=b"model not found"))
+    tokens, status = collect(api)
+    assert tokens == ["Error: 500 - model not found"]
+    assert status == {"complete": False}
+
+
+def test_stream_interrupted_before_done_is_incomplete(monkeypatch):
+    async def body():
+        yield ndjson("Début", done=False)
+        raise httpx.ReadError("connexion perdue")
+
+    api = make_api(monkeypatch, lambda request: httpx.Response(200, content=body()))
+    tokens, status = collect(api)
+    assert tokens[0] == "Début" and tokens[-1].startswith("Error:")
+    assert status == {"complete": False}
+    metrics = api.pool_metrics()
+    assert metrics["errors"] == 1 and metrics["in_flight"] == 0
+
+    # Flux terminé sans ligne « done » : réponse tronquée, jamais marquée complète
+    api = make_api(monkeypatch, lambda request: httpx.Response(200, content=ndjson("Début", done=False)))
+    assert collect(api) == (["Début"], {"complete": False})
+
+
+def test_connection_error_is_recorded(monkeypatch):
+    def handler(request):
+        raise httpx.ConnectTimeout("délai de connexion dépassé")
+
+    api = make_api(monkeypatch, handler)
+    tokens, status = collect(api)
+    assert len(tokens) == 1 and tokens[0].startswith("Error:")
+    assert status == {"complete": False}
+    metrics = api.pool_metrics()
+    assert metrics["errors"] == 1 and metrics["timeouts"] == 1
+
+
+def test_concurrency_limit_rejects_after_acquire_timeout():
+    async def run():
+        opened, done = asyncio.Event(), asyncio.Event()
+
+        async def body():
+            opened.set()
+            await done.wait()
+            yield ndjson("fin")
+
+        pool = OllamaHttpPool(max_concurrency=1, acquire_timeout=0.05)
+        pool._async_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        )
+        pool._async_semaphore = asyncio.Semaphore(1)
+
+        async def first():
+            async with pool.apost_stream("http://ollama.test/api/generate", {}) as response:
+                return await response.aread()
+
+        task = asyncio.create_task(first())
+        await opened.wait()
+        with pytest.raises(OllamaBusyError):
+            async with pool.apost_stream("http://ollama.test/api/generate", {}):
+                pass
+        done.set()
+        await task
+        await pool.aclose()
+        return pool.metrics()
+
+    metrics = asyncio.run(run())
+    assert metrics["rejected"] == 1 and metrics["requests"] == 1
+    assert metrics["max_in_flight"] == 1 and metrics["in_flight"] == 0 and metrics["waiting"] == 0
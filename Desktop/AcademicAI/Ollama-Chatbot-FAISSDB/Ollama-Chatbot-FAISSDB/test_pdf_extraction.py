@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Tests de l'extraction PDF parallèle (iter_pdf_pages) : même texte, page par page, que
+l'extraction en série, y compris avec des extractions simultanées de tailles de pool différentes.
+"""
+
+import os
+import sys
+import threading
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.pdf_extraction import iter_pdf_pages
+from benchmarks.bench_pdf_extraction import synthetic_pdf
+
+PDF = synthetic_pdf(40, lines_per_page=10)
+
+
+def test_parallel_extraction_matches_serial():
+    serial = list(iter_pdf_pages(PDF, workers=1))
+    assert len(serial) == 40 and all(serial)
+    assert list(iter_pdf_pages(PDF, workers=2, parallel_min_pages=8, pages_per_task=3)) == serial
+
+
+def test_concurrent_extractions_with_different_pool_sizes():
+    serial = list(iter_pdf_pages(PDF, workers=1))
+    results, errors = {}, []
+
+    def extract(workers):
+        try:
+            results[workers] = list(iter_pdf_pages(PDF, workers=workers, parallel_min_pages=8, pages_per_task=2))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=extract, args=(workers,)) for workers in (2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(120)
+    assert not errors, errors[0]
+    assert results == {2: serial, 3: serial}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests du cache des embeddings de requêtes (QueryEmbeddingCache) : clé normalisée, éviction LRU,
+persistance SQLite par modèle et utilisation par RAGChatbot.embed_query.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.embedding_cache import QueryEmbeddingCache
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return np.full(4, len(self.calls), dtype='float32')
+
+
+def test_variants_of_a_query_share_one_embedding():
+    cache, encode = QueryEmbeddingCache("modele"), CountingEncoder()
+    first = cache.get_or_compute("  Qu'est-ce qu'un   GRAPHE ?", encode)
+    second = cache.get_or_compute("qu'est-ce qu'un graphe ?\n", encode)
+    assert encode.calls == ["qu'est-ce qu'un graphe ?"]
+    assert second is first and first.dtype == np.float32
+    with pytest.raises(ValueError):
+        first[0] = 0.0
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache, encode = QueryEmbeddingCache("modele", max_entries=2), CountingEncoder()
+    for text in ["a", "b", "a", "c"]:  # « b » est le moins récemment utilisé quand « c » arrive
+        cache.get_or_compute(text, encode)
+    cache.get_or_compute("a", encode)
+    cache.get_or_compute("b", encode)
+    assert encode.calls == ["a", "b", "c", "b"]
+    assert cache.stats()["entries"] == 2
+
+
+def test_disk_cache_survives_restart_per_model(tmp_path):
+    disk_path = str(tmp_path / "cache" / "queries.db")
+    encode = CountingEncoder()
+    expected = QueryEmbeddingCache("modele", disk_path=disk_path).get_or_compute("graphe", encode)
+
+    restarted = QueryEmbeddingCache("modele", disk_path=disk_path)
+    assert np.array_equal(restarted.get_or_compute("Graphe", encode), expected)
+    assert encode.calls == ["graphe"] and restarted.stats()["disk_hits"] == 1
+
+    QueryEmbeddingCache("autre-modele", disk_path=disk_path).get_or_compute("graphe", encode)
+    assert encode.calls == ["graphe", "graphe"]  # un autre modèle ne réutilise pas l'embedding
+
+    restarted.clear()
+    QueryEmbeddingCache("modele", disk_path=disk_path).get_or_compute("graphe", encode)
+    assert len(encode.calls) == 3
+
+
+def test_chatbot_encodes_each_normalized_query_once(make_chatbot):
+    chatbot = make_chatbot(query_cache_path=None)
+    before = chatbot.embedding_model.encoded
+    first = chatbot.embed_query("Algorithme de Dijkstra")
+    assert np.array_equal(chatbot.embed_query("algorithme  de dijkstra"), first)
+    assert chatbot.embedding_model.encoded == before + 1
+    assert np.isclose(np.linalg.norm(first), 1.0)
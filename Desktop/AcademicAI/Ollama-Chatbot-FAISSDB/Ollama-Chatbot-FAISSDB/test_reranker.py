@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests du reranking par cross-encoder (CrossEncoderReranker), avec un faux CrossEncoder :
+budget de latence suivant la moyenne glissante du coût par paire, une seule passe batchée,
+et repli sur l'ordre dense dans find_relevant_context si le modèle ne charge pas ou échoue.
+"""
+
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire import reranker as reranker_module
+from Utilitaire.reranker import CrossEncoderReranker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+class FakeCrossEncoder:
+    """Score = -rang, dans `preferred`, du premier préfixe du texte (le plus tôt, le meilleur)."""
+
+    def __init__(self, clock=None, ms_per_pair=1.0, preferred=()):
+        self.clock = clock
+        self.ms_per_pair = ms_per_pair
+        self.preferred = list(preferred)
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=True):
+        self.calls.append((len(pairs), batch_size))
+        if self.clock is not None:
+            self.clock.now += self.ms_per_pair * len(pairs) / 1000.0
+        return [-self.rank(text) for _, text in pairs]
+
+    def rank(self, text):
+        return next((i for i, word in enumerate(self.preferred) if text.startswith(word)), len(self.preferred))
+
+
+def fake_sentence_transformers(monkeypatch, cross_encoder):
+    module = types.ModuleType("sentence_transformers")
+    module.CrossEncoder = cross_encoder
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+
+
+def test_budgeted_size_follows_moving_average(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(reranker_module, "time", clock)
+    model = FakeCrossEncoder(clock, ms_per_pair=10.0)
+    fake_sentence_transformers(monkeypatch, lambda *args, **kwargs: model)
+    reranker = CrossEncoderReranker(latency_budget_ms=100.0, max_candidates=50, min_candidates=5, smoothing=0.5)
+    texts = [f"texte {i}" for i in range(40)]
+
+    assert reranker.budgeted_size(40) == 40  # aucune mesure : seul max_candidates limite
+    reranker.rerank("question", texts, 3)
+    assert model.calls == [(40, 40)]  # une seule passe batchée sur tout le pool
+    assert reranker.ms_per_pair == pytest.approx(10.0)
+    assert reranker.budgeted_size(40) == 10  # 100 ms / 10 ms par paire
+
+    model.ms_per_pair = 2.0
+    order, _ = reranker.rerank("question", texts, 3)
+    assert model.calls[-1] == (10, 10) and reranker.last_reranked == 10
+    assert reranker.ms_per_pair == pytest.approx(6.0)  # 0.5 * 10 + 0.5 * 2
+    assert reranker.budgeted_size(40) == 16
+    assert order.max() < 10  # les candidats hors budget ne sont pas retournés
+
+    model.ms_per_pair = 1000.0
+    reranker.rerank("question", texts, 3)
+    assert reranker.budgeted_size(40) == 5  # jamais sous min_candidates
+    assert reranker.budgeted_size(3) == 3
+
+
+def test_rerank_orders_by_cross_encoder_scores(monkeypatch):
+    model = FakeCrossEncoder(preferred=["gamma", "alpha"])
+    fake_sentence_transformers(monkeypatch, lambda *args, **kwargs: model)
+    reranker = CrossEncoderReranker()
+    order, scores = reranker.rerank("question", ["alpha un", "beta deux", "gamma trois", "delta quatre"], 3)
+    assert order.tolist() == [2, 0, 1]  # égalité beta / delta : ordre dense conservé
+    assert scores.tolist() == [0.0, -1.0, -2.0]
+    assert len(model.calls) == 1
+
+
+def lettered(label, n_words):
+    return " ".join(f"{label}{chr(97 + i // 26)}{chr(97 + i % 26)}" for i in range(n_words))
+
+
+LABELS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta"]
+
+
+@pytest.fixture
+def reranking_chatbot(make_chatbot):
+    chatbot = make_chatbot(use_reranker=True)
+    for label in LABELS:
+        chatbot.ingestion_file(f"{label}.txt", lettered(label, 8).encode('utf-8'), 1, 2, None, None, None, None)
+    return chatbot
+
+
+def search(chatbot, **kwargs):
+    query = chatbot.embed_chunks([lettered("alpha", 8)])[0]
+    return chatbot.find_relevant_context("question", 1, 2, top_k=3, similarity_threshold=-1.0,
+                                         query_embedding=query, **kwargs)
+
+
+def first_words(texts):
+    return [text[:len(text.split()[0]) - 2] for text in texts]
+
+
+def test_find_relevant_context_reranks_the_pool(reranking_chatbot):
+    model = FakeCrossEncoder(preferred=["zeta", "delta", "beta"])
+    reranking_chatbot.reranker._model = model
+    assert first_words(search(reranking_chatbot)) == ["zeta", "delta", "beta"]
+    assert model.calls == [(len(LABELS), len(LABELS))]  # tout le pool, en un appel
+    # Sans reranking : ordre dense, le document de la requête en tête
+    dense = search(reranking_chatbot, use_rerank=False)
+    assert first_words(dense)[0] == "alpha" and len(model.calls) == 1
+
+
+def test_find_relevant_context_falls_back_to_dense_order(reranking_chatbot, monkeypatch):
+    dense = search(reranking_chatbot, use_rerank=False)
+
+    def failing_model(*args, **kwargs):
+        raise OSError("modèle introuvable")
+
+    fake_sentence_transformers(monkeypatch, failing_model)
+    assert search(reranking_chatbot) == dense  # échec du chargement
+
+    class RaisingCrossEncoder(FakeCrossEncoder):
+        def predict(self, pairs, **kwargs):
+            raise RuntimeError("inférence impossible")
+
+    reranking_chatbot.reranker._model = RaisingCrossEncoder()
+    assert search(reranking_chatbot) == dense  # échec de l'inférence
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests du cache sémantique des réponses : invalidation limitée au locataire, nombres de la
+question dans la clé, réponses streamées incomplètes jamais mises en cache.
+"""
+
+import os
+import sys
+import asyncio
+
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.semantic_cache import SemanticCache
+
+
+class FakeStreamingLLM:
+    """Flux de tokens scripté ; `complete` est le statut de fin transmis à l'appelant."""
+
+    def __init__(self, tokens, complete):
+        self.tokens = tokens
+        self.complete = complete
+
+    async def astream_chat(self, prompt, status=None):
+        for token in self.tokens:
+            yield token
+        if status is not None:
+            status["complete"] = self.complete
+
+
+def unit(seed, dimension=8):
+    vector = np.random.default_rng(seed).random(dimension).astype('float32')
+    return vector / np.linalg.norm(vector)
+
+
+def test_generation_is_scoped_to_tenant():
+    cache = SemanticCache()
+    before = cache.generation(1, 2)
+    cache.invalidate_tenant(1, 3)  # autre filière : sans effet
+    cache.store(unit(0), 1, 2, "standard", "réponse", generation=before)
+    assert cache.lookup(unit(0), 1, 2, "standard") == "réponse"
+
+    before = cache.generation(1, None)  # couvre toutes les filières du département 1
+    cache.invalidate_tenant(1, 3)
+    cache.store(unit(1), 1, None, "standard", "périmée", generation=before)
+    assert cache.lookup(unit(1), 1, None, "standard") is None
+
+
+def stream(chatbot, question):
+    async def collect():
+        return [event async for event in chatbot.generate_response_stream(question, 7, 1, 1, 2)]
+    return asyncio.run(collect())
+
+
+def test_partial_stream_is_not_cached(make_chatbot):
+    chatbot = make_chatbot(use_response_cache=True)
+    chatbot.ollama_api = FakeStreamingLLM(["Début", "\nError: coupure"], complete=False)
+    stream(chatbot, "Génère 5 QCM sur les graphes")
+    assert chatbot.response_cache.stats()["entries"] == 0
+
+    chatbot.ollama_api = FakeStreamingLLM(["Voici ", "5 QCM"], complete=True)
+    stream(chatbot, "Génère 5 QCM sur les graphes")
+    assert chatbot.response_cache.stats()["entries"] == 1
+    # Même question au nombre près : pas de réponse partagée
+    chatbot.ollama_api = FakeStreamingLLM(["Voici ", "10 QCM"], complete=True)
+    events = stream(chatbot, "Génère 10 QCM sur les graphes")
+    assert events[-1]["response"] == "Voici 10 QCM"
+    events = stream(chatbot, "Génère 5 QCM sur les graphes")
+    assert events[-1]["response"] == "Voici 5 QCM"
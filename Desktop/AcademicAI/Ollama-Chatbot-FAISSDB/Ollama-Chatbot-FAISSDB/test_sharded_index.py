@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests des partitions Faiss par locataire (ShardedIndex) : une recherche routée vers les partitions
+du filtre retourne les mêmes ID globaux qu'une recherche exhaustive restreinte au locataire,
+y compris après éviction LRU et rattrapage d'une partition non sauvegardée ; les clés des
+partitions sont tenues en mémoire (pas de lecture du répertoire à chaque recherche).
+"""
+
+import os
+import sys
+
+import faiss
+import numpy as np
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.sharded_index import ShardedIndex
+
+DIMENSION = 16
+TENANTS = [(1, 1), (1, 2), (2, 1), (None, 3)]
+
+
+def make_global_index(count, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIMENSION)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = faiss.IndexFlatIP(DIMENSION)
+    index.add(vectors)
+    keys = [TENANTS[i] for i in rng.integers(0, len(TENANTS), count)]
+    return index, vectors, keys
+
+
+def make_shards(tmp_path, index, keys, max_loaded_shards=16):
+    shards = ShardedIndex(str(tmp_path / "shards"), DIMENSION, m=16, ef_search=200,
+                          max_loaded_shards=max_loaded_shards)
+    shards.set_source(lambda: index, lambda key: [i for i, k in enumerate(keys) if k == key])
+    return shards
+
+
+def brute_force(vectors, keys, query, k, departement_id=None, filiere_id=None):
+    allowed = np.array([i for i, (dep, fil) in enumerate(keys)
+                        if (departement_id is None or dep == departement_id)
+                        and (filiere_id is None or fil == filiere_id)], dtype='int64')
+    scores = vectors[allowed] @ query
+    return allowed[np.argsort(-scores, kind='stable')[:k]]
+
+
+def queries(count, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        query = rng.standard_normal(DIMENSION).astype('float32')
+        yield query / np.linalg.norm(query)
+
+
+def test_routed_search_matches_global_index(tmp_path):
+    index, vectors, keys = make_global_index(400)
+    shards = make_shards(tmp_path, index, keys)
+    shards.rebuild(index, keys)
+    assert shards.known_keys() == set(TENANTS)
+    for query in queries(5):
+        for departement_id, filiere_id in [(1, 2), (1, None), (None, 1), (None, None)]:
+            scores, ids = shards.search(query, 10, departement_id, filiere_id)
+            assert ids.tolist() == brute_force(vectors, keys, query, 10, departement_id, filiere_id).tolist()
+            assert np.allclose(scores, vectors[ids] @ query, atol=1e-5)
+    assert len(shards.search(next(queries(1)), 10, 9, 9)[1]) == 0  # locataire sans partition
+
+
+def test_evicted_and_stale_shards_are_reloaded(tmp_path):
+    index, vectors, keys = make_global_index(300)
+    shards = make_shards(tmp_path, index, keys[:200], max_loaded_shards=1)
+    shards.rebuild(index, keys[:200])
+
+    # Ajouts à l'index principal jamais sauvegardés dans les partitions (arrêt brutal)
+    shards = make_shards(tmp_path, index, keys, max_loaded_shards=1)
+    for query in queries(3):
+        _, ids = shards.search(query, 10)
+        assert ids.tolist() == brute_force(vectors, keys, query, 10).tolist()
+    assert len(shards._shards) == 1  # les autres partitions ont été évincées (et sauvegardées)
+    shards.save_dirty()
+
+    reloaded = ShardedIndex(str(tmp_path / "shards"), DIMENSION, m=16, ef_search=200)
+    for key in TENANTS:
+        assert sorted(faiss.vector_to_array(reloaded.get_shard(key).id_map).tolist()) == \
+            [i for i, k in enumerate(keys) if k == key]
+
+
+def test_shard_keys_are_listed_once(tmp_path, monkeypatch):
+    index, vectors, keys = make_global_index(200)
+    make_shards(tmp_path, index, keys).rebuild(index, keys)
+    listdir_calls = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listdir_calls.append(path) or listdir(path))
+
+    shards = make_shards(tmp_path, index, keys)
+    for query in queries(5):
+        shards.search(query, 10, 1, None)
+    assert len(listdir_calls) == 1 and shards.known_keys() == set(TENANTS)
+    shards.add((3, 3), vectors[:1], [0])  # nouvelle partition
+    assert (3, 3) in shards.known_keys() and (3, 3) in shards.keys_matching(3, None)
+    shards.reset()
+    assert shards.known_keys() == set() and not shards.search(next(queries(1)), 10)[1].size
+    shards.rebuild(index, keys)
+    assert shards.known_keys() == set(TENANTS) and len(listdir_calls) == 1
+
+
+def test_add_ignores_ids_already_caught_up(tmp_path):
+    index, vectors, keys = make_global_index(50)
+    shards = make_shards(tmp_path, index, keys)
+    key = TENANTS[0]
+    ids = [i for i, k in enumerate(keys) if k == key]
+    shards.add(key, vectors[ids], ids)  # partition créée : rattrapée, puis ajout sans doublon
+    assert shards.get_shard(key).ntotal == len(ids)
+
+
+def test_chatbot_sharded_search_matches_filtered_search(make_chatbot):
+    chatbot = make_chatbot()
+    hashes = {}
+    for name, departement_id, filiere_id in [("graphes", 1, 2), ("arbres", 1, 2), ("piles", 1, 3), ("files", 2, 2)]:
+        text = f"Cours sur les {name} : définitions, propriétés et algorithmes classiques des {name}."
+        hashes[name] = chatbot.ingestion_file(f"{name}.txt", text.encode('utf-8'),
+                                              departement_id, filiere_id, None, None, None, None)
+    chatbot.delete_document(hashes["arbres"])
+
+    sharded = make_chatbot(use_shards=True)  # partitions construites depuis l'index principal
+    for query in ["algorithmes des graphes", "propriétés des piles", "files"]:
+        for departement_id, filiere_id in [(1, 2), (1, None), (None, 2), (None, None)]:
+            expected = chatbot.find_relevant_context(query, departement_id, filiere_id, top_k=3,
+                                                     similarity_threshold=-1.0)
+            assert sharded.find_relevant_context(query, departement_id, filiere_id, top_k=3,
+                                                 similarity_threshold=-1.0) == expected
+            assert not any("arbres" in text for text in expected)  # document supprimé
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests d'équivalence du traitement en flux de FileProcessor : StreamingChunker produit
+les mêmes chunks que split_into_chunks, et StrippedContentHash le même hash que
+calculate_hash sur le texte complet, quel que soit le découpage en segments ; le nettoyage
+en flux donne le même texte que le nettoyage du contenu complet, y compris quand un token
+supprimé (emoji) se trouve au bord d'un segment.
+"""
+
+import os
+import sys
+import random
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.file_processor import FileProcessor, StreamingChunker, StrippedContentHash
+from Utilitaire.EDA_Cleaner import FastTextPipeline
+
+WORDS = ["graphe", "arbre", "le", "des", "😊", "✅🎉", "données", "«", "»", "cannot", "42", "!", "x😊"]
+
+
+def random_segments(rng, text, max_length):
+    segments, start = [], 0
+    while start < len(text):
+        end = start + rng.randint(0, max_length)
+        segments.append(text[start:end])
+        start = end
+    return segments
+
+
+def test_streaming_chunker_matches_split_into_chunks():
+    rng = random.Random(0)
+    for _ in range(300):
+        text = "".join(rng.choice("ab é \n") for _ in range(rng.randint(0, 400)))
+        chunk_size = rng.randint(2, 40)
+        chunk_overlap = rng.randint(0, chunk_size - 1)
+        chunker = StreamingChunker(chunk_size, chunk_overlap)
+        chunks = []
+        for segment in random_segments(rng, text, 60):
+            chunks.extend(chunker.feed(segment))
+        chunks.extend(chunker.close())
+        assert chunks == FileProcessor(chunk_size, chunk_overlap).split_into_chunks(text)
+
+
+def test_stripped_content_hash_matches_full_text_hash():
+    rng = random.Random(1)
+    processor = FileProcessor()
+    for _ in range(300):
+        text = "".join(rng.choice("xy \n\t") for _ in range(rng.randint(0, 200)))
+        content_hash = StrippedContentHash()
+        for segment in random_segments(rng, text, 20):
+            content_hash.update(segment)
+        assert content_hash.empty == (not text.strip())
+        if text.strip():
+            assert content_hash.hexdigest() == processor.calculate_hash(text.strip())
+
+
+def test_txt_segments_end_on_line_boundaries():
+    processor = FileProcessor()
+    processor.TEXT_BLOCK_SIZE = 7
+    text = "première ligne\ndeuxième ligne accentuée\n\ntroisième"
+    segments = list(processor.iter_content_from_bytes("a.txt", text.encode("utf-8")))
+    assert "".join(segments) == text
+    assert all(segment.endswith("\n") for segment in segments[:-1])
+
+
+def random_lines(rng):
+    return "".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 6))) + rng.choice(["\n", " \n", "\n\n"])
+        for _ in range(rng.randint(0, 12))
+    )
+
+
+def test_process_stream_matches_full_text_cleaning():
+    rng = random.Random(2)
+    pipeline = FastTextPipeline.shared()
+    for _ in range(500):
+        lines = random_lines(rng).splitlines(keepends=True)
+        segments, start = [], 0
+        while start < len(lines):  # segments coupés sur un saut de ligne, comme iter_content_from_bytes
+            end = start + rng.randint(1, 3)
+            segments.append("".join(lines[start:end]))
+            start = end
+        assert "".join(pipeline.process_stream(segments)) == pipeline.process("".join(segments))
+
+
+def test_extract_chunks_matches_full_text_cleaning():
+    rng = random.Random(3)
+    pipeline = FastTextPipeline.shared()
+    for _ in range(500):
+        processor = FileProcessor(chunk_size=rng.randint(5, 40), chunk_overlap=rng.randint(0, 4))
+        processor.TEXT_BLOCK_SIZE = rng.randint(4, 30)
+        content = random_lines(rng).encode("utf-8")
+        expected = processor.split_into_chunks(pipeline.process(processor.read_content_from_bytes("a.txt", content)))
+        chunks, _ = processor.extract_chunks("a.txt", content)
+        assert (chunks or []) == expected
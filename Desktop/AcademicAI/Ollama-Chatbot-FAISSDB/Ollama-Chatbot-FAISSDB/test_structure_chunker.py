@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests du découpage « structure » (StructureChunker) : limite en tokens, phrases jamais
+coupées, frontières de paragraphes, recouvrement et suppression des doublons.
+Les tokens sont comptés par mots pour ne pas dépendre du tokenizer du modèle.
+"""
+
+import os
+import sys
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.chunker import StructureChunker
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def sentence(label, n_words):
+    return " ".join(f"{label}{i}" for i in range(n_words))
+
+
+def chunk_blocks(chunker, blocks):
+    chunks = []
+    for block in blocks:
+        chunks.extend(chunker.add_block(block))
+    return chunks + chunker.close()
+
+
+def test_chunks_respect_token_limit_and_sentences():
+    sentences = [sentence(f"s{k}x", 7) for k in range(20)]
+    chunker = StructureChunker(count_words, max_tokens=20, min_tokens=5, drop_duplicates=False)
+    chunks = chunk_blocks(chunker, [sentences])
+    assert all(len(chunk.split()) <= 20 for chunk in chunks)
+    assert " ".join(chunks) == " ".join(sentences)
+    # Chaque chunk contient des phrases entières (2 phrases de 7 mots)
+    assert all(len(chunk.split()) % 7 == 0 for chunk in chunks)
+
+
+def test_long_sentence_is_split_evenly():
+    chunker = StructureChunker(count_words, max_tokens=10, min_tokens=2, drop_duplicates=False)
+    chunks = chunk_blocks(chunker, [[sentence("a", 25)]])
+    assert [len(chunk.split()) for chunk in chunks] == [9, 9, 7]
+
+
+def test_paragraph_boundary_starts_new_chunk_once_min_tokens_reached():
+    chunker = StructureChunker(count_words, max_tokens=50, min_tokens=5, drop_duplicates=False)
+    title, body, next_body = sentence("t", 2), sentence("b", 6), sentence("n", 6)
+    chunks = chunk_blocks(chunker, [[title], [body], [next_body]])
+    # Le titre (sous min_tokens) est fusionné avec le paragraphe suivant
+    assert chunks == [f"{title} {body}", next_body]
+
+
+def test_overlap_repeats_last_sentences():
+    chunker = StructureChunker(count_words, max_tokens=10, min_tokens=2, overlap_tokens=4, drop_duplicates=False)
+    first, second, third = sentence("a", 4), sentence("b", 4), sentence("c", 4)
+    chunks = chunk_blocks(chunker, [[first, second, third]])
+    assert chunks == [f"{first} {second}", f"{second} {third}"]
+
+
+def test_exact_and_near_duplicates_are_dropped():
+    base = sentence("w", 40)
+    near = base.replace("w39", "autre")
+    chunker = StructureChunker(count_words, max_tokens=50, min_tokens=5)
+    chunks = chunk_blocks(chunker, [[base], [base], [near], [sentence("z", 40)]])
+    assert chunks == [base, sentence("z", 40)]
+    assert chunker.exact_duplicates == 1 and chunker.near_duplicates == 1
+
+
+def test_split_structure_keeps_wrapped_lines_and_splits_bullets():
+    segment = ("Objectifs du module :\n- analyser un algorithme\n- écrire un programme\n\n"
+               "Le cours présente les\nstructures de données. Les TD suivent.")
+    assert StructureChunker.split_structure(segment) == [
+        ["Objectifs du module :", "- analyser un algorithme", "- écrire un programme"],
+        ["Le cours présente les\nstructures de données.", "Les TD suivent."],
+    ]
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test golden du nettoyage à l'ingestion : FastTextPipeline doit produire exactement
+la sortie de TextPipeline(TextCleaner()) (NLTK), sur Faq.txt, sur un échantillon
+annoté et sur des textes aléatoires (ponctuation, chiffres, guillemets Unicode,
+contractions, emojis), y compris en nettoyage parallèle par blocs.
+"""
+
+import os
+import sys
+import random
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.EDA_Cleaner import FastTextPipeline, TextPipeline, TextCleaner
+
+FAQ_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Faq.txt")
+# sha256 de la sortie du pipeline NLTK sur Faq.txt (stop words NLTK français + anglais)
+FAQ_GOLDEN_SHA256 = "0fbf793676fa41cc1269bc1d84507a5d21b7f0127f9008b92395e235ec07b3a7"
+
+SAMPLE = ("Le « cours » d'Algorithmique 2024 — TD n°3 : Cannot wanna go… "
+          "L’étudiant doit rendre 12 exercices 😊 avant le 15/06 !")
+SAMPLE_GOLDEN = "« cours » dalgorithmique — td n° wan na go… ’ étudiant doit rendre exercices  avant"
+
+ALPHABET = list("abcdeéèàçôûABCÉ   \n\t.,;:!?'\"-()[]{}<>/\\|@#$%^&*_+=~`0123456789"
+                "«»“”‘’„‒–—―…°€£¹²٣😀👍🏽✅©®‼️‍ ")
+WORDS = ["cannot", "Cannot", "gonna", "wanna", "gotta", "lemme", "gimme", "d'ye", "more'n", "'tis",
+         "le", "la", "the", "and", "n't", "can't", "l'étudiant", "aujourd'hui", "--", "...", "données"]
+
+
+def random_text(rng):
+    parts = []
+    for _ in range(rng.randint(0, 40)):
+        if rng.random() < 0.4:
+            parts.append(rng.choice(WORDS))
+        else:
+            parts.append("".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 6))))
+    return "".join(part + rng.choice([" ", "", "\n"]) for part in parts)
+
+
+def test_faq_matches_golden_output():
+    with open(FAQ_PATH, encoding="utf-8") as f:
+        faq = f.read()
+    fast = FastTextPipeline.shared()
+    assert not fast.uses_fallback
+    cleaned = fast.process(faq)
+    assert cleaned == TextPipeline(TextCleaner()).process(faq)
+    assert hashlib.sha256(cleaned.encode("utf-8")).hexdigest() == FAQ_GOLDEN_SHA256
+
+
+def test_sample_matches_golden_output():
+    assert FastTextPipeline.shared().process(SAMPLE) == SAMPLE_GOLDEN
+    assert TextPipeline(TextCleaner()).process(SAMPLE) == SAMPLE_GOLDEN
+
+
+def test_random_texts_match_nltk_pipeline():
+    rng = random.Random(0)
+    fast, reference = FastTextPipeline.shared(), TextPipeline(TextCleaner())
+    for _ in range(1000):
+        text = random_text(rng)
+        assert fast.process(text) == reference.process(text), repr(text)
+
+
+def test_parallel_blocks_match_single_pass():
+    rng = random.Random(1)
+    fast = FastTextPipeline.shared()
+    text = " ".join(random_text(rng) for _ in range(300))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for block_chars in (7, 64, 1000):
+            assert fast.process_parallel(text, executor, block_chars=block_chars) == fast.process(text)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests de la recherche filtrée (VectorSearch) : chemin exact (peu d'IDs autorisés) et parcours
+HNSW avec IDSelectorBitmap et efSearch adaptatif, comparés à une recherche exhaustive.
+"""
+
+import os
+import sys
+
+import faiss
+import numpy as np
+import pytest
+
+# Ajouter le répertoire parent au path pour les imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Utilitaire.vector_search import VectorSearch
+
+
+@pytest.fixture(scope="module")
+def hnsw_index():
+    vectors = np.random.default_rng(0).standard_normal((3000, 16)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = faiss.IndexHNSWFlat(16, 16, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 80
+    index.add(vectors)
+    return index, vectors
+
+
+def brute_force(vectors, query, allowed_ids, k):
+    scores = vectors[allowed_ids] @ query
+    return allowed_ids[np.argsort(-scores, kind='stable')[:k]]
+
+
+def queries(count, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        query = rng.standard_normal(16).astype('float32')
+        yield query / np.linalg.norm(query)
+
+
+def test_exact_path_matches_brute_force(hnsw_index):
+    index, vectors = hnsw_index
+    allowed = np.arange(0, 3000, 7, dtype='int64')
+    for query in queries(5):
+        scores, ids = VectorSearch.search_filtered(index, query, allowed, 10)
+        assert ids.tolist() == brute_force(vectors, query, allowed, 10).tolist()
+        assert np.all(np.diff(scores) <= 0)
+    # IDs hors index ignorés, k borné par le nombre d'IDs autorisés
+    _, ids = VectorSearch.search_filtered(index, next(queries(1)), [5, 12, 999999, -1], 10)
+    assert sorted(ids.tolist()) == [5, 12]
+
+
+@pytest.mark.parametrize("step", [1, 10])
+def test_bitmap_path_returns_only_allowed_ids(hnsw_index, monkeypatch, step):
+    index, vectors = hnsw_index
+    monkeypatch.setattr(VectorSearch, "EXACT_SEARCH_MAX_IDS", 0)  # forcer le parcours HNSW filtré
+    allowed = np.arange(0, 3000, step, dtype='int64')
+    found = expected = 0
+    for query in queries(10):
+        _, ids = VectorSearch.search_filtered(index, query, allowed, 10, ef_search=64)
+        assert np.isin(ids, allowed).all() and len(ids) == 10
+        found += len(np.intersect1d(ids, brute_force(vectors, query, allowed, 10)))
+        expected += 10
+    assert found / expected >= 0.95
+
+
+def test_adaptive_ef_search_grows_with_selectivity():
+    assert VectorSearch.adaptive_ef_search(100, 10, 1000, 1000) == 100
+    assert VectorSearch.adaptive_ef_search(100, 10, 100, 1000) == 1000
+    assert VectorSearch.adaptive_ef_search(100, 10, 1, 1000000) == VectorSearch.MAX_EF_SEARCH